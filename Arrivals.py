@@ -0,0 +1,260 @@
+"""
+Customer arrival sources, selected by the "arrivals" key of a scenario:
+    {"type": "interval"}                            # Default: CUSTOMER_INTERVAL +- 1 second between arrivals
+    {"type": "trace", "path": "calls.csv"}          # Replay of a call log, CSV or binary (see below)
+    {"type": "nhpp", "rates": [[0, 0.05], [32400, 0.4], [64800, 0.1]], "period": 86400}
+The trace sources replay the arrival times, and optionally the customer ids and known outcomes, of a call log:
+    CSV:            header with a "time" column (seconds, or ISO 8601 timestamps), optional "customer_id" and
+                    "outcome" ("handled", "unregistered") columns, one call per line in time order
+    binary:         header (magic, format version, number of records) followed by TRACE_DTYPE records, written
+                    by `python Arrivals.py convert calls.csv calls.arv`
+Times are relative to the first call of the trace, unless the source sets "origin" (same unit as the trace).
+Traces are streamed: CSV files line by line, binary files memory mapped and read by chunks, so they never
+have to fit in memory.
+The "nhpp" source is a non-homogeneous Poisson process whose rate (arrivals per second) is interpolated linearly
+between the [time, rate] points, repeated every "period" seconds when set.
+Every source stops at NUM_OF_CUSTOMERS arrivals (0: until SIM_TIME).
+"""
+
+import os
+import csv
+import math
+import bisect
+import struct
+import argparse
+from datetime import datetime
+import numpy as np
+import SimUtils
+
+MAGIC = b"EWSARRIV"
+VERSION = 1
+HEADER = struct.Struct("<8sIQ")
+
+TRACE_DTYPE = np.dtype([
+    ("time", "<f8"),
+    ("customer_id", "<i8"),
+    ("outcome", "u1"),              # Index in OUTCOMES
+])
+
+OUTCOMES = ("", "handled", "unregistered")     # Outcomes of a call, "" when unknown
+CHUNK_SIZE = 65536                  # Records read from a binary trace at once
+
+
+def interval_arrivals(customer_interval:int):
+    """
+    Yields the (time, customer id, outcome) of arrivals spaced by customer_interval +- 1 seconds
+    """
+    time, i = 0, 0
+    while True:
+        time += SimUtils.rng.randint("customer_arrival", customer_interval - 1, customer_interval + 1, i)
+        i += 1
+        yield time, i, ""
+
+
+def _parse_time(value:str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def csv_trace_records(path:str):
+    """
+    Yields the (time, customer id, outcome) of the calls of a CSV trace, in file units
+    """
+    with open(path, newline='') as f:
+        reader = csv.reader(f, skipinitialspace=True)
+        columns = [column.strip() for column in next(reader)]
+        if "time" not in columns:
+            raise ValueError(f"{path}: no 'time' column")
+        time_index = columns.index("time")
+        id_index = columns.index("customer_id") if "customer_id" in columns else None
+        outcome_index = columns.index("outcome") if "outcome" in columns else None
+
+        for i, row in enumerate(reader, 1):
+            if not row:
+                continue
+            customer_id = int(row[id_index]) if id_index is not None else i
+            outcome = row[outcome_index].strip() if outcome_index is not None else ""
+            if outcome not in OUTCOMES:
+                raise ValueError(f"{path}:{i + 1}: unknown outcome '{outcome}'")
+            yield _parse_time(row[time_index]), customer_id, outcome
+
+
+def binary_trace_records(path:str):
+    """
+    Yields the (time, customer id, outcome) of the calls of a binary trace, in file units
+    """
+    with open(path, 'rb') as f:
+        magic, version, count = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path}: not a version {VERSION} arrivals trace")
+    if count == 0:
+        return
+
+    records = np.memmap(path, dtype=TRACE_DTYPE, mode='r', offset=HEADER.size, shape=(count,))
+    for start in range(0, count, CHUNK_SIZE):
+        chunk = records[start:start + CHUNK_SIZE]
+        for time, customer_id, outcome in zip(chunk["time"].tolist(), chunk["customer_id"].tolist(),
+                                              chunk["outcome"].tolist()):
+            yield time, customer_id, OUTCOMES[outcome]
+
+
+def trace_records(path:str):
+    with open(path, 'rb') as f:
+        is_binary = f.read(len(MAGIC)) == MAGIC
+    return binary_trace_records(path) if is_binary else csv_trace_records(path)
+
+
+def trace_arrivals(path:str, origin:float =None):
+    """
+    Yields the (time, customer id, outcome) of the calls of a trace, relative to origin (default: first call)
+    """
+    previous = None
+    for time, customer_id, outcome in trace_records(path):
+        if origin is None:
+            origin = time
+        if previous is not None and time < previous:
+            raise ValueError(f"{path}: calls are not in time order (customer {customer_id})")
+        previous = time
+        yield time - origin, customer_id, outcome
+
+
+class RateFunction:
+    """
+    Arrival rate interpolated linearly between [time, rate] points, constant beyond them or periodic
+    """
+
+    def __init__(self, points:list, period:float =None):
+        """
+        Constructor
+        """
+        points = sorted(points)
+        self.times = [time for time, _ in points]
+        self.rates = [rate for _, rate in points]
+        self.period = period
+        if self.period:
+            # Close the cycle so the rate is continuous at the period boundary
+            self.times.append(self.times[0] + self.period)
+            self.rates.append(self.rates[0])
+        self.max_rate = max(self.rates)
+
+    def __call__(self, time:float) -> float:
+        if self.period:
+            time = self.times[0] + (time - self.times[0]) % self.period
+        index = bisect.bisect_right(self.times, time)
+        if index == 0:
+            return self.rates[0]
+        if index == len(self.times):
+            return self.rates[-1]
+        t0, t1 = self.times[index - 1], self.times[index]
+        r0, r1 = self.rates[index - 1], self.rates[index]
+        return r0 + (r1 - r0) * (time - t0) / (t1 - t0)
+
+
+def nhpp_arrivals(rates:list, period:float =None):
+    """
+    Yields the (time, customer id, outcome) of the arrivals of a non-homogeneous Poisson process, generated by
+    thinning a homogeneous process at the maximum rate
+    """
+    rate = RateFunction(rates, period)
+    if rate.max_rate <= 0:
+        raise ValueError("Non-homogeneous Poisson arrivals need a positive rate")
+
+    time, i = 0.0, 0
+    while True:
+        time += -math.log(1.0 - SimUtils.rng.random("customer_arrival")) / rate.max_rate
+        if SimUtils.rng.random("customer_arrival.thinning") * rate.max_rate <= rate(time):
+            i += 1
+            yield time, i, ""
+
+
+def create_arrivals(source:dict, customer_interval:int):
+    """
+    Returns the (time, customer id, outcome) generator of a scenario's arrivals source
+    """
+    source = source or {"type": "interval"}
+    kind = source.get("type", "interval")
+    if kind == "interval":
+        return interval_arrivals(source.get("customer_interval", customer_interval))
+    if kind == "trace":
+        return trace_arrivals(source["path"], source.get("origin", None))
+    if kind == "nhpp":
+        return nhpp_arrivals(source["rates"], source.get("period", None))
+    raise ValueError(f"Unknown arrivals type '{kind}'")
+
+
+def source_identity(source:dict) -> dict:
+    """
+    Returns what identifies the content of an arrivals source, for the result cache: the size and modification
+    time of a trace file, rather than a hash of a possibly huge file
+    """
+    if not source or source.get("type", "interval") != "trace":
+        return {}
+    status = os.stat(source["path"])
+    return {"trace_size": status.st_size, "trace_mtime": status.st_mtime_ns}
+
+
+class OutcomeCheck:
+    """
+    Agreement of the simulated outcomes with the outcomes known from a trace
+    """
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self.known = 0
+        self.matched = 0
+
+    def check(self, expected:str, event):
+        self.known += 1
+        self.matched += event.value == expected
+
+    def summary(self) -> dict:
+        if not self.known:
+            return {}
+        return {
+            "arrivals.known_outcomes": self.known,
+            "arrivals.matched_outcomes": self.matched,
+        }
+
+
+def convert(csv_path:str, binary_path:str) -> int:
+    """
+    Converts a CSV trace to the binary format, returns the number of calls
+    """
+    buffer = np.zeros(CHUNK_SIZE, dtype=TRACE_DTYPE)
+    buffered, count = 0, 0
+    outcome_codes = {outcome: code for code, outcome in enumerate(OUTCOMES)}
+
+    with open(binary_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0))
+        for time, customer_id, outcome in csv_trace_records(csv_path):
+            buffer[buffered] = (time, customer_id, outcome_codes[outcome])
+            buffered += 1
+            if buffered == CHUNK_SIZE:
+                f.write(buffer.tobytes())
+                count += buffered
+                buffered = 0
+        f.write(buffer[:buffered].tobytes())
+        count += buffered
+
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, count))
+    return count
+
+
+if __name__ == '__main__':
+    """
+    Converts a CSV trace to the binary format
+    """
+    parser = argparse.ArgumentParser(description="Arrival traces")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser("convert", help="Convert a CSV trace to the binary format")
+    convert_parser.add_argument("csv_trace")
+    convert_parser.add_argument("binary_trace")
+    args = parser.parse_args()
+
+    _count = convert(args.csv_trace, args.binary_trace)
+    print(f"Converted {_count} calls to {args.binary_trace}")
@@ -0,0 +1,237 @@
+"""
+Compressed columnar store of the run artifacts (cfg.ARTIFACT_FORMAT "store" or "both", --artifacts).
+Instead of the queue_size_tracking.log/.csv, activity_time_log.csv and resource_*.csv text files of a run, the
+queue changes, runtimes and resource histories of the full tracking mode are appended as one compressed NPZ
+blob to a single pack file in cfg.ARTIFACT_STORE_DIR:
+    artifacts.pack:     the blobs of all the runs, one after another
+    index.jsonl:        one line per run: run id (its log path), group, scenario, resolved parameters, seed,
+                        blob offset and size, summary statistics
+Any run is read back by seeking to its blob, without scanning directories, and exported to the CSV layout:
+    python ArtifactStore.py list
+    python ArtifactStore.py export "../Test Cases/<timestamp>/<group>/TC1_baseline_scenario"
+    python ArtifactStore.py export --all
+Runs of the streaming tracking mode have no history, they keep writing their small statistics files.
+Event logs, alarms and profiles are still written to the run's folder.
+"""
+
+import io
+import os
+import json
+import argparse
+import types
+from array import array
+import numpy as np
+import cfg
+import SimUtils
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None                # Not on Windows, writers must not run concurrently
+
+PACK_FILE = "artifacts.pack"
+INDEX_FILE = "index.jsonl"
+LOCK_FILE = "store.lock"
+
+
+def run_id(log_path:str) -> str:
+    return os.path.normpath(log_path).replace(os.sep, "/")
+
+
+def tracker_columns(tracker) -> tuple:
+    """
+    Returns the columns of the history of a QueueSizeTracker, and the description of its resources
+    """
+    runtime_activities = list(tracker.activities_runtime_history.keys())
+    runtimes = [runtime for activity_id in runtime_activities for runtime in tracker.activities_runtime_history[activity_id]]
+    columns = {
+        "activity_names": np.array(SimUtils.activity_names, dtype=str),
+        "queue_times": np.frombuffer(tracker.change_times, dtype=np.float64),
+        "queue_is_int_time": np.frombuffer(tracker.change_is_int_time, dtype=np.int8),
+        "queue_activities": np.frombuffer(tracker.change_activities, dtype=np.uint16),
+        "queue_deltas": np.frombuffer(tracker.change_deltas, dtype=np.int8),
+        "runtime_activities": np.array(runtime_activities, dtype=np.uint16),
+        "runtime_counts": np.array([len(tracker.activities_runtime_history[activity_id]) for activity_id in runtime_activities],
+                                   dtype=np.int64),
+        "runtimes": np.array(runtimes, dtype=np.float64),
+        "runtime_is_int": np.array([isinstance(runtime, int) for runtime in runtimes], dtype=np.int8),
+    }
+
+    resources = []
+    for i, resource in enumerate(tracker.resources):
+        resources.append({"name": resource.name, "capacity": resource.capacity, "requests": resource.waits.count,
+                          "keep_history": resource.keep_history, "summary": resource.summary()})
+        if resource.keep_history:
+            columns[f"resource_{i}_times"] = np.frombuffer(resource.change_times, dtype=np.float64)
+            columns[f"resource_{i}_queue_lengths"] = np.frombuffer(resource.change_queue_lengths, dtype=np.uint32)
+            columns[f"resource_{i}_users"] = np.frombuffer(resource.change_users, dtype=np.uint32)
+            columns[f"resource_{i}_waits"] = np.frombuffer(resource.wait_history, dtype=np.float64)
+    return columns, resources
+
+
+class StoredResource:
+    """
+    Monitored resource of a stored run, written to the CSV layout by MonitoredResource.save_to_folder
+    """
+
+    save_to_folder = SimUtils.MonitoredResource.save_to_folder
+
+    def __init__(self, description:dict, columns:dict, index:int):
+        """
+        Constructor
+        """
+        self.name = description["name"]
+        self.capacity = description["capacity"]
+        self.waits = types.SimpleNamespace(count=description["requests"])
+        self.keep_history = description["keep_history"]
+        self._summary = description["summary"]
+        if self.keep_history:
+            self.change_times = columns[f"resource_{index}_times"].tolist()
+            self.change_queue_lengths = columns[f"resource_{index}_queue_lengths"].tolist()
+            self.change_users = columns[f"resource_{index}_users"].tolist()
+            self.wait_history = columns[f"resource_{index}_waits"].tolist()
+
+    def summary(self) -> dict:
+        return self._summary
+
+
+def restore_tracker(columns:dict, resources:list):
+    """
+    Returns a QueueSizeTracker holding the history of a stored run
+    """
+    activity_ids = [SimUtils.register_activity(name) for name in columns["activity_names"].tolist()]
+    tracker = SimUtils.QueueSizeTracker()
+    ids = np.array(activity_ids, dtype=np.uint16)
+
+    tracker.change_times = array('d', columns["queue_times"].tobytes())
+    tracker.change_is_int_time = array('b', columns["queue_is_int_time"].tobytes())
+    tracker.change_activities = array('H', ids[columns["queue_activities"]].tobytes() if len(ids) else b"")
+    tracker.change_deltas = array('b', columns["queue_deltas"].tobytes())
+    tracker.activities_in_queue = [0] * len(SimUtils.activity_names)
+
+    runtimes = [int(runtime) if is_int else runtime
+                for runtime, is_int in zip(columns["runtimes"].tolist(), columns["runtime_is_int"].tolist())]
+    start = 0
+    for activity, count in zip(columns["runtime_activities"].tolist(), columns["runtime_counts"].tolist()):
+        tracker.activities_runtime_history[activity_ids[activity]] = runtimes[start:start + count]
+        start += count
+
+    tracker.resources = [StoredResource(description, columns, i) for i, description in enumerate(resources)]
+    return tracker
+
+
+class ArtifactStore:
+    """
+    Pack file of the compressed run artifacts and its index
+    """
+
+    def __init__(self, path:str =None):
+        """
+        Constructor
+        """
+        self.path = path or cfg.ARTIFACT_STORE_DIR
+        self.pack_path = os.path.join(self.path, PACK_FILE)
+        self.index_path = os.path.join(self.path, INDEX_FILE)
+
+    def put(self, entry:dict, columns:dict) -> dict:
+        """
+        Appends the columns of a run to the pack and its entry (with the blob's offset and size) to the index
+        """
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **columns)
+        blob = buffer.getvalue()
+
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, LOCK_FILE), 'a') as lock:
+            # Worker processes of a run share the store, appends are serialized
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            with open(self.pack_path, 'ab') as f:
+                offset = f.tell()
+                f.write(blob)
+            entry = dict(entry, offset=offset, size=len(blob))
+            with open(self.index_path, 'at') as f:
+                f.write(json.dumps(entry) + "\n")
+        return entry
+
+    def index(self) -> dict:
+        """
+        Returns the index entries by run id, the last stored run of a run id wins
+        """
+        entries = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    entries[entry["run_id"]] = entry
+        return entries
+
+    def get(self, entry:dict) -> dict:
+        """
+        Returns the columns of an indexed run
+        """
+        with open(self.pack_path, 'rb') as f:
+            f.seek(entry["offset"])
+            blob = f.read(entry["size"])
+        with np.load(io.BytesIO(blob)) as columns:
+            return dict(columns)
+
+    def export(self, entry:dict, path:str =None) -> str:
+        """
+        Writes the CSV layout of an indexed run to path (default: the run's log path), returns the path
+        """
+        path = path or entry["run_id"]
+        os.makedirs(path, exist_ok=True)
+        restore_tracker(self.get(entry), entry["resources"]).save_to_folder(path, verbose=False)
+        return path
+
+
+def store_run(tc_group:str, log_path:str, scenario:dict, tracker, summary:dict, store:ArtifactStore =None) -> dict:
+    """
+    Stores the history of a run and returns its index entry
+    """
+    columns, resources = tracker_columns(tracker)
+    entry = {
+        "run_id": run_id(log_path),
+        "group": tc_group,
+        "scenario": scenario,
+        "parameters": cfg.resolve_scenario(scenario),
+        "seed": scenario["random_seed"],
+        "resources": resources,
+        "summary": summary,
+    }
+    entry = (store or ArtifactStore()).put(entry, columns)
+    print(f"Stored artifacts of {entry['run_id']} ({entry['size']} bytes)")
+    return entry
+
+
+if __name__ == '__main__':
+    """
+    Lists or exports the runs of the artifact store
+    """
+    parser = argparse.ArgumentParser(description="Compressed store of the run artifacts")
+    parser.add_argument("--store", default=cfg.ARTIFACT_STORE_DIR)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    list_parser = subparsers.add_parser("list", help="List the stored runs")
+    list_parser.add_argument("--group", help="Only the runs of this configuration file")
+    export_parser = subparsers.add_parser("export", help="Write the CSV layout of stored runs")
+    export_parser.add_argument("run_id", nargs="?", help="Run id (log path) of the run")
+    export_parser.add_argument("--all", action="store_true", help="Export every stored run")
+    export_parser.add_argument("--output", help="Output folder (default: the run's log path; with --all, the runs' "
+                                                "log paths are relative to it)")
+    args = parser.parse_args()
+
+    _store = ArtifactStore(args.store)
+    _index = _store.index()
+    if args.command == "list":
+        for _run_id, _entry in _index.items():
+            if args.group is None or _entry["group"] == args.group:
+                print(f"{_run_id}: seed {_entry['seed']}, {_entry['size']} bytes")
+    elif args.all:
+        for _run_id, _entry in _index.items():
+            _path = os.path.join(args.output, _run_id.lstrip("./")) if args.output else None
+            print(f"Exported {_store.export(_entry, _path)}")
+    elif args.run_id in _index:
+        print(f"Exported {_store.export(_index[args.run_id], args.output)}")
+    else:
+        parser.error(f"Unknown run id '{args.run_id}'")
@@ -0,0 +1,219 @@
+"""
+Benchmark of the simulator throughput and memory.
+Runs the first scenario of every configuration file, at the configured SIM_TIME and NUM_OF_CUSTOMERS and
+scaled up, each run in a fresh process. Reports:
+    events_per_second:      SimPy events processed per wall clock second
+    wall_per_sim_hour:      wall clock seconds per simulated hour
+    peak_rss_mb:            peak resident memory of the process
+    time split:             share of the run's time in logging, tracking, random numbers, the SimPy engine and
+                            the model, from a separate cProfile run writing the event log in the simulation
+                            thread (cfg.LOG_IN_BACKGROUND False), so its formatting and I/O are measured
+Results can be saved as a JSON baseline, and compared against one to flag regressions.
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import pstats
+import cProfile
+import argparse
+import resource
+import tempfile
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import simpy
+import cfg
+import Runner
+
+# Profile categories, by source file. SimUtils functions are tracking, except the random numbers ones.
+CATEGORY_FILES = {
+    "logging": ("logging", "Logger.py", "EventLog.py", "queue.py", "threading.py"),
+    "simpy": ("simpy",),
+    "model": ("Runner.py", "CallCenter.py", "Customer.py", "DB.py", "maintenance.py"),
+}
+RANDOM_FUNCTIONS = {"random_std_deviation", "normal", "random", "randint", "stream", "_uniform", "_mix64",
+                    "retry_needed", "create_rng"}
+
+
+class _CountingEnvironment(simpy.Environment):
+    """
+    simpy.Environment counting its scheduled events, and remembering its instances to read their count
+    """
+
+    instances = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.event_count = 0
+        self.instances.append(self)
+
+    def schedule(self, event, priority=simpy.events.NORMAL, delay=0):
+        self.event_count += 1
+        super().schedule(event, priority, delay)
+
+
+def _category(filename:str, function:str) -> str:
+    base_name = os.path.basename(filename)
+    if base_name == "SimUtils.py":
+        return "random" if function in RANDOM_FUNCTIONS else "tracking"
+    for category, names in CATEGORY_FILES.items():
+        if base_name in names or any(f"{os.sep}{name}{os.sep}" in filename for name in names):
+            return category
+    return "other"
+
+
+def _run(scenario:dict, cfg_parameters:dict, profile:bool) -> tuple:
+    """
+    Runs a scenario in the current process, returns (wall time, events, customers handled, profile)
+    """
+    cfg.override_parameters(cfg_parameters)
+    profiler = cProfile.Profile() if profile else None
+
+    with tempfile.TemporaryDirectory() as log_path, open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        start = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        summary = Runner.run_scenario("benchmark", log_path, scenario, env_class=_CountingEnvironment)
+        if profiler:
+            profiler.disable()
+        wall_time = time.perf_counter() - start
+
+    return wall_time, _CountingEnvironment.instances[-1].event_count, summary["customers_handled"], profiler
+
+
+def measure(scenario:dict, cfg_parameters:dict) -> dict:
+    """
+    Measures a run of a scenario, meant to run in a fresh process so the peak memory is the run's own
+    """
+    wall_time, events, customers, _ = _run(scenario, cfg_parameters, False)
+    return {
+        "wall_time": wall_time,
+        "events": events,
+        "customers_handled": customers,
+        "events_per_second": events / wall_time,
+        "wall_per_sim_hour": wall_time / (cfg.SIM_TIME / 3600),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def time_split(scenario:dict, cfg_parameters:dict) -> dict:
+    """
+    Returns the share of the run's time spent in each category of code. The event log is written by the simulation
+    thread, the profiled thread, instead of the background writer.
+    """
+    _, _, _, profiler = _run(scenario, dict(cfg_parameters, LOG_IN_BACKGROUND=False), True)
+    stats = pstats.Stats(profiler).stats
+    totals = {}
+    for (filename, _, function), (_, _, own_time, _, callers) in stats.items():
+        if filename == "~" and callers:
+            # Built-in functions are accounted to the code calling them, in proportion of the time of each call site
+            caller_time = sum(edge[2] for edge in callers.values()) or 1.0
+            for (caller_file, _, caller_function), edge in callers.items():
+                category = _category(caller_file, caller_function)
+                totals[category] = totals.get(category, 0.0) + own_time * edge[2] / caller_time
+            continue
+        category = _category(filename, function)
+        totals[category] = totals.get(category, 0.0) + own_time
+    total = sum(totals.values())
+    return {category: own_time / total for category, own_time in sorted(totals.items())}
+
+
+def benchmark_cases(configurations_dir:str, scales:list) -> list:
+    """
+    Returns the (name, scenario, cfg parameters) benchmark cases: the first scenario of every configuration
+    file at every scale of SIM_TIME and NUM_OF_CUSTOMERS
+    """
+    cases = []
+    for path in sorted(glob.glob(os.path.join(configurations_dir, "*.json"))):
+        scenario = cfg.load_scenarios_from_file(path, verbose=False)[0]
+        group = os.path.splitext(os.path.basename(path))[0]
+        for scale in scales:
+            cases.append((f"{group}/{scenario['name']}/x{scale}", scenario,
+                          {"SIM_TIME": cfg.SIM_TIME * scale, "NUM_OF_CUSTOMERS": cfg.NUM_OF_CUSTOMERS * scale}))
+    return cases
+
+
+def run_benchmark(cases:list, cfg_parameters:dict, repeat:int =1, profile:bool =True) -> dict:
+    """
+    Runs the benchmark cases, each measurement in a fresh process, and returns their results by case name.
+    The fastest of the repeated measurements is kept.
+    """
+    cfg_parameters = dict(cfg_parameters, RESULT_CACHE=False)
+    results = {}
+    context = multiprocessing.get_context("spawn")
+
+    for name, scenario, case_parameters in cases:
+        parameters = dict(cfg_parameters, **case_parameters)
+        measurements = []
+        for _ in range(repeat):
+            with ProcessPoolExecutor(1, mp_context=context) as executor:
+                measurements.append(executor.submit(measure, scenario, parameters).result())
+        result = min(measurements, key=lambda measurement: measurement["wall_time"])
+        result["peak_rss_mb"] = max(measurement["peak_rss_mb"] for measurement in measurements)
+
+        if profile:
+            with ProcessPoolExecutor(1, mp_context=context) as executor:
+                result["time_split"] = executor.submit(time_split, scenario, parameters).result()
+
+        results[name] = result
+        split = ", ".join(f"{category}={share:.0%}" for category, share in result.get("time_split", {}).items())
+        print(f"{name: <70} {result['events_per_second']:>10.0f} events/s {result['wall_per_sim_hour']:>7.3f} s/sim hour "
+              f"{result['peak_rss_mb']:>7.1f} MB  {split}")
+    return results
+
+
+def compare(results:dict, baseline:dict, tolerance:float) -> list:
+    """
+    Returns the regressions of results against a baseline: slower throughput or higher peak memory, beyond tolerance
+    """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name, None)
+        if reference is None:
+            continue
+        if result["events_per_second"] < reference["events_per_second"] * (1 - tolerance):
+            regressions.append(f"{name}: {result['events_per_second']:.0f} events/s, baseline {reference['events_per_second']:.0f}")
+        if result["peak_rss_mb"] > reference["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{name}: peak RSS {result['peak_rss_mb']:.1f} MB, baseline {reference['peak_rss_mb']:.1f} MB")
+    return regressions
+
+
+if __name__ == '__main__':
+    """
+    Runs the benchmark
+    """
+    parser = argparse.ArgumentParser(description="Simulator throughput and memory benchmark")
+    parser.add_argument("--configurations", default="tc_configurations")
+    parser.add_argument("--scales", type=int, nargs="+", default=cfg.BENCHMARK_SCALES,
+                        help="SIM_TIME and NUM_OF_CUSTOMERS multipliers of the scaled up variants")
+    parser.add_argument("--repeat", type=int, default=cfg.BENCHMARK_REPEAT)
+    parser.add_argument("--no-profile", action="store_true", help="Skip the time split measurement")
+    parser.add_argument("--baseline", help="JSON results to compare with, regressions exit with status 1")
+    parser.add_argument("--save", help="Save the results as JSON (e.g. a new baseline)")
+    parser.add_argument("--tolerance", type=float, default=cfg.BENCHMARK_TOLERANCE)
+    parser.add_argument("--rng", choices=["streams", "crn", "legacy"], default=cfg.RNG_MODE)
+    parser.add_argument("--tracking", choices=["full", "streaming", "windowed"], default=cfg.TRACKING_MODE)
+    parser.add_argument("--event-log", choices=["text", "binary", "both"], default=cfg.EVENT_LOG_FORMAT)
+    args = parser.parse_args()
+
+    _parameters = {"RNG_MODE": args.rng, "TRACKING_MODE": args.tracking, "EVENT_LOG_FORMAT": args.event_log}
+    _results = run_benchmark(benchmark_cases(args.configurations, args.scales), _parameters, args.repeat,
+                             not args.no_profile)
+
+    if args.save:
+        with open(args.save, 'wt') as f:
+            json.dump(_results, f, indent=2)
+        print(f"Saved benchmark results to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            _regressions = compare(_results, json.load(f), args.tolerance)
+        for _regression in _regressions:
+            print(f"REGRESSION {_regression}")
+        if _regressions:
+            sys.exit(1)
+        print("No regression")
@@ -1,53 +1,44 @@
-import random
-import simpy
 import logging
 import cfg
 import SimUtils
-import inspect
-from Logger import SimTimeFilter
-from SimUtils import random_std_deviation
+from SimUtils import random_std_deviation, activity, call_activity, MonitoredResource
 
 
 logger = logging.getLogger(__name__)
 class DigitalCallCenter:
     def __init__(self, env):
         self.env = env
-        self.bots = simpy.Resource(env,cfg.NUM_OF_BOTS)
-        self.legacy_archives_connections_available = simpy.Resource(env, cfg.NUM_OF_REMOTE_LEGACY_ARCHIVES_CONNECTIONS)
-        self.updaters = simpy.Resource(env,cfg.NUM_OF_UPDATERS)
-        logger.addFilter(SimTimeFilter(env))
+        self.bots = MonitoredResource(env, cfg.NUM_OF_BOTS, "bots")
+        self.legacy_archives_connections_available = MonitoredResource(env, cfg.NUM_OF_REMOTE_LEGACY_ARCHIVES_CONNECTIONS, "legacy_archives_connections")
+        self.updaters = MonitoredResource(env, cfg.NUM_OF_UPDATERS, "updaters")
 
+    @activity
     def is_problem_solved(self, customer):
         result = None
-        with SimUtils.ActivityRunTimeLogger(inspect.currentframe().f_code.co_name, self.env):
-            SimUtils.queue_tracker.activity_enter(inspect.currentframe().f_code.co_name, self.env.now)
-            yield self.env.timeout(random_std_deviation(cfg.AVG_CHECK_PROBLEM_SOLVED_TIME))
-            if random.random() < cfg.PROBLEM_SOLVED_PROBABILITY:
-                logger.info(f"id={customer} Problem solved ending communication with customer")
-                result = True
-            else:
-                result = False
-            SimUtils.queue_tracker.activity_exit(inspect.currentframe().f_code.co_name, self.env.now)
+        yield self.env.timeout(random_std_deviation(cfg.AVG_CHECK_PROBLEM_SOLVED_TIME, "is_problem_solved", customer))
+        if SimUtils.rng.random("is_problem_solved", customer) < cfg.PROBLEM_SOLVED_PROBABILITY:
+            logger.info("id=%s Problem solved ending communication with customer", customer)
+            result = True
+        else:
+            result = False
         return result
 
 
+    @activity
     def initiate_diagnostic(self, customer :int):
         """
         Initiate diagnostic with the customer
         NOTE: this operation can fail and will be retried if needed. Failure is based on
               scenario's "probabiliy of failure for low level operations"
         """
-        with SimUtils.ActivityRunTimeLogger(inspect.currentframe().f_code.co_name, self.env):
-            SimUtils.queue_tracker.activity_enter(inspect.currentframe().f_code.co_name, self.env.now)
-            rerun_manager = SimUtils.RetryWrapper(cfg.probability_of_low_level_failure)
+        rerun_manager = SimUtils.RetryWrapper(cfg.probability_of_low_level_failure, "initiate_diagnostic.retry", customer)
 
-            while rerun_manager.retry_needed() is True:
-                yield self.env.timeout(random_std_deviation(cfg.AVG_DIAGNOSTIC_TIME))
-                logger.info(f"id={customer} Initiated diagnostic on customer device")
-
-            SimUtils.queue_tracker.activity_exit(inspect.currentframe().f_code.co_name, self.env.now)
+        while rerun_manager.retry_needed() is True:
+            yield self.env.timeout(random_std_deviation(cfg.AVG_DIAGNOSTIC_TIME, "initiate_diagnostic", customer))
+            logger.info("id=%s Initiated diagnostic on customer device", customer)
 
 
+    @activity
     def is_upgrade_needed(self, customer :int) -> bool:
         """
         Checks if customer's system requires an upgrade.
@@ -55,160 +46,130 @@ class DigitalCallCenter:
         """
         result = None
 
-        with SimUtils.ActivityRunTimeLogger(inspect.currentframe().f_code.co_name, self.env):
-            SimUtils.queue_tracker.activity_enter(inspect.currentframe().f_code.co_name, self.env.now)
-            yield self.env.timeout(random_std_deviation(cfg.AVG_CHECK_UPDATE_NEEDED_TIME))
+        yield self.env.timeout(random_std_deviation(cfg.AVG_CHECK_UPDATE_NEEDED_TIME, "is_upgrade_needed", customer))
 
-            if random.random() < cfg.REQUIRED_DEVICE_UPDATE:
-                logger.info(f"id={customer} Device need software update")
-                result = True
-            else:
-                logger.info(f"id={customer} Device is up to date")
-                result = False
+        if SimUtils.rng.random("is_upgrade_needed", customer) < cfg.REQUIRED_DEVICE_UPDATE:
+            logger.info("id=%s Device need software update", customer)
+            result = True
+        else:
+            logger.info("id=%s Device is up to date", customer)
+            result = False
 
-            SimUtils.queue_tracker.activity_exit(inspect.currentframe().f_code.co_name, self.env.now)
         return result
 
+    @activity
     def is_config_correct(self, customer :int):
         result = None
 
-        with SimUtils.ActivityRunTimeLogger(inspect.currentframe().f_code.co_name, self.env):
-            SimUtils.queue_tracker.activity_enter(inspect.currentframe().f_code.co_name, self.env.now)
-            yield self.env.timeout(random_std_deviation(cfg.AVG_CHECK_CONFIG_TIME))
-            if random.random() < cfg.REQUIRED_DEVICE_RECONFIGURATION:
-                logger.info(f"id={customer} Device is not configured correctly")
-                result = False
-            else:
-                logger.info(f"id={customer} Device is configured correctly")
-                result = True
-
-            SimUtils.queue_tracker.activity_exit(inspect.currentframe().f_code.co_name, self.env.now)
+        yield self.env.timeout(random_std_deviation(cfg.AVG_CHECK_CONFIG_TIME, "is_config_correct", customer))
+        if SimUtils.rng.random("is_config_correct", customer) < cfg.REQUIRED_DEVICE_RECONFIGURATION:
+            logger.info("id=%s Device is not configured correctly", customer)
+            result = False
+        else:
+            logger.info("id=%s Device is configured correctly", customer)
+            result = True
+
         return result
 
+    @activity
     def reset_cashed_memory(self, customer :int):
-        with SimUtils.ActivityRunTimeLogger(inspect.currentframe().f_code.co_name, self.env):
-            SimUtils.queue_tracker.activity_enter(inspect.currentframe().f_code.co_name, self.env.now)
-            yield self.env.timeout(random_std_deviation(cfg.AVG_RESET_CASH_TIME))
-            logger.info(f"id={customer} Reset cash memory on customer device")
-            SimUtils.queue_tracker.activity_exit(inspect.currentframe().f_code.co_name, self.env.now)
+        yield self.env.timeout(random_std_deviation(cfg.AVG_RESET_CASH_TIME, "reset_cashed_memory", customer))
+        logger.info("id=%s Reset cash memory on customer device", customer)
 
 
+    @activity
     def configure_device(self, customer :int):
-        with SimUtils.ActivityRunTimeLogger(inspect.currentframe().f_code.co_name, self.env):
-            SimUtils.queue_tracker.activity_enter(inspect.currentframe().f_code.co_name, self.env.now)
-            yield self.env.timeout(random_std_deviation(cfg.AVG_CONF_TIME))
-            logger.info(f"id={customer} Apply configuration to customer device")
-            SimUtils.queue_tracker.activity_exit(inspect.currentframe().f_code.co_name, self.env.now)
+        yield self.env.timeout(random_std_deviation(cfg.AVG_CONF_TIME, "configure_device", customer))
+        logger.info("id=%s Apply configuration to customer device", customer)
 
 
+    @activity
     def update_software(self, customer :int):
-        with SimUtils.ActivityRunTimeLogger(inspect.currentframe().f_code.co_name, self.env):
-            SimUtils.queue_tracker.activity_enter(inspect.currentframe().f_code.co_name, self.env.now)
-            yield self.env.timeout(random_std_deviation(cfg.AVG_UPDATE_TIME))
-            logger.info(f"id={customer} Software updated on customer device")
-            SimUtils.queue_tracker.activity_exit(inspect.currentframe().f_code.co_name, self.env.now)
+        yield self.env.timeout(random_std_deviation(cfg.AVG_UPDATE_TIME, "update_software", customer))
+        logger.info("id=%s Software updated on customer device", customer)
 
 
+    @activity
     def reboot_device(self, customer :int):
-        with SimUtils.ActivityRunTimeLogger(inspect.currentframe().f_code.co_name, self.env):
-            SimUtils.queue_tracker.activity_enter(inspect.currentframe().f_code.co_name, self.env.now)
-            yield self.env.timeout(random_std_deviation(cfg.AVG_REBOOT_TIME))
-            logger.info(f"id={customer} Rebooting customer device")
-            SimUtils.queue_tracker.activity_exit(inspect.currentframe().f_code.co_name, self.env.now)
+        yield self.env.timeout(random_std_deviation(cfg.AVG_REBOOT_TIME, "reboot_device", customer))
+        logger.info("id=%s Rebooting customer device", customer)
 
 
+    @activity
     def is_hw_issue(self, customer :int, hw_issue=0.1):
         result = None
 
-        with SimUtils.ActivityRunTimeLogger(inspect.currentframe().f_code.co_name, self.env):
-            SimUtils.queue_tracker.activity_enter(inspect.currentframe().f_code.co_name, self.env.now)
-            yield self.env.timeout(random_std_deviation(cfg.AVG_HW_DIAGNOSTIC_TIME))
-            if random.random() < hw_issue:
-                logger.info(f"id={customer} Device has HW issue please take it to the lab")
-                result = True
-            else:
-                result = False
+        yield self.env.timeout(random_std_deviation(cfg.AVG_HW_DIAGNOSTIC_TIME, "is_hw_issue", customer))
+        if SimUtils.rng.random("is_hw_issue", customer) < hw_issue:
+            logger.info("id=%s Device has HW issue please take it to the lab", customer)
+            result = True
+        else:
+            result = False
 
-            SimUtils.queue_tracker.activity_exit(inspect.currentframe().f_code.co_name, self.env.now)
-            return result
+        return result
 
 
+    @activity(resource="legacy_archives_connections_available")
     def query_remote_archives(self, customer:int):
         """
         Query remote archives if the solution is found there
         """
-        with self.legacy_archives_connections_available.request() as request:
-           yield request
-           with SimUtils.ActivityRunTimeLogger(inspect.currentframe().f_code.co_name, self.env):
-                SimUtils.queue_tracker.activity_enter(inspect.currentframe().f_code.co_name, self.env.now)
-                yield self.env.timeout(random_std_deviation(cfg.REMOTE_LEGACY_ARCHIVES_RESPONSE_TIME) * cfg.under_performance_factor)
-                logger.info(f"id={customer} Remote legacy archives queried.")
-                SimUtils.queue_tracker.activity_exit(inspect.currentframe().f_code.co_name, self.env.now)
+        yield self.env.timeout(random_std_deviation(cfg.REMOTE_LEGACY_ARCHIVES_RESPONSE_TIME, "query_remote_archives", customer) * cfg.under_performance_factor)
+        logger.info("id=%s Remote legacy archives queried.", customer)
 
 
+    @activity
     def support(self, customer: int):
         """
         Support customer process flow
         """
 
-        with SimUtils.ActivityRunTimeLogger(inspect.currentframe().f_code.co_name, self.env):
-            SimUtils.queue_tracker.activity_enter(inspect.currentframe().f_code.co_name, self.env.now)
-
-            # we use max to avoid negative values or zeros
-            # --------
-            is_config_correct = yield self.env.process(self.is_config_correct(customer))
-            if not is_config_correct:
-
-                config_flow = [self.reset_cashed_memory, self.is_problem_solved, self.configure_device]
-                if 1 in cfg.enable_path_changes:
-                    # Change order of the three functions resulting from A->B->C to C->A->B
-                    config_flow = [self.configure_device, self.reset_cashed_memory, self.is_problem_solved]
-
-                for func in config_flow:
-                    res = yield self.env.process(func(customer))
-                    if func == self.is_problem_solved and res==True:
-                        SimUtils.queue_tracker.activity_exit(inspect.currentframe().f_code.co_name, self.env.now)
-                        return
-
-            # Run flow changes A->B->C to A->D->B->C (introduce a new task)
-            if (2 in cfg.enable_path_changes) and (random.random() <= cfg.NEEDS_REBOOT_PROBABILITY):
-                    yield self.env.process(self.reboot_device(customer))
-                    is_problem_solved = yield self.env.process(self.is_problem_solved(customer))
-                    if is_problem_solved:
-                        SimUtils.queue_tracker.activity_exit(inspect.currentframe().f_code.co_name, self.env.now)
-                        return
-            # --------
-            yield self.env.process(self.initiate_diagnostic(customer))
-            is_update_needed = yield self.env.process(self.is_upgrade_needed(customer))
-            if is_update_needed:
-                yield self.env.process(self.update_software(customer))
-                is_problem_solved = yield self.env.process(self.is_problem_solved(customer))
+        # we use max to avoid negative values or zeros
+        # --------
+        is_config_correct = yield from call_activity(self.env, self.is_config_correct(customer))
+        if not is_config_correct:
+
+            config_flow = [self.reset_cashed_memory, self.is_problem_solved, self.configure_device]
+            if 1 in cfg.enable_path_changes:
+                # Change order of the three functions resulting from A->B->C to C->A->B
+                config_flow = [self.configure_device, self.reset_cashed_memory, self.is_problem_solved]
+
+            for func in config_flow:
+                res = yield from call_activity(self.env, func(customer))
+                if func == self.is_problem_solved and res==True:
+                    return
+
+        # Run flow changes A->B->C to A->D->B->C (introduce a new task)
+        if (2 in cfg.enable_path_changes) and (SimUtils.rng.random("support", customer) <= cfg.NEEDS_REBOOT_PROBABILITY):
+                yield from call_activity(self.env, self.reboot_device(customer))
+                is_problem_solved = yield from call_activity(self.env, self.is_problem_solved(customer))
                 if is_problem_solved:
-                    SimUtils.queue_tracker.activity_exit(inspect.currentframe().f_code.co_name, self.env.now)
                     return
-            # --------
-            is_hw_issue = yield self.env.process(self.is_hw_issue(customer))
-            if is_hw_issue:
-                SimUtils.queue_tracker.activity_exit(inspect.currentframe().f_code.co_name, self.env.now)
-                return
-            # --------
-            yield self.env.process(self.query_remote_archives(customer))
-            is_problem_solved = yield self.env.process(self.is_problem_solved(customer))
+        # --------
+        yield from call_activity(self.env, self.initiate_diagnostic(customer))
+        is_update_needed = yield from call_activity(self.env, self.is_upgrade_needed(customer))
+        if is_update_needed:
+            yield from call_activity(self.env, self.update_software(customer))
+            is_problem_solved = yield from call_activity(self.env, self.is_problem_solved(customer))
             if is_problem_solved:
-                SimUtils.queue_tracker.activity_exit(inspect.currentframe().f_code.co_name, self.env.now)
                 return
-
-            else:
-                logger.error(f"id={customer} Could not solve device issue. please visit one of our reception desks")
-
-            SimUtils.queue_tracker.activity_exit(inspect.currentframe().f_code.co_name, self.env.now)
-
+        # --------
+        is_hw_issue = yield from call_activity(self.env, self.is_hw_issue(customer))
+        if is_hw_issue:
+            return
+        # --------
+        yield from call_activity(self.env, self.query_remote_archives(customer))
+        is_problem_solved = yield from call_activity(self.env, self.is_problem_solved(customer))
+        if is_problem_solved:
+            return
+
+        else:
+            logger.error("id=%s Could not solve device issue. please visit one of our reception desks", customer)
+
+    @activity
     def update_incident(self, customer):
-        with SimUtils.ActivityRunTimeLogger(inspect.currentframe().f_code.co_name, self.env):
-            SimUtils.queue_tracker.activity_enter(inspect.currentframe().f_code.co_name, self.env.now)
-            yield self.env.timeout(random_std_deviation(cfg.AVG_INCIDENT_UPDATE_TIME))
-            logger.info(f"id={customer} Connection is cleaned")
-            SimUtils.queue_tracker.activity_exit(inspect.currentframe().f_code.co_name, self.env.now)
+        yield self.env.timeout(random_std_deviation(cfg.AVG_INCIDENT_UPDATE_TIME, "update_incident", customer))
+        logger.info("id=%s Connection is cleaned", customer)
 
 
 
@@ -0,0 +1,264 @@
+"""
+Statistical comparison of the scenarios of every group with the group's baseline scenario.
+For every activity, the runtimes and the queue occupancy of a scenario's runs (its folder, or its pooled
+replication_<i> folders) are compared with the baseline's:
+    effect sizes:       change of the mean, Cohen's d, Cliff's delta (P(scenario > baseline) - P(scenario < baseline))
+    distributions:      Kolmogorov-Smirnov D and Mann-Whitney U, with their asymptotic p-values
+    quantile shifts:    relative change of the cfg.COMPARE_QUANTILES of the runtimes
+    queue occupancy:    time weighted average and max occupancy of the activity in both scenarios
+The report ranks the activities that changed (p-value below cfg.COMPARE_ALPHA, or activities present in only
+one of the scenarios) by the absolute Cliff's delta.
+The histories of the full tracking mode are needed (activity_time_log.csv, queue_size_tracking.log), they are
+loaded with LogLoader and its cached columns.
+"""
+
+import os
+import math
+import argparse
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import cfg
+import LogLoader
+
+STANDARD_NORMAL = statistics.NormalDist()
+HISTORY_FILES = ("activity_time_log.csv", "queue_size_tracking.log")
+
+
+def scenario_runs(scenario_dir:str) -> list:
+    """
+    Returns the folders of the runs of a scenario: its replications, or the scenario folder itself
+    """
+    replications = sorted(os.path.join(scenario_dir, name) for name in os.listdir(scenario_dir)
+                          if name.startswith("replication_") and os.path.isdir(os.path.join(scenario_dir, name)))
+    return replications or [scenario_dir]
+
+
+def queue_occupancy(columns:dict) -> dict:
+    """
+    Returns the (time weighted average, max) occupancy of every activity of a queue_size_tracking.log
+    """
+    occupancy = {}
+    if not len(columns["time"]):
+        return occupancy
+    end_time = columns["time"].max()
+
+    for code, activity in enumerate(columns["activities"].tolist()):
+        mask = columns["activity"] == code
+        times = columns["time"][mask]
+        levels = np.cumsum(columns["delta"][mask], dtype=np.int64)
+        durations = np.diff(np.append(times, end_time))
+        occupancy[activity] = (float(levels @ durations) / end_time if end_time else 0.0, int(levels.max()))
+    return occupancy
+
+
+def load_scenario(scenario_dir:str) -> dict:
+    """
+    Returns the runtimes of every activity, pooled over the scenario's runs, and the occupancy of every activity
+    averaged over the runs
+    """
+    runtimes, occupancies = {}, {}
+    runs = scenario_runs(scenario_dir)
+    for run in runs:
+        columns = LogLoader.load_file(os.path.join(run, "activity_time_log.csv"), workers=1)
+        for code, activity in enumerate(columns["activities"].tolist()):
+            runtimes.setdefault(activity, []).append(columns["runtime"][columns["activity"] == code])
+
+        queue_path = os.path.join(run, "queue_size_tracking.log")
+        if os.path.exists(queue_path):
+            for activity, (mean, maximum) in queue_occupancy(LogLoader.load_file(queue_path, workers=1)).items():
+                total_mean, total_max = occupancies.get(activity, (0.0, 0))
+                occupancies[activity] = (total_mean + mean / len(runs), max(total_max, maximum))
+
+    return {"runtimes": {activity: np.concatenate(arrays) for activity, arrays in runtimes.items()},
+            "occupancy": occupancies}
+
+
+def kolmogorov_smirnov(sample:np.ndarray, reference:np.ndarray) -> tuple:
+    """
+    Returns the two sample Kolmogorov-Smirnov statistic D and its asymptotic p-value
+    (check: python -m doctest Compare.py)
+    >>> kolmogorov_smirnov(np.array([1.0, 2.0, 3.0]), np.array([1.0, 2.0, 3.0]))
+    (0.0, 1.0)
+    """
+    sample, reference = np.sort(sample), np.sort(reference)
+    values = np.concatenate([sample, reference])
+    distance = np.abs(np.searchsorted(sample, values, side="right") / len(sample) -
+                      np.searchsorted(reference, values, side="right") / len(reference)).max()
+
+    effective_size = math.sqrt(len(sample) * len(reference) / (len(sample) + len(reference)))
+    scaled = (effective_size + 0.12 + 0.11 / effective_size) * distance
+    if scaled == 0:
+        return float(distance), 1.0
+    k = np.arange(1, 101)
+    if scaled < 1.18:
+        # The alternating series cancels out for small values, use the series of the distribution function
+        cdf = math.sqrt(2 * math.pi) / scaled * np.sum(np.exp(-(2 * k - 1) ** 2 * math.pi ** 2 / (8 * scaled ** 2)))
+        p_value = 1 - cdf
+    else:
+        p_value = 2 * np.sum((-1.0) ** (k - 1) * np.exp(-2 * k ** 2 * scaled ** 2))
+    return float(distance), float(min(max(p_value, 0.0), 1.0))
+
+
+def _average_ranks(values:np.ndarray) -> tuple:
+    """
+    Returns the ranks of values (1-based, ties get their average rank) and the sizes of the ties
+    """
+    order = np.argsort(values, kind="mergesort")
+    sorted_values = values[order]
+    starts = np.flatnonzero(np.r_[True, sorted_values[1:] != sorted_values[:-1]])
+    counts = np.diff(np.r_[starts, len(values)])
+    ranks = np.empty(len(values))
+    ranks[order] = np.repeat(starts + (counts + 1) / 2, counts)
+    return ranks, counts
+
+
+def mann_whitney(sample:np.ndarray, reference:np.ndarray) -> tuple:
+    """
+    Returns the Mann-Whitney U of sample against reference and its two sided p-value (normal approximation with
+    tie and continuity corrections)
+    """
+    n, m = len(sample), len(reference)
+    ranks, ties = _average_ranks(np.concatenate([sample, reference]))
+    u = float(ranks[:n].sum() - n * (n + 1) / 2)
+
+    total = n + m
+    variance = n * m / 12 * ((total + 1) - float(np.sum(ties ** 3 - ties)) / (total * (total - 1)))
+    if variance <= 0:
+        return u, 1.0
+    z = (abs(u - n * m / 2) - 0.5) / math.sqrt(variance)
+    return u, min(1.0, 2 * (1 - STANDARD_NORMAL.cdf(max(z, 0.0))))
+
+
+def compare_activity(sample:np.ndarray, reference:np.ndarray) -> dict:
+    """
+    Returns the comparison statistics of the runtimes of an activity in a scenario (sample) and the baseline
+    """
+    n, m = len(sample), len(reference)
+    mean, reference_mean = float(sample.mean()), float(reference.mean())
+    pooled_variance = ((n - 1) * sample.var(ddof=1) + (m - 1) * reference.var(ddof=1)) / (n + m - 2)
+    ks_distance, ks_p_value = kolmogorov_smirnov(sample, reference)
+    u, mw_p_value = mann_whitney(sample, reference)
+
+    row = {
+        "mean_change": (mean - reference_mean) / reference_mean if reference_mean else math.nan,
+        "cohens_d": (mean - reference_mean) / math.sqrt(pooled_variance) if pooled_variance > 0 else 0.0,
+        "cliffs_delta": 2 * u / (n * m) - 1,
+        "ks_d": ks_distance,
+        "ks_p": ks_p_value,
+        "mw_u": u,
+        "mw_p": mw_p_value,
+    }
+    quantiles, reference_quantiles = np.quantile(sample, cfg.COMPARE_QUANTILES), np.quantile(reference, cfg.COMPARE_QUANTILES)
+    for probability, value, reference_value in zip(cfg.COMPARE_QUANTILES, quantiles, reference_quantiles):
+        row[f"p{round(probability * 100):02d}_shift"] = float((value - reference_value) / reference_value) if reference_value else math.nan
+    return row
+
+
+def compare_scenarios(group:str, baseline_dir:str, scenario_dir:str) -> list:
+    """
+    Returns the comparison rows of every activity of a scenario and its baseline
+    """
+    baseline, scenario = load_scenario(baseline_dir), load_scenario(scenario_dir)
+    rows = []
+    for activity in sorted(set(baseline["runtimes"]) | set(scenario["runtimes"])):
+        sample = scenario["runtimes"].get(activity, np.zeros(0))
+        reference = baseline["runtimes"].get(activity, np.zeros(0))
+        row = {"group": group, "scenario": os.path.basename(scenario_dir), "activity": activity,
+               "n_baseline": len(reference), "n_scenario": len(sample),
+               "mean_baseline": float(reference.mean()) if len(reference) else math.nan,
+               "mean_scenario": float(sample.mean()) if len(sample) else math.nan}
+
+        if len(sample) > 1 and len(reference) > 1:
+            row.update(compare_activity(sample, reference))
+            changed = min(row["ks_p"], row["mw_p"]) < cfg.COMPARE_ALPHA
+            row["status"] = "changed" if changed else "unchanged"
+        else:
+            row["status"] = "added" if len(sample) else "removed" if len(reference) else "unchanged"
+            row["cliffs_delta"] = 1.0 if len(sample) else -1.0 if len(reference) else 0.0
+
+        row["queue_mean_baseline"], row["queue_max_baseline"] = baseline["occupancy"].get(activity, (0.0, 0))
+        row["queue_mean_scenario"], row["queue_max_scenario"] = scenario["occupancy"].get(activity, (0.0, 0))
+        rows.append(row)
+    return rows
+
+
+def comparison_pairs(root:str, baseline_name:str ="baseline_scenario") -> list:
+    """
+    Returns the (group, baseline folder, scenario folder) of every scenario of the groups of an output folder
+    (e.g. Test Cases/<timestamp>)
+    """
+    pairs = []
+    for group in sorted(os.listdir(root)):
+        group_dir = os.path.join(root, group)
+        if not os.path.isdir(group_dir):
+            continue
+        scenarios = sorted(name for name in os.listdir(group_dir) if os.path.isdir(os.path.join(group_dir, name)))
+        baselines = [name for name in scenarios if name.endswith(f"_{baseline_name}")]
+        if not baselines:
+            print(f"{group}: no {baseline_name}, skipped")
+            continue
+        pairs.extend((group, os.path.join(group_dir, baselines[0]), os.path.join(group_dir, name))
+                     for name in scenarios if name != baselines[0])
+    return pairs
+
+
+def run_comparisons(pairs:list, workers:int =1) -> list:
+    """
+    Compares the scenario pairs on a pool of worker processes and returns the rows ranked by significance
+    and effect size
+    """
+    if workers == 1 or len(pairs) <= 1:
+        results = [compare_scenarios(*pair) for pair in pairs]
+    else:
+        with ProcessPoolExecutor(min(workers, len(pairs))) as executor:
+            results = list(executor.map(compare_scenarios, *zip(*pairs)))
+
+    rows = [row for result in results for row in result]
+    rows.sort(key=lambda row: (row["status"] == "unchanged", -abs(row["cliffs_delta"])))
+    return rows
+
+
+REPORT_COLUMNS = ["group", "scenario", "activity", "status", "n_baseline", "n_scenario", "mean_baseline", "mean_scenario",
+                  "mean_change", "cohens_d", "cliffs_delta", "ks_d", "ks_p", "mw_u", "mw_p"]
+QUEUE_COLUMNS = ["queue_mean_baseline", "queue_mean_scenario", "queue_max_baseline", "queue_max_scenario"]
+
+
+def write_report(rows:list, path:str):
+    """
+    Writes the ranked rows to a CSV report
+    """
+    quantile_columns = [f"p{round(probability * 100):02d}_shift" for probability in cfg.COMPARE_QUANTILES]
+    columns = REPORT_COLUMNS + quantile_columns + QUEUE_COLUMNS
+    with open(path, 'wt') as f:
+        f.write(f"{', '.join(['rank'] + columns)}\n")
+        for rank, row in enumerate(rows, 1):
+            f.write(f"{', '.join(str(value) for value in [rank] + [row.get(column, '') for column in columns])}\n")
+
+
+if __name__ == '__main__':
+    """
+    Compares the scenarios of an output folder with their baselines
+    """
+    parser = argparse.ArgumentParser(description="Comparison of the scenarios with their group's baseline")
+    parser.add_argument("root", help="Output folder, e.g. '../Test Cases/<timestamp>'")
+    parser.add_argument("-o", "--output", default="comparison_report.csv")
+    parser.add_argument("-j", "--workers", type=int, default=0, help="Comparing processes (0: one per CPU core)")
+    parser.add_argument("--baseline", default="baseline_scenario", help="Name of the baseline scenario of the groups")
+    parser.add_argument("--top", type=int, default=20, help="Number of changes printed")
+    args = parser.parse_args()
+
+    # Parse the histories once by a single pool of workers, the comparisons read the cached columns
+    _pairs = comparison_pairs(args.root, args.baseline)
+    _runs = {run for _, baseline_dir, scenario_dir in _pairs for run in scenario_runs(baseline_dir) + scenario_runs(scenario_dir)}
+    LogLoader.load_files([os.path.join(run, name) for run in sorted(_runs) for name in HISTORY_FILES
+                          if os.path.exists(os.path.join(run, name))], args.workers or None)
+    _rows = run_comparisons(_pairs, args.workers or os.cpu_count())
+    write_report(_rows, args.output)
+
+    for _row in _rows[:args.top]:
+        if _row["status"] == "unchanged":
+            break
+        print(f"{_row['group']}/{_row['scenario']}/{_row['activity']}: {_row['status']}, "
+              f"mean {_row['mean_baseline']:.2f} -> {_row['mean_scenario']:.2f}, Cliff's delta {_row['cliffs_delta']:+.2f}")
+    print(f"Saved comparison report to {args.output}")
@@ -1,63 +1,105 @@
-import random
 import logging
 import cfg
 import SimUtils
-import inspect
-from Logger import SimTimeFilter
 from SimUtils import RetryWrapper
-from SimUtils import random_std_deviation
+from SimUtils import random_std_deviation, activity, call_activity
 
 logger = logging.getLogger(__name__)
 
 class Customer:
+    __slots__ = ("env", "id", "db")
+
     def __init__(self, env, id, db):
         self.env = env
         self.id = id
         self.db = db
-        logger.addFilter(SimTimeFilter(env))
 
+    @activity
     def is_registered(self):
         """
         Checks if a customer is already registered in the database.
         """
         res = None
 
-        with SimUtils.ActivityRunTimeLogger(inspect.currentframe().f_code.co_name, self.env):
-            SimUtils.queue_tracker.activity_enter(inspect.currentframe().f_code.co_name, self.env.now)
-            rerun_manager = RetryWrapper(cfg.probability_of_high_level_failure)
-            logger.info(f"id={self.id} check if customer registered")
+        rerun_manager = RetryWrapper(cfg.probability_of_high_level_failure, "is_registered.retry", self.id)
+        logger.info("id=%s check if customer registered", self.id)
 
-            while rerun_manager.retry_needed() is True:
-                with self.db.connections.request() as request:
-                    yield request
-                    res = yield self.env.process(self.db.indentify_customer(self.id))
-                if not res:
-                    res = yield self.env.process(self.register_new_customer())
+        while rerun_manager.retry_needed() is True:
+            with self.db.connections.request() as request:
+                yield request
+                res = yield from call_activity(self.env, self.db.indentify_customer(self.id))
+            if not res:
+                res = yield from call_activity(self.env, self.register_new_customer())
 
-            assert(res is not None)
-            SimUtils.queue_tracker.activity_exit(inspect.currentframe().f_code.co_name, self.env.now)
+        assert(res is not None)
         return res
 
+    @activity
     def register_new_customer(self):
         """
         Registers a new customer into the database
         """
         result = None
 
-        with SimUtils.ActivityRunTimeLogger(inspect.currentframe().f_code.co_name, self.env):
-            SimUtils.queue_tracker.activity_enter(inspect.currentframe().f_code.co_name, self.env.now)
-            rerun_manager = RetryWrapper(cfg.probability_of_high_level_failure)
-            yield self.env.timeout(random_std_deviation(cfg.REGISTER_NEW_CUSTOMER))
-
-            if random.random() > cfg.REGISTRATION_FAILURE_RATE:
-                while rerun_manager.retry_needed() is True:
-                    with self.db.connections.request() as request:
-                        yield request
-                        yield self.env.process(self.db.register_to_service(self.id))
-                result = True
-            else:
-                logger.info(f"id={self.id} Failed to register new customer. Terminating connection.")
-                result = False
-
-            SimUtils.queue_tracker.activity_exit(inspect.currentframe().f_code.co_name, self.env.now)
+        rerun_manager = RetryWrapper(cfg.probability_of_high_level_failure, "register_new_customer.retry", self.id)
+        yield self.env.timeout(random_std_deviation(cfg.REGISTER_NEW_CUSTOMER, "register_new_customer", self.id))
+
+        if SimUtils.rng.random("register_new_customer", self.id) > cfg.REGISTRATION_FAILURE_RATE:
+            while rerun_manager.retry_needed() is True:
+                with self.db.connections.request() as request:
+                    yield request
+                    yield from call_activity(self.env, self.db.register_to_service(self.id))
+            result = True
+        else:
+            logger.info("id=%s Failed to register new customer. Terminating connection.", self.id)
+            result = False
+
         return result
+
+
+class CustomerPool:
+    """
+    Customer records of the high volume mode (cfg.HIGH_VOLUME): the records of the customers who left are reused
+    by the next arrivals, and at most max_live customers are in the system at once. Arrivals beyond it are
+    blocked (like calls on a switchboard without free lines), so the memory of a run depends on the number of
+    concurrent customers rather than on the total number of customers.
+    """
+
+    def __init__(self, env, db, max_live:int):
+        """
+        Constructor
+        """
+        self.env = env
+        self.db = db
+        self.max_live = max_live
+        self._free = []                 # Records of the customers who left
+        self.live = 0
+        self.peak_live = 0
+        self.blocked = 0
+
+    def acquire(self, customer_id:int):
+        """
+        Returns the record of an arriving customer, None if the arrival is blocked
+        """
+        if self.live >= self.max_live:
+            self.blocked += 1
+            return None
+
+        if self._free:
+            customer = self._free.pop()
+            customer.id = customer_id
+        else:
+            customer = Customer(self.env, customer_id, self.db)
+        self.live += 1
+        self.peak_live = max(self.peak_live, self.live)
+        return customer
+
+    def release(self, customer:Customer):
+        self.live -= 1
+        self._free.append(customer)
+
+    def summary(self) -> dict:
+        return {
+            "customers.peak_live": self.peak_live,
+            "customers.blocked": self.blocked,
+        }
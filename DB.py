@@ -1,36 +1,32 @@
-import simpy
 import logging
-import random
 import cfg
-from Logger import SimTimeFilter
-from SimUtils import random_std_deviation
+import SimUtils
+from SimUtils import random_std_deviation, MonitoredResource
 
 logger = logging.getLogger(__name__)
 class DataBase:
     def __init__(self, env):
         self.env = env
-        self.connections = simpy.Resource(env, cfg.NUM_OF_DB_CONNECTIONS)
-
-        logger.addFilter(SimTimeFilter(env))
+        self.connections = MonitoredResource(env, cfg.NUM_OF_DB_CONNECTIONS, "db_connections")
 
     def indentify_customer(self, customer):
         """
         Search for customer in the database.
         """
 
-        logger.info(f"id={customer} identifying customer")
-        yield self.env.timeout(random_std_deviation(cfg.AVG_DB_QUERY_TIME))
+        logger.info("id=%s identifying customer", customer)
+        yield self.env.timeout(random_std_deviation(cfg.AVG_DB_QUERY_TIME, "indentify_customer", customer))
 
-        if random.random() > cfg.FAILED_IDENTIFICATION_RATE:
-            logger.info(f"id={customer} Customer eligible for service")
+        if SimUtils.rng.random("indentify_customer", customer) > cfg.FAILED_IDENTIFICATION_RATE:
+            logger.info("id=%s Customer eligible for service", customer)
             return True
         else:
-            logger.info(f"id={customer} Customer is not eligible for service")
+            logger.info("id=%s Customer is not eligible for service", customer)
             return False
 
     def register_to_service(self, customer):
         """
         Register a new customer to the service (add customer to DB)
         """
-        yield self.env.timeout(random_std_deviation(cfg.AVG_DB_INSERT_TIME))
-        logger.info(f"id={customer} Customer registered to service")
\ No newline at end of file
+        yield self.env.timeout(random_std_deviation(cfg.AVG_DB_INSERT_TIME, "register_to_service", customer))
+        logger.info("id=%s Customer registered to service", customer)
\ No newline at end of file
@@ -0,0 +1,225 @@
+"""
+Online early warning detectors, fed by the queue tracker as the simulation runs (cfg.DETECTORS, --detect).
+Every detector specification monitors one signal of each activity (or of its "activities" only):
+    runtime:        run duration of every execution of the activity
+    queue:          occupancy of the activity after every entry or exit
+    {"type": "cusum", "signal": "runtime", "k": 0.5, "h": 8}
+    {"type": "ewma", "signal": "runtime", "alpha": 0.1, "limit": 4}
+    {"type": "page_hinkley", "signal": "queue", "delta": 0.1, "threshold": 50, "warmup": 500}
+A detector learns the mean and standard deviation of its signal on the first "warmup" values (default 50),
+then monitors the standardized values and restarts after every alarm. The occupancy of the queues rises from
+zero as the simulation starts, queue detectors need a longer warmup.
+Alarms are logged as warnings with their simulated time, written to alarms.csv and summarized with their
+detection latency from the scenario's "change_time", the simulated time at which its degradations start.
+"""
+
+import os
+import abc
+import math
+import logging
+import SimUtils
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DETECTORS = [
+    {"type": "cusum", "signal": "runtime"},
+    {"type": "ewma", "signal": "runtime"},
+    {"type": "page_hinkley", "signal": "runtime"},
+]
+SIGNALS = ("runtime", "queue")
+
+
+class Detector(abc.ABC):
+    """
+    Base of the detectors: learns the baseline of a signal, then monitors its standardized values
+    """
+
+    def __init__(self, warmup:int =50):
+        """
+        Constructor
+        """
+        self.warmup = warmup
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def update(self, value:float):
+        """
+        Returns the detector statistic when value raises an alarm, else None
+        """
+        if self.count < self.warmup:
+            self.count += 1
+            delta = value - self.mean
+            self.mean += delta / self.count
+            self._m2 += delta * (value - self.mean)
+            return None
+
+        std_deviation = math.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else 0.0
+        return self._update((value - self.mean) / (std_deviation or 1.0))
+
+    @abc.abstractmethod
+    def _update(self, score:float):
+        """
+        Returns the detector statistic when the standardized value score raises an alarm, else None
+        """
+
+
+class CusumDetector(Detector):
+    """
+    Two sided CUSUM of the standardized values: alarm when the cumulated drift beyond k exceeds h
+    """
+
+    def __init__(self, k:float =0.5, h:float =8, warmup:int =50):
+        super().__init__(warmup)
+        self.k = k
+        self.h = h
+        self._high = 0.0
+        self._low = 0.0
+
+    def _update(self, score:float):
+        self._high = max(0.0, self._high + score - self.k)
+        self._low = max(0.0, self._low - score - self.k)
+        statistic = self._high if self._high >= self._low else -self._low
+        if abs(statistic) > self.h:
+            self._high = self._low = 0.0
+            return statistic
+        return None
+
+
+class EwmaDetector(Detector):
+    """
+    EWMA chart of the standardized values: alarm when the moving average leaves limit standard deviations
+    of the average
+    """
+
+    def __init__(self, alpha:float =0.1, limit:float =4, warmup:int =50):
+        super().__init__(warmup)
+        self.alpha = alpha
+        self.control_limit = limit * math.sqrt(alpha / (2 - alpha))
+        self._average = 0.0
+
+    def _update(self, score:float):
+        self._average += self.alpha * (score - self._average)
+        if abs(self._average) > self.control_limit:
+            statistic, self._average = self._average, 0.0
+            return statistic
+        return None
+
+
+class PageHinkleyDetector(Detector):
+    """
+    Page-Hinkley test of the standardized values: alarm when their cumulated deviation from their running mean
+    rises threshold above its minimum (upward changes)
+    """
+
+    def __init__(self, delta:float =0.1, threshold:float =50, warmup:int =50):
+        super().__init__(warmup)
+        self.delta = delta
+        self.threshold = threshold
+        self._reset()
+
+    def _reset(self):
+        self._count = 0
+        self._mean = 0.0
+        self._cumulated = 0.0
+        self._minimum = 0.0
+
+    def _update(self, score:float):
+        self._count += 1
+        self._mean += (score - self._mean) / self._count
+        self._cumulated += score - self._mean - self.delta
+        self._minimum = min(self._minimum, self._cumulated)
+        statistic = self._cumulated - self._minimum
+        if statistic > self.threshold:
+            self._reset()
+            return statistic
+        return None
+
+
+DETECTOR_TYPES = {
+    "cusum": CusumDetector,
+    "ewma": EwmaDetector,
+    "page_hinkley": PageHinkleyDetector,
+}
+
+
+class DetectorSet:
+    """
+    Queue tracker listener running the detectors of a simulation run on every activity, and recording their alarms
+    """
+
+    def __init__(self, specifications:list, change_time:float =0):
+        """
+        Constructor
+        """
+        self.specifications = []
+        for specification in specifications:
+            if specification["type"] not in DETECTOR_TYPES:
+                raise ValueError(f"Unknown detector type '{specification['type']}'")
+            if specification.get("signal", "runtime") not in SIGNALS:
+                raise ValueError(f"Unknown detector signal '{specification['signal']}'")
+            specification = dict(specification, signal=specification.get("signal", "runtime"))
+            specification.setdefault("name", f"{specification['type']}_{specification['signal']}")
+            self.specifications.append(specification)
+
+        self.change_time = change_time
+        self._detectors = {}            # Detector by (specification index, activity id), None if not monitored
+        self._signal_specifications = {signal: [i for i, specification in enumerate(self.specifications)
+                                                if specification["signal"] == signal] for signal in SIGNALS}
+        self.alarms = []                # (time, detector name, activity id, value, statistic)
+
+    def _create_detector(self, index:int, activity_id:int):
+        specification = self.specifications[index]
+        activities = specification.get("activities", None)
+        if activities is not None and SimUtils.activity_names[activity_id] not in activities:
+            return None
+        parameters = {name: value for name, value in specification.items()
+                      if name not in ("type", "signal", "name", "activities")}
+        return DETECTOR_TYPES[specification["type"]](**parameters)
+
+    def _feed(self, signal:str, activity_id:int, value:float, time:float):
+        for index in self._signal_specifications[signal]:
+            key = (index, activity_id)
+            if key not in self._detectors:
+                self._detectors[key] = self._create_detector(index, activity_id)
+            detector = self._detectors[key]
+            if detector is None:
+                continue
+
+            statistic = detector.update(value)
+            if statistic is not None:
+                name = self.specifications[index]["name"]
+                self.alarms.append((time, name, activity_id, value, statistic))
+                logger.warning("Early warning detector=%s activity=%s value=%s statistic=%.3f",
+                               name, SimUtils.activity_names[activity_id], value, statistic)
+
+    def activity_runtime(self, activity_id:int, execution_duration:float, time:float):
+        self._feed("runtime", activity_id, execution_duration, time)
+
+    def queue_change(self, activity_id:int, occupancy:int, time:float):
+        self._feed("queue", activity_id, occupancy, time)
+
+    def summary(self) -> dict:
+        """
+        Returns the number of alarms of every detector, with the time of the first alarm and the detection
+        latency (first alarm after change_time) when there were alarms
+        """
+        summary = {"detection.alarms": len(self.alarms)}
+        for specification in self.specifications:
+            name = specification["name"]
+            times = [time for time, detector, _, _, _ in self.alarms if detector == name]
+            summary[f"detection.{name}.alarms"] = len(times)
+            summary[f"detection.{name}.false_alarms"] = sum(1 for time in times if time < self.change_time)
+            detections = [time for time in times if time >= self.change_time]
+            if detections:
+                summary[f"detection.{name}.first_alarm"] = detections[0]
+                summary[f"detection.{name}.latency"] = detections[0] - self.change_time
+        return summary
+
+    def save_to_folder(self, path:str):
+        with open(os.path.join(path, 'alarms.csv'), 'wt') as f:
+            s = f"{'time': <22}, {'detector': <24}, {'activity': <22}, {'value': <22}, {'statistic': <22}"
+            f.write(f"{s}\n")
+            for time, name, activity_id, value, statistic in self.alarms:
+                s = f"{time: <22}, {name: <24}, {SimUtils.activity_names[activity_id]: <22}, {value: <22}, {statistic: <22}"
+                f.write(f"{s}\n")
@@ -0,0 +1,291 @@
+"""
+Distributed execution of the scenarios: a coordinator serves the test cases of the configurations directory
+to workers over TCP, the workers run them with the SimPy engine and send back their output files.
+Every exchange is a single request/reply on a new connection, messages are JSON objects prefixed with their
+length (8 bytes, big endian):
+    {"type": "request", "worker": id}                   -> job, wait (no job available yet) or done
+    {"type": "heartbeat", "worker": id, "job_id": n}    -> ack, extends the lease of the job
+    {"type": "result", "worker": id, "job_id": n, "summary": {...}, "artifacts": {path: base64}} -> ack
+    {"type": "failed", "worker": id, "job_id": n, "error": "..."}                               -> ack
+A job is leased to a worker for cfg.DISTRIBUTED_LEASE_TIMEOUT seconds, renewed by its heartbeats. Jobs of
+failed workers and expired leases are served again, up to cfg.DISTRIBUTED_MAX_ATTEMPTS times.
+"""
+
+import os
+import json
+import time
+import base64
+import socket
+import struct
+import argparse
+import tempfile
+import threading
+import traceback
+import socketserver
+from datetime import datetime
+from collections import deque
+import cfg
+import Runner
+
+LENGTH = struct.Struct(">Q")
+
+
+def send_message(sock:socket.socket, message:dict):
+    payload = json.dumps(message).encode()
+    sock.sendall(LENGTH.pack(len(payload)) + payload)
+
+
+def _receive_exactly(sock:socket.socket, size:int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Connection closed by peer")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def receive_message(sock:socket.socket) -> dict:
+    length, = LENGTH.unpack(_receive_exactly(sock, LENGTH.size))
+    return json.loads(_receive_exactly(sock, length))
+
+
+def exchange(address:tuple, message:dict, timeout:float =None) -> dict:
+    """
+    Sends a message to the coordinator and returns its reply
+    """
+    with socket.create_connection(address, timeout=timeout or cfg.DISTRIBUTED_SOCKET_TIMEOUT) as sock:
+        send_message(sock, message)
+        return receive_message(sock)
+
+
+class Coordinator:
+    """
+    Serves the test cases to the workers and stores their results
+    """
+
+    def __init__(self, test_cases:list, cfg_parameters:dict =None, lease_timeout:float =None, max_attempts:int =None):
+        """
+        Constructor
+        """
+        self.test_cases = test_cases
+        self.cfg_parameters = cfg_parameters or {}
+        self.lease_timeout = lease_timeout or cfg.DISTRIBUTED_LEASE_TIMEOUT
+        self.max_attempts = max_attempts or cfg.DISTRIBUTED_MAX_ATTEMPTS
+
+        self.lock = threading.Lock()
+        self.pending = deque(range(len(test_cases)))
+        self.leases = {}                # (worker, lease deadline) by job id
+        self.attempts = [0] * len(test_cases)
+        self.summaries = {}             # Summary of the completed jobs by job id
+        self.failures = {}              # Last error of the jobs that ran out of attempts, by job id
+        self.finished = threading.Event()
+
+    def _expire_leases(self):
+        now = time.monotonic()
+        for job_id, (worker, deadline) in list(self.leases.items()):
+            if deadline < now:
+                print(f"Lease of job {job_id} by {worker} expired")
+                del self.leases[job_id]
+                self._retry(job_id, f"lease expired ({worker})")
+
+    def _retry(self, job_id:int, error:str):
+        if self.attempts[job_id] < self.max_attempts:
+            self.pending.appendleft(job_id)
+        else:
+            self.failures[job_id] = error
+            print(f"Job {job_id} failed after {self.attempts[job_id]} attempts: {error}")
+            self._check_finished()
+
+    def _check_finished(self):
+        if len(self.summaries) + len(self.failures) == len(self.test_cases):
+            self.finished.set()
+
+    def _store_artifacts(self, log_path:str, artifacts:dict):
+        os.makedirs(log_path, exist_ok=True)
+        for relative_path, content in artifacts.items():
+            if os.path.isabs(relative_path) or ".." in relative_path.split("/"):
+                raise ValueError(f"Invalid artifact path '{relative_path}'")
+            path = os.path.join(log_path, relative_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(base64.b64decode(content))
+
+    def handle(self, message:dict) -> dict:
+        """
+        Returns the reply to a worker's message
+        """
+        with self.lock:
+            self._expire_leases()
+            kind = message["type"]
+            worker = message.get("worker", "?")
+            job_id = message.get("job_id", None)
+
+            if kind == "request":
+                if self.finished.is_set():
+                    return {"type": "done"}
+                if not self.pending:
+                    return {"type": "wait", "delay": cfg.DISTRIBUTED_POLL_INTERVAL}
+
+                job_id = self.pending.popleft()
+                self.attempts[job_id] += 1
+                self.leases[job_id] = (worker, time.monotonic() + self.lease_timeout)
+                tc_group, _, scenario, baseline = self.test_cases[job_id]
+                return {"type": "job", "job_id": job_id, "tc_group": tc_group, "scenario": scenario, "baseline": baseline,
+                        "cfg": self.cfg_parameters, "lease_timeout": self.lease_timeout}
+
+            if kind == "heartbeat":
+                if self.leases.get(job_id, (None,))[0] == worker:
+                    self.leases[job_id] = (worker, time.monotonic() + self.lease_timeout)
+                    return {"type": "ack"}
+                return {"type": "ack", "lease_lost": True}
+
+            if kind == "result":
+                # Jobs are deterministic, the first result of a job is kept, including results of expired leases
+                if job_id not in self.summaries and job_id not in self.failures:
+                    self._store_artifacts(self.test_cases[job_id][1], message["artifacts"])
+                    self.summaries[job_id] = message["summary"]
+                    self.leases.pop(job_id, None)
+                    if job_id in self.pending:
+                        self.pending.remove(job_id)
+                    print(f"{self.test_cases[job_id][0]}: \"{self.test_cases[job_id][2]['name']}\" completed by {worker}, "
+                          f"saved to {self.test_cases[job_id][1]}")
+                    self._check_finished()
+                return {"type": "ack"}
+
+            if kind == "failed":
+                if self.leases.get(job_id, (None,))[0] == worker:
+                    del self.leases[job_id]
+                    print(f"Job {job_id} failed on {worker}: {message['error']}")
+                    self._retry(job_id, message["error"])
+                return {"type": "ack"}
+
+            return {"type": "error", "error": f"Unknown message type '{kind}'"}
+
+    def serve(self, host:str, port:int):
+        """
+        Serves the jobs until all of them completed or failed
+        """
+        coordinator = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                try:
+                    send_message(self.request, coordinator.handle(receive_message(self.request)))
+                except (ConnectionError, OSError, ValueError) as e:
+                    print(f"Bad request from {self.client_address}: {e}")
+
+        class Server(socketserver.ThreadingTCPServer):
+            allow_reuse_address = True
+            daemon_threads = True
+
+        with Server((host, port), Handler) as server:
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            print(f"Coordinator serving {len(self.test_cases)} jobs on {host}:{server.server_address[1]}")
+
+            # Leases also expire while no worker is connected
+            while not self.finished.wait(min(self.lease_timeout, cfg.DISTRIBUTED_POLL_INTERVAL)):
+                with self.lock:
+                    self._expire_leases()
+
+            # Let the polling workers know the work is done
+            time.sleep(cfg.DISTRIBUTED_POLL_INTERVAL * 2)
+            server.shutdown()
+
+        print(f"{len(self.summaries)} jobs completed, {len(self.failures)} failed")
+
+
+def _heartbeat(address:tuple, worker:str, job_id:int, interval:float, stop:threading.Event):
+    while not stop.wait(interval):
+        try:
+            exchange(address, {"type": "heartbeat", "worker": worker, "job_id": job_id})
+        except OSError:
+            pass                # The coordinator may be busy, the next heartbeat renews the lease
+
+
+def run_job(job:dict) -> tuple:
+    """
+    Runs a job with the SimPy engine and returns its (summary, artifacts)
+    """
+    cfg.override_parameters(job["cfg"])
+    with tempfile.TemporaryDirectory() as log_path:
+        summary = Runner.run_scenario(job["tc_group"], log_path, job["scenario"], job["baseline"])
+
+        artifacts = {}
+        for root, _, files in os.walk(log_path):
+            for file_name in files:
+                path = os.path.join(root, file_name)
+                with open(path, 'rb') as f:
+                    artifacts[os.path.relpath(path, log_path).replace(os.sep, "/")] = base64.b64encode(f.read()).decode()
+    return summary, artifacts
+
+
+def run_worker(address:tuple, worker:str =None):
+    """
+    Pulls and runs jobs from the coordinator until all the jobs are done
+    """
+    worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+    connection_failures = 0
+
+    while True:
+        try:
+            job = exchange(address, {"type": "request", "worker": worker})
+            connection_failures = 0
+        except OSError as e:
+            connection_failures += 1
+            if connection_failures > cfg.DISTRIBUTED_MAX_CONNECTION_FAILURES:
+                print(f"{worker}: coordinator unreachable ({e}), exiting")
+                return
+            time.sleep(cfg.DISTRIBUTED_POLL_INTERVAL)
+            continue
+
+        if job["type"] == "done":
+            print(f"{worker}: all jobs done")
+            return
+        if job["type"] == "wait":
+            time.sleep(job["delay"])
+            continue
+
+        stop = threading.Event()
+        threading.Thread(target=_heartbeat, args=(address, worker, job["job_id"], job["lease_timeout"] / 3, stop),
+                         daemon=True).start()
+        try:
+            summary, artifacts = run_job(job)
+            reply = {"type": "result", "worker": worker, "job_id": job["job_id"], "summary": summary, "artifacts": artifacts}
+        except Exception:
+            reply = {"type": "failed", "worker": worker, "job_id": job["job_id"], "error": traceback.format_exc(limit=3)}
+        finally:
+            stop.set()
+
+        for attempt in range(cfg.DISTRIBUTED_MAX_CONNECTION_FAILURES + 1):
+            try:
+                exchange(address, reply)
+                break
+            except OSError:
+                time.sleep(cfg.DISTRIBUTED_POLL_INTERVAL)
+
+
+if __name__ == '__main__':
+    """
+    Runs the coordinator or a worker
+    """
+    parser = argparse.ArgumentParser(description="Distributed execution of the scenarios")
+    parser.add_argument("role", choices=["coordinator", "worker"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=cfg.DISTRIBUTED_PORT)
+    parser.add_argument("--configurations", default="tc_configurations", help="Configurations directory (coordinator)")
+    parser.add_argument("--lease-timeout", type=float, default=cfg.DISTRIBUTED_LEASE_TIMEOUT)
+    parser.add_argument("--rng", choices=["streams", "crn", "legacy"], default=cfg.RNG_MODE)
+    parser.add_argument("--tracking", choices=["full", "streaming", "windowed"], default=cfg.TRACKING_MODE)
+    parser.add_argument("--event-log", choices=["text", "binary", "both"], default=cfg.EVENT_LOG_FORMAT)
+    args = parser.parse_args()
+
+    if args.role == "coordinator":
+        start_time = f'{datetime.now():%Y-%m-%d %H:%M:%S%z}'.replace(":", "-").replace(" ", "_")
+        cfg_parameters = {"RNG_MODE": args.rng, "TRACKING_MODE": args.tracking, "EVENT_LOG_FORMAT": args.event_log}
+        Coordinator(Runner.collect_test_cases(args.configurations, start_time), cfg_parameters,
+                    args.lease_timeout).serve(args.host, args.port)
+    else:
+        run_worker((args.host, args.port))
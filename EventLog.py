@@ -0,0 +1,281 @@
+"""
+Compact binary event log.
+The file holds a fixed size header, fixed width event records, their arguments and a string table:
+    header:         magic, format version, number of records, offset of the string table, number of arguments,
+                    offset of the arguments
+    records:        RECORD_DTYPE, one per logged event
+    arguments:      ARGUMENT_DTYPE, the message arguments of the records flagged FLAG_ARGUMENTS, in record order
+    string table:   JSON with the activities (function names), the event kinds (level, module, function, line,
+                    message template and number of arguments) and the string arguments referenced by the records
+The message template of an event is stored once, whatever its arguments. A leading "id=%s" customer id goes
+to the record's customer_id, the other int, float and str arguments to the arguments section. Messages with
+arguments of other types are stored formatted.
+The string table is only known once the log is complete, it is written once when the log is closed and
+located through the header. The arguments are spooled to a temporary file until then.
+"""
+
+import os
+import sys
+import json
+import shutil
+import struct
+import logging
+import numpy as np
+import Logger
+
+
+MAGIC = b"EWSEVLOG"
+VERSION = 2
+HEADER = struct.Struct("<8sIQQQQ")
+
+RECORD_DTYPE = np.dtype([
+    ("sim_time", "<f8"),
+    ("customer_id", "<i8"),         # -1 when the message has no id argument
+    ("activity_id", "<u2"),         # Index in the activities table
+    ("event_id", "<u2"),            # Index in the events table, the event kind identifies the outcome
+    ("level", "u1"),                # logging level
+    ("flags", "u1"),
+])
+
+FLAG_INTEGER_TIME = 1               # sim_time was an integer (customer arrivals)
+FLAG_NO_SIM_TIME = 2                # Event logged outside of a simulation
+FLAG_CUSTOMER_ARG = 4               # Message template is formatted with customer_id
+FLAG_ARGUMENTS = 8                  # Message template is formatted with the event's next arguments (after customer_id)
+
+ARGUMENT_DTYPE = np.dtype([
+    ("kind", "u1"),
+    ("value", "<i8"),               # int, bits of the float, or index in the strings table
+])
+ARGUMENT_INT = 0
+ARGUMENT_FLOAT = 1
+ARGUMENT_STRING = 2
+INT64_RANGE = (-2 ** 63, 2 ** 63)
+
+
+def _is_int(value) -> bool:
+    return type(value) is int and INT64_RANGE[0] <= value < INT64_RANGE[1]
+
+
+class BinaryEventHandler(logging.Handler):
+    """
+    Logging handler writing the records to a binary event log
+    """
+
+    BUFFER_SIZE = 4096              # Number of records written to the file at once
+
+    def __init__(self, path:str):
+        """
+        Constructor
+        """
+        super().__init__()
+        self.path = path
+        self._file = open(path, 'wb')
+        self._file.write(HEADER.pack(MAGIC, VERSION, 0, 0, 0, 0))
+        self._arguments_path = f"{path}.arguments"
+        self._arguments_file = open(self._arguments_path, 'w+b')
+
+        self._buffer = np.zeros(self.BUFFER_SIZE, dtype=RECORD_DTYPE)
+        self._buffered = 0
+        self.record_count = 0
+        self._arguments = np.zeros(self.BUFFER_SIZE, dtype=ARGUMENT_DTYPE)
+        self._arguments_buffered = 0
+        self.argument_count = 0
+
+        self._activities = {}
+        self._events = {}
+        self._strings = {}
+
+    def _intern(self, table:dict, key) -> int:
+        index = table.get(key, None)
+        if index is None:
+            index = len(table)
+            table[key] = index
+        return index
+
+    def emit(self, record):
+        try:
+            flags = 0
+            sim_time = getattr(record, "sim_time", None)
+            if sim_time is None:
+                flags |= FLAG_NO_SIM_TIME
+                sim_time = np.nan
+            elif isinstance(sim_time, int):
+                flags |= FLAG_INTEGER_TIME
+
+            customer_id = -1
+            template = record.msg
+            arguments = record.args if isinstance(record.args, tuple) and isinstance(template, str) else None
+            if arguments and _is_int(arguments[0]) and (len(arguments) == 1 or template.startswith("id=%s")):
+                flags |= FLAG_CUSTOMER_ARG
+                customer_id = arguments[0]
+                arguments = arguments[1:]
+            if arguments and all(_is_int(argument) or type(argument) in (float, str) for argument in arguments):
+                flags |= FLAG_ARGUMENTS
+                for argument in arguments:
+                    self._add_argument(argument)
+            elif arguments is None or arguments:
+                flags &= ~FLAG_CUSTOMER_ARG
+                customer_id = -1
+                template = record.getMessage()
+                arguments = ()
+
+            event_id = self._intern(self._events, (record.levelname, record.name, record.funcName, record.lineno, template,
+                                                   len(arguments)))
+            activity_id = self._intern(self._activities, record.funcName)
+
+            self._buffer[self._buffered] = (sim_time, customer_id, activity_id, event_id, record.levelno, flags)
+            self._buffered += 1
+            if self._buffered == self.BUFFER_SIZE:
+                self._flush_buffer()
+        except Exception:
+            self.handleError(record)
+
+    def _add_argument(self, argument):
+        if isinstance(argument, str):
+            self._arguments[self._arguments_buffered] = (ARGUMENT_STRING, self._intern(self._strings, argument))
+        elif isinstance(argument, float):
+            self._arguments[self._arguments_buffered] = (ARGUMENT_FLOAT, np.float64(argument).view(np.int64))
+        else:
+            self._arguments[self._arguments_buffered] = (ARGUMENT_INT, argument)
+        self._arguments_buffered += 1
+        if self._arguments_buffered == self.BUFFER_SIZE:
+            self._flush_arguments()
+
+    def _flush_buffer(self):
+        self._file.write(self._buffer[:self._buffered].tobytes())
+        self.record_count += self._buffered
+        self._buffered = 0
+
+    def _flush_arguments(self):
+        self._arguments_file.write(self._arguments[:self._arguments_buffered].tobytes())
+        self.argument_count += self._arguments_buffered
+        self._arguments_buffered = 0
+
+    def close(self):
+        """
+        Writes the pending records, the string table and the final header
+        """
+        self.acquire()
+        try:
+            if self._file is not None:
+                self._flush_buffer()
+                self._flush_arguments()
+
+                argument_offset = self._file.tell()
+                self._arguments_file.seek(0)
+                shutil.copyfileobj(self._arguments_file, self._file)
+                self._arguments_file.close()
+                os.remove(self._arguments_path)
+
+                string_table = {
+                    "activities": list(self._activities),
+                    "events": [dict(zip(("levelname", "module", "funcName", "lineno", "message", "arg_count"), event))
+                               for event in self._events],
+                    "strings": list(self._strings),
+                }
+                table_offset = self._file.tell()
+                self._file.write(json.dumps(string_table).encode())
+
+                self._file.seek(0)
+                self._file.write(HEADER.pack(MAGIC, VERSION, self.record_count, table_offset, self.argument_count,
+                                             argument_offset))
+                self._file.close()
+                self._file = None
+        finally:
+            self.release()
+        super().close()
+
+
+class EventLog:
+    """
+    Reader of a binary event log. The records are memory mapped as a numpy structured array.
+    """
+
+    TEXT_CHUNK_SIZE = 65536         # Number of records converted to text at once
+
+    def __init__(self, path:str):
+        """
+        Constructor
+        """
+        with open(path, 'rb') as f:
+            magic, version, record_count, table_offset, argument_count, argument_offset = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a binary event log (version {VERSION})")
+
+            f.seek(table_offset)
+            string_table = json.loads(f.read())
+
+        self.path = path
+        self.activities = string_table["activities"]
+        self.events = string_table["events"]
+        self.strings = string_table["strings"]
+        if record_count:
+            self.records = np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=HEADER.size, shape=(record_count,))
+        else:
+            self.records = np.zeros(0, dtype=RECORD_DTYPE)
+        if argument_count:
+            self.arguments = np.memmap(path, dtype=ARGUMENT_DTYPE, mode='r', offset=argument_offset, shape=(argument_count,))
+        else:
+            self.arguments = np.zeros(0, dtype=ARGUMENT_DTYPE)
+
+    def __len__(self):
+        return len(self.records)
+
+    def text_lines(self):
+        """
+        Yields the events in the text format of the event log (Logger.LOG_FORMAT)
+        """
+        arg_counts = np.array([event["arg_count"] for event in self.events], dtype=np.int64)
+        next_argument = 0
+        for first in range(0, len(self.records), self.TEXT_CHUNK_SIZE):
+            chunk = self.records[first:first + self.TEXT_CHUNK_SIZE]
+            counts = np.where(chunk["flags"] & FLAG_ARGUMENTS, arg_counts[chunk["event_id"]] if len(arg_counts) else 0, 0)
+            arguments = self._argument_values(next_argument, int(counts.sum()))
+            next_argument += int(counts.sum())
+            position = 0
+            for record, count in zip(chunk.tolist(), counts.tolist()):
+                yield self._text_line(*record, arguments[position:position + count])
+                position += count
+
+    def _argument_values(self, first:int, count:int) -> list:
+        values = []
+        for kind, value in self.arguments[first:first + count].tolist():
+            if kind == ARGUMENT_STRING:
+                values.append(self.strings[value])
+            elif kind == ARGUMENT_FLOAT:
+                values.append(float(np.int64(value).view(np.float64)))
+            else:
+                values.append(value)
+        return values
+
+    def _text_line(self, sim_time:float, customer_id:int, activity_id:int, event_id:int, level:int, flags:int,
+                   arguments:list =()) -> str:
+        event = self.events[event_id]
+
+        if flags & FLAG_NO_SIM_TIME:
+            sim_time = None
+        elif flags & FLAG_INTEGER_TIME:
+            sim_time = int(sim_time)
+
+        message = event["message"]
+        if flags & (FLAG_CUSTOMER_ARG | FLAG_ARGUMENTS):
+            message = message % (((customer_id,) if flags & FLAG_CUSTOMER_ARG else ()) + tuple(arguments))
+
+        return Logger.LOG_FORMAT % {"sim_time": sim_time, "levelname": event["levelname"], "name": event["module"],
+                                    "funcName": event["funcName"], "lineno": event["lineno"], "message": message}
+
+    def to_text(self, path:str):
+        """
+        Converts the binary event log to the text format
+        """
+        with open(path, 'wt') as f:
+            for line in self.text_lines():
+                f.write(f"{line}\n")
+
+
+if __name__ == '__main__':
+    """
+    Prints a binary event log in the text format
+    """
+    for line in EventLog(sys.argv[1]).text_lines():
+        print(line)
@@ -0,0 +1,331 @@
+"""
+Vectorized Monte Carlo estimation of the support flow.
+When the shared resources (bots, updaters, DB connections and archives connections) are not saturated, customers
+never wait and the flow of each customer is an independent probability tree. The whole tree is sampled for many
+customers at once with numpy array operations, instead of simulating every event.
+"""
+
+import os
+import sys
+import math
+import argparse
+import tempfile
+import contextlib
+from math import ceil
+import numpy as np
+import cfg
+import Runner
+
+
+class RuntimeStatistics:
+    """
+    Runtime duration statistics of an activity, accumulated over batches of samples
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.total_squares = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, samples:np.ndarray):
+        if len(samples) == 0:
+            return
+        self.count += len(samples)
+        self.total += float(samples.sum())
+        self.total_squares += float(np.square(samples).sum())
+        self.min = min(self.min, float(samples.min()))
+        self.max = max(self.max, float(samples.max()))
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count
+
+    @property
+    def std_deviation(self) -> float:
+        if self.count < 2:
+            return 0.0
+        return math.sqrt(max(0.0, (self.total_squares - self.count * self.mean ** 2) / (self.count - 1)))
+
+
+class FastPathEstimator:
+    """
+    Samples the support flow of customers in batches, with the cfg parameters and the scenario overrides
+    currently applied to the cfg module
+    """
+
+    OUTCOMES = ["not_registered", "solved_by_configuration", "solved_by_reboot", "solved_by_update", "hw_issue",
+                "solved_by_archives", "unsolved"]
+
+    def __init__(self, seed:int):
+        """
+        Constructor
+        """
+        self.rng = np.random.default_rng(seed)
+        self.customers = 0
+        self.runtimes = {}                  # RuntimeStatistics by activity name
+        self.outcomes = dict.fromkeys(self.OUTCOMES, 0)
+        self.db_busy_time = 0.0             # Total time DB connections are held by customers
+        self.archives_calls = 0
+
+    def _durations(self, avg_time:float, size:int) -> np.ndarray:
+        """
+        Vectorized SimUtils.random_std_deviation()
+        """
+        return np.maximum(1, self.rng.normal(avg_time, ceil(avg_time * 0.1), size))
+
+    def _executions(self, failure_probability:float, size:int) -> np.ndarray:
+        """
+        Number of executions of RetryWrapper loops: the first execution, then one more as long as a failure occurs
+        """
+        return self.rng.geometric(1 - failure_probability, size)
+
+    def _activity(self, name:str, durations:np.ndarray) -> np.ndarray:
+        self.runtimes.setdefault(name, RuntimeStatistics()).add(durations)
+        return durations
+
+    def _retried_durations(self, avg_time:float, executions:np.ndarray) -> np.ndarray:
+        """
+        Total duration of retried operations, for each customer
+        """
+        owners = np.repeat(np.arange(len(executions)), executions)
+        return np.bincount(owners, weights=self._durations(avg_time, len(owners)), minlength=len(executions))
+
+    def _is_registered(self, size:int) -> tuple:
+        """
+        Samples Customer.is_registered(), returns the (durations, registered) of each customer
+        """
+        iterations = self._executions(cfg.probability_of_high_level_failure, size)
+        owners = np.repeat(np.arange(size), iterations)
+
+        # DB identification on each iteration
+        durations = self._durations(cfg.AVG_DB_QUERY_TIME, len(owners))
+        db_time = durations.sum()
+        identified = self.rng.random(len(owners)) > cfg.FAILED_IDENTIFICATION_RATE
+
+        # Registration of unidentified customers
+        registering = np.flatnonzero(~identified)
+        register_time = self._durations(cfg.REGISTER_NEW_CUSTOMER, len(registering))
+        registered = self.rng.random(len(registering)) > cfg.REGISTRATION_FAILURE_RATE
+        inserts = self._retried_durations(cfg.AVG_DB_INSERT_TIME, np.where(
+            registered, self._executions(cfg.probability_of_high_level_failure, len(registering)), 0))
+        register_time = self._activity("register_new_customer", register_time + inserts)
+        db_time += inserts.sum()
+        durations[registering] += register_time
+
+        result = identified
+        result[registering] = registered
+
+        # The result of a customer is the result of its last iteration
+        last_iterations = np.cumsum(iterations) - 1
+        self.db_busy_time += db_time
+        return self._activity("is_registered", np.bincount(owners, weights=durations, minlength=size)), result[last_iterations]
+
+    def _is_problem_solved(self, customers:np.ndarray, durations:np.ndarray) -> np.ndarray:
+        """
+        Samples DigitalCallCenter.is_problem_solved() for the customers, returns the customers that are not solved
+        """
+        durations[customers] += self._activity("is_problem_solved", self._durations(cfg.AVG_CHECK_PROBLEM_SOLVED_TIME, len(customers)))
+        return customers[self.rng.random(len(customers)) >= cfg.PROBLEM_SOLVED_PROBABILITY]
+
+    def _step(self, name:str, avg_time:float, customers:np.ndarray, durations:np.ndarray):
+        durations[customers] += self._activity(name, self._durations(avg_time, len(customers)))
+
+    def _support(self, size:int) -> np.ndarray:
+        """
+        Samples DigitalCallCenter.support(), returns the durations of each customer
+        """
+        durations = np.zeros(size)
+        active = np.arange(size)
+
+        self._step("is_config_correct", cfg.AVG_CHECK_CONFIG_TIME, active, durations)
+        misconfigured = self.rng.random(size) < cfg.REQUIRED_DEVICE_RECONFIGURATION
+        configured = active[~misconfigured]
+        configuring = active[misconfigured]
+
+        if 1 in cfg.enable_path_changes:
+            self._step("configure_device", cfg.AVG_CONF_TIME, configuring, durations)
+            self._step("reset_cashed_memory", cfg.AVG_RESET_CASH_TIME, configuring, durations)
+            unsolved = self._is_problem_solved(configuring, durations)
+        else:
+            self._step("reset_cashed_memory", cfg.AVG_RESET_CASH_TIME, configuring, durations)
+            unsolved = self._is_problem_solved(configuring, durations)
+            self._step("configure_device", cfg.AVG_CONF_TIME, unsolved, durations)
+        self.outcomes["solved_by_configuration"] += len(configuring) - len(unsolved)
+        active = np.sort(np.concatenate([configured, unsolved]))
+
+        if 2 in cfg.enable_path_changes:
+            rebooting = self.rng.random(len(active)) <= cfg.NEEDS_REBOOT_PROBABILITY
+            self._step("reboot_device", cfg.AVG_REBOOT_TIME, active[rebooting], durations)
+            unsolved = self._is_problem_solved(active[rebooting], durations)
+            self.outcomes["solved_by_reboot"] += int(rebooting.sum()) - len(unsolved)
+            active = np.sort(np.concatenate([active[~rebooting], unsolved]))
+
+        durations[active] += self._activity("initiate_diagnostic", self._retried_durations(
+            cfg.AVG_DIAGNOSTIC_TIME, self._executions(cfg.probability_of_low_level_failure, len(active))))
+
+        self._step("is_upgrade_needed", cfg.AVG_CHECK_UPDATE_NEEDED_TIME, active, durations)
+        updating = self.rng.random(len(active)) < cfg.REQUIRED_DEVICE_UPDATE
+        self._step("update_software", cfg.AVG_UPDATE_TIME, active[updating], durations)
+        unsolved = self._is_problem_solved(active[updating], durations)
+        self.outcomes["solved_by_update"] += int(updating.sum()) - len(unsolved)
+        active = np.sort(np.concatenate([active[~updating], unsolved]))
+
+        self._step("is_hw_issue", cfg.AVG_HW_DIAGNOSTIC_TIME, active, durations)
+        hw_issue = self.rng.random(len(active)) < 0.1
+        self.outcomes["hw_issue"] += int(hw_issue.sum())
+        active = active[~hw_issue]
+
+        durations[active] += self._activity("query_remote_archives", self._durations(
+            cfg.REMOTE_LEGACY_ARCHIVES_RESPONSE_TIME, len(active)) * cfg.under_performance_factor)
+        self.archives_calls += len(active)
+        unsolved = self._is_problem_solved(active, durations)
+        self.outcomes["solved_by_archives"] += len(active) - len(unsolved)
+        self.outcomes["unsolved"] += len(unsolved)
+
+        return self._activity("support", durations)
+
+    def sample(self, customers:int):
+        """
+        Samples the flow of additional customers
+        """
+        for first in range(0, customers, cfg.FAST_PATH_BATCH_SIZE):
+            size = min(cfg.FAST_PATH_BATCH_SIZE, customers - first)
+            _, registered = self._is_registered(size)
+            self.outcomes["not_registered"] += size - int(registered.sum())
+            self._support(int(registered.sum()))
+            self._activity("update_incident", self._durations(cfg.AVG_INCIDENT_UPDATE_TIME, int(registered.sum())))
+            self.customers += size
+
+    def summary(self) -> dict:
+        """
+        Returns the estimated statistics, with the keys of QueueSizeTracker.summary() for the runtimes
+        """
+        summary = {}
+        for name, statistics in self.runtimes.items():
+            if statistics.count:
+                summary[f"runtime.{name}.max"] = statistics.max
+                summary[f"runtime.{name}.min"] = statistics.min
+                summary[f"runtime.{name}.mean"] = statistics.mean
+                summary[f"runtime.{name}.count"] = statistics.count
+        for outcome, count in self.outcomes.items():
+            summary[f"outcome.{outcome}"] = count / self.customers
+        return summary
+
+    def resource_loads(self) -> dict:
+        """
+        Returns the offered load (average number of busy servers) of each shared resource, for the customers
+        arrival rate, and the probability that a request waits for it (Erlang C)
+        """
+        arrival_rate = 1 / cfg.CUSTOMER_INTERVAL
+
+        def mean_runtime(name):
+            statistics = self.runtimes.get(name, None)
+            return statistics.total / self.customers if statistics else 0.0
+
+        # The maintenance process holds a DB connection during step 2 of its cycle
+        maintenance_cycle = (cfg.MAINTENANCE_STEP_1_DURATION / cfg.task_over_performance_factor +
+                             cfg.MAINTENANCE_STEP_2_DB_DURATION +
+                             cfg.MAINTENANCE_STEP_3_DURATION / cfg.task_over_performance_factor)
+
+        loads = {
+            "bots": (cfg.NUM_OF_BOTS, arrival_rate * mean_runtime("support")),
+            "updaters": (cfg.NUM_OF_UPDATERS, arrival_rate * mean_runtime("update_incident")),
+            "legacy_archives_connections": (cfg.NUM_OF_REMOTE_LEGACY_ARCHIVES_CONNECTIONS,
+                                            arrival_rate * mean_runtime("query_remote_archives")),
+            "db_connections": (cfg.NUM_OF_DB_CONNECTIONS,
+                               arrival_rate * self.db_busy_time / self.customers +
+                               cfg.MAINTENANCE_STEP_2_DB_DURATION / maintenance_cycle),
+        }
+
+        return {name: {"servers": servers, "offered_load": load, "utilization": load / servers,
+                       "wait_probability": erlang_c(servers, load)}
+                for name, (servers, load) in loads.items()}
+
+    def contended_resources(self) -> list:
+        """
+        Returns the resources whose wait probability makes the fast path estimation invalid
+        """
+        return [name for name, load in self.resource_loads().items()
+                if load["wait_probability"] > cfg.FAST_PATH_MAX_WAIT_PROBABILITY]
+
+
+def erlang_c(servers:int, offered_load:float) -> float:
+    """
+    Probability that a request waits for one of the servers (M/M/c queue)
+    """
+    if offered_load >= servers:
+        return 1.0
+
+    # Erlang B recursion, numerically stable for many servers
+    blocking = 1.0
+    for k in range(1, servers + 1):
+        blocking = offered_load * blocking / (k + offered_load * blocking)
+    return blocking / (1 - offered_load / servers * (1 - blocking))
+
+
+def estimate_scenario(scenario:dict, customers:int =None, seed:int =None) -> FastPathEstimator:
+    """
+    Estimates a scenario with the fast path, returns the estimator holding the results
+    """
+    cfg.apply_scenario(scenario)
+    estimator = FastPathEstimator(scenario["random_seed"] if seed is None else seed)
+    estimator.sample(customers or cfg.FAST_PATH_CUSTOMERS)
+    return estimator
+
+
+def cross_check(scenario:dict, customers:int =None, tolerance:float =None) -> list:
+    """
+    Compares the fast path estimation of the mean activity runtimes with a run of the SimPy engine.
+    Returns (metric, simpy value, fast path value, relative difference, within tolerance) rows.
+    """
+    tolerance = tolerance or cfg.FAST_PATH_TOLERANCE
+
+    log_level = cfg.LOG_LEVEL
+    cfg.override_parameters({"LOG_LEVEL": "WARNING"})
+    try:
+        with tempfile.TemporaryDirectory() as log_path, open(os.devnull, 'w') as devnull, \
+                contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+            simulated = Runner.run_scenario("cross_check", log_path, scenario)
+    finally:
+        cfg.override_parameters({"LOG_LEVEL": log_level})
+    estimated = estimate_scenario(scenario, customers).summary()
+
+    rows = []
+    for metric in sorted(simulated):
+        if metric.startswith("runtime.") and metric.endswith(".mean") and metric in estimated:
+            difference = (estimated[metric] - simulated[metric]) / simulated[metric]
+            rows.append((metric, simulated[metric], estimated[metric], difference, abs(difference) <= tolerance))
+    return rows
+
+
+if __name__ == '__main__':
+    """
+    Estimates the scenarios of a configuration file with the fast path
+    """
+    parser = argparse.ArgumentParser(description="Vectorized Monte Carlo estimation of the support flow")
+    parser.add_argument("configuration_file")
+    parser.add_argument("--customers", type=int, default=cfg.FAST_PATH_CUSTOMERS)
+    parser.add_argument("--cross-check", action="store_true", help="Compare with a run of the SimPy engine")
+    args = parser.parse_args()
+
+    for _scenario in cfg.load_scenarios_from_file(args.configuration_file, verbose=False):
+        _estimator = estimate_scenario(_scenario, args.customers)
+
+        print(f"\n{_scenario['name']}: {_estimator.customers} customers")
+        for key, value in _estimator.summary().items():
+            print(f"{key: <40}: {value}")
+
+        print("\nResources:")
+        for name, load in _estimator.resource_loads().items():
+            print(f"{name: <28}: servers={load['servers']} utilization={load['utilization']:.3f} "
+                  f"wait probability={load['wait_probability']:.4f}")
+        contended = _estimator.contended_resources()
+        if contended:
+            print(f"WARNING: resource contention ({', '.join(contended)}), fast path results are not valid", file=sys.stderr)
+
+        if args.cross_check:
+            print("\nCross check with the SimPy engine:")
+            for metric, simulated, estimated, difference, ok in cross_check(_scenario, args.customers):
+                print(f"{metric: <40}: simpy={simulated:.3f} fast={estimated:.3f} diff={difference:+.2%} {'' if ok else 'MISMATCH'}")
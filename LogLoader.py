@@ -0,0 +1,345 @@
+"""
+Loader of the simulation outputs into numpy column arrays, for the analysis of many runs.
+    eventLog_{seed}.log / .evl:     sim_time, level, module, function, customer_id (-1: none), kind (logging call site)
+    queue_size_tracking.log:        time, activity, delta (+1 entry, -1 exit)
+    activity_time_log.csv:          activity, runtime (the exhaustive list of execution times)
+Codes index the string tables stored with the columns (modules, functions, kinds, activities), e.g.
+columns["modules"][columns["module"]] are the module names of the events. kind_messages holds a message of
+every kind, without its customer id.
+The text files are memory mapped and split at line boundaries into chunks, parsed by a pool of processes.
+The columns of every file are cached beside it (<file>.npz), and reloaded as long as the file is unchanged.
+"""
+
+import os
+import re
+import time
+import mmap
+import json
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import EventLog
+
+CHUNK_SIZE = 16 * 1024 ** 2         # Bytes of a text file parsed by a single task
+CACHE_SUFFIX = ".npz"
+
+EVENT_LINE = re.compile(rb"^(\S+) (\w+) +(module=\S+ funcName=\S+ lineno=\d+) (?:id=(-?\d+) )?(.*)$", re.M)
+CALL_SITE = re.compile(r"module=(\S+) funcName=(\S+) lineno=(\d+)")
+QUEUE_LINE = re.compile(rb"^([^,\n]+), (\w+), (entry|exit)\r?$", re.M)
+RUNTIMES_HEADER = b"Exhaustive list of execution time:"
+
+
+def file_kind(path:str):
+    """
+    Returns the kind of an output file ("events", "binary_events", "queue", "runtimes"), None if not supported
+    """
+    name = os.path.basename(path)
+    if name.startswith("eventLog_") and name.endswith(".log"):
+        return "events"
+    if name.startswith("eventLog_") and name.endswith(".evl"):
+        return "binary_events"
+    if name == "queue_size_tracking.log":
+        return "queue"
+    if name == "activity_time_log.csv":
+        return "runtimes"
+    return None
+
+
+def _read_range(path:str, start:int, end:int) -> bytes:
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        return data[start:end]
+
+
+def chunk_ranges(path:str, chunk_size:int =CHUNK_SIZE) -> list:
+    """
+    Returns the (start, end) byte ranges of the chunks of a text file, ending at line boundaries
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    ranges = []
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        start = 0
+        while start < size:
+            end = data.find(b"\n", min(start + chunk_size, size) - 1) + 1 or size
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def _codes(values:list) -> tuple:
+    """
+    Returns the (table, codes) of a list of byte strings
+    """
+    table, codes = np.unique(np.array(values, dtype=bytes), return_inverse=True)
+    return [value.decode() for value in table], codes.astype(np.uint16)
+
+
+def _parse_events(path:str, start:int, end:int) -> dict:
+    rows = EVENT_LINE.findall(_read_range(path, start, end))
+    if not rows:
+        return None
+    times, levels, sites, customer_ids, messages = zip(*rows)
+
+    sim_time = np.array(times, dtype=bytes)
+    sim_time[sim_time == b"None"] = b"nan"
+    customer_id = np.array(customer_ids, dtype=bytes)
+    customer_id[customer_id == b""] = b"-1"
+
+    level_names, level_codes = _codes(levels)
+    kind_table, first_rows, kind_codes = np.unique(np.array(sites, dtype=bytes), return_index=True, return_inverse=True)
+    kind_table = [site.decode() for site in kind_table]
+
+    # The module and function of an event follow from its call site
+    kind_sites = [CALL_SITE.match(site).groups() for site in kind_table]
+    module_table = sorted({module for module, _, _ in kind_sites})
+    function_table = sorted({function for _, function, _ in kind_sites})
+    kind_modules = np.array([module_table.index(module) for module, _, _ in kind_sites], dtype=np.uint16)
+    kind_functions = np.array([function_table.index(function) for _, function, _ in kind_sites], dtype=np.uint16)
+
+    return {
+        "sim_time": sim_time.astype(np.float64),
+        "level": np.array([logging.getLevelName(name) for name in level_names], dtype=np.uint8)[level_codes],
+        "module": kind_modules[kind_codes],
+        "function": kind_functions[kind_codes],
+        "customer_id": customer_id.astype(np.int64),
+        "kind": kind_codes.astype(np.uint16),
+        "modules": module_table,
+        "functions": function_table,
+        "kinds": kind_table,
+        "kind_messages": [messages[row].rstrip(b"\r").decode(errors="replace") for row in first_rows],
+    }
+
+
+def _parse_queue(path:str, start:int, end:int) -> dict:
+    rows = QUEUE_LINE.findall(_read_range(path, start, end))
+    if not rows:
+        return None
+    times, activities, entry_exit = zip(*rows)
+    activity_table, activity_codes = _codes(activities)
+    return {
+        "time": np.array(times, dtype=bytes).astype(np.float64),
+        "activity": activity_codes,
+        "delta": np.where(np.array(entry_exit, dtype=bytes) == b"entry", 1, -1).astype(np.int8),
+        "activities": activity_table,
+    }
+
+
+def _parse_runtimes(path:str, start:int, end:int) -> dict:
+    data = _read_range(path, start, end)
+    position = data.find(RUNTIMES_HEADER)
+    activities, codes, runtimes = [], [], []
+    if position >= 0:
+        for line in data[position + len(RUNTIMES_HEADER):].splitlines():
+            name, _, values = line.partition(b",")
+            values = values.strip().rstrip(b",")
+            if not name or not values:
+                continue
+            activity_runtimes = np.array(values.split(b","), dtype=bytes).astype(np.float64)
+            codes.append(np.full(len(activity_runtimes), len(activities), dtype=np.uint16))
+            runtimes.append(activity_runtimes)
+            activities.append(name.strip().decode())
+    return {
+        "activity": np.concatenate(codes) if codes else np.zeros(0, dtype=np.uint16),
+        "runtime": np.concatenate(runtimes) if runtimes else np.zeros(0),
+        "activities": activities,
+    }
+
+
+def _call_site(event:dict) -> str:
+    return f"module={event['module']} funcName={event['funcName']} lineno={event['lineno']}"
+
+
+def _load_binary_events(path:str) -> dict:
+    """
+    Returns the columns of a binary event log, with the same tables as the text event log
+    """
+    event_log = EventLog.EventLog(path)
+    events = event_log.events
+    module_table = sorted({event["module"] for event in events})
+    function_table = sorted({event["funcName"] for event in events})
+    kind_messages = {}
+    for event in events:
+        kind_messages.setdefault(_call_site(event), event["message"].removeprefix("id=%s "))
+    kind_table = sorted(kind_messages)
+
+    # Codes of the event kinds of the log, indexed by the event ids of the records
+    event_modules = np.array([module_table.index(event["module"]) for event in events], dtype=np.uint16)
+    event_functions = np.array([function_table.index(event["funcName"]) for event in events], dtype=np.uint16)
+    event_kinds = np.array([kind_table.index(_call_site(event)) for event in events], dtype=np.uint16)
+    records = event_log.records
+    return {
+        "sim_time": np.array(records["sim_time"]),
+        "level": np.array(records["level"]),
+        "module": event_modules[records["event_id"]],
+        "function": event_functions[records["event_id"]],
+        "customer_id": np.array(records["customer_id"]),
+        "kind": event_kinds[records["event_id"]],
+        "modules": module_table,
+        "functions": function_table,
+        "kinds": kind_table,
+        "kind_messages": [kind_messages[kind] for kind in kind_table],
+    }
+
+
+PARSERS = {
+    "events": _parse_events,
+    "queue": _parse_queue,
+    "runtimes": _parse_runtimes,
+}
+# Code columns and the string table they index, by file kind
+TABLES = {
+    "events": {"module": "modules", "function": "functions", "kind": "kinds"},
+    "queue": {"activity": "activities"},
+    "runtimes": {"activity": "activities"},
+}
+
+
+def _merge(kind:str, parts:list) -> dict:
+    """
+    Merges the columns of the chunks of a file, recoding their codes against merged string tables
+    """
+    parts = [part for part in parts if part is not None]
+    if not parts:
+        return _parse_empty(kind)
+    if len(parts) == 1:
+        columns = parts[0]
+    else:
+        columns = {}
+        for code_column, table_name in TABLES[kind].items():
+            table = sorted(set().union(*(part[table_name] for part in parts)))
+            index = {value: i for i, value in enumerate(table)}
+            columns[code_column] = np.concatenate([np.array([index[value] for value in part[table_name]], dtype=np.uint16)[part[code_column]]
+                                                   for part in parts])
+            if table_name == "kinds":
+                messages = {}
+                for part in parts:
+                    for site, message in zip(part["kinds"], part["kind_messages"]):
+                        messages.setdefault(site, message)
+                columns["kind_messages"] = [messages[site] for site in table]
+            columns[table_name] = table
+        for name, column in parts[0].items():
+            if name not in columns and isinstance(column, np.ndarray):
+                columns[name] = np.concatenate([part[name] for part in parts])
+
+    return {name: np.array(column) if isinstance(column, list) else column for name, column in columns.items()}
+
+
+def _parse_empty(kind:str) -> dict:
+    empty = {
+        "events": {"sim_time": np.zeros(0), "level": np.zeros(0, np.uint8), "module": np.zeros(0, np.uint16),
+                   "function": np.zeros(0, np.uint16), "customer_id": np.zeros(0, np.int64), "kind": np.zeros(0, np.uint16),
+                   "modules": [], "functions": [], "kinds": [], "kind_messages": []},
+        "queue": {"time": np.zeros(0), "activity": np.zeros(0, np.uint16), "delta": np.zeros(0, np.int8), "activities": []},
+        "runtimes": {"activity": np.zeros(0, np.uint16), "runtime": np.zeros(0), "activities": []},
+    }[kind]
+    return {name: np.array(column, dtype=str) if isinstance(column, list) else column for name, column in empty.items()}
+
+
+def _source_stamp(path:str) -> list:
+    status = os.stat(path)
+    return [status.st_size, status.st_mtime_ns]
+
+
+def load_cached(path:str):
+    """
+    Returns the cached columns of a file, None if there is no cache or the file changed since
+    """
+    cache_path = path + CACHE_SUFFIX
+    try:
+        with np.load(cache_path, allow_pickle=False) as cache:
+            if cache["source_stamp"].tolist() != _source_stamp(path):
+                return None
+            return {name: cache[name] for name in cache.files if name != "source_stamp"}
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def save_cache(path:str, columns:dict):
+    """
+    Stores the columns of a file beside it, written to a temporary file first so readers never see a partial cache
+    """
+    temporary_path = f"{path}.{os.getpid()}.tmp{CACHE_SUFFIX}"
+    np.savez(temporary_path, source_stamp=np.array(_source_stamp(path), dtype=np.int64), **columns)
+    os.replace(temporary_path, path + CACHE_SUFFIX)
+
+
+def load_files(paths:list, workers:int =None, use_cache:bool =True) -> dict:
+    """
+    Returns the columns of the output files by path. The chunks of all the files that are not cached are parsed
+    by a single pool of workers processes (workers=1: in this process).
+    """
+    workers = workers or os.cpu_count()
+    results = {}
+    tasks = []                      # (path, kind, start, end) of the chunks to parse
+
+    for path in paths:
+        kind = file_kind(path)
+        if kind is None:
+            raise ValueError(f"Unsupported output file '{path}'")
+        columns = load_cached(path) if use_cache else None
+        if columns is not None:
+            results[path] = columns
+        elif kind == "binary_events":
+            results[path] = _merge("events", [_load_binary_events(path)])
+        elif kind == "runtimes":
+            tasks.append((path, kind, 0, os.path.getsize(path)))
+        else:
+            tasks.extend((path, kind, start, end) for start, end in chunk_ranges(path))
+
+    if workers == 1 or len(tasks) <= 1:
+        parts = [PARSERS[kind](path, start, end) for path, kind, start, end in tasks]
+    else:
+        with ProcessPoolExecutor(min(workers, len(tasks))) as executor:
+            futures = [executor.submit(PARSERS[kind], path, start, end) for path, kind, start, end in tasks]
+            parts = [future.result() for future in futures]
+
+    chunks = {}
+    for (path, kind, _, _), part in zip(tasks, parts):
+        chunks.setdefault(path, (kind, []))[1].append(part)
+    for path in paths:
+        if path in chunks:
+            kind, file_parts = chunks[path]
+            results[path] = _merge(kind, file_parts)
+        if use_cache and (path in chunks or file_kind(path) == "binary_events"):
+            save_cache(path, results[path])
+
+    return results
+
+
+def load_file(path:str, workers:int =None, use_cache:bool =True) -> dict:
+    """
+    Returns the columns of an output file
+    """
+    return load_files([path], workers, use_cache)[path]
+
+
+def load_tree(root:str, workers:int =None, use_cache:bool =True) -> dict:
+    """
+    Returns the columns of all the supported output files under root (e.g. a Test Cases/<timestamp> folder),
+    by path relative to root
+    """
+    paths = []
+    for directory, _, files in os.walk(root):
+        paths.extend(os.path.join(directory, name) for name in sorted(files) if file_kind(name) is not None)
+    return {os.path.relpath(path, root): columns for path, columns in load_files(paths, workers, use_cache).items()}
+
+
+if __name__ == '__main__':
+    """
+    Loads an output folder (and caches its columns), prints the number of rows of every kind of file
+    """
+    parser = argparse.ArgumentParser(description="Load the simulation outputs into numpy columns")
+    parser.add_argument("root", help="Output folder, e.g. '../Test Cases/<timestamp>'")
+    parser.add_argument("-j", "--workers", type=int, default=0, help="Parsing processes (0: one per CPU core)")
+    parser.add_argument("--no-cache", action="store_true", help="Parse the files even if their columns are cached")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    _loaded = load_tree(args.root, args.workers or None, not args.no_cache)
+    rows = {}
+    for _path, _columns in _loaded.items():
+        _kind = file_kind(_path)
+        rows[_kind] = rows.get(_kind, 0) + len(next(iter(_columns.values())))
+    print(f"Loaded {len(_loaded)} files in {time.perf_counter() - start:.2f} s: {json.dumps(rows)}")
@@ -1,27 +1,94 @@
 import os
+import queue
 import logging
+import logging.handlers
+import EventLog
 
 logger = logging.getLogger(__name__)
 
+LOG_FORMAT = '%(sim_time)s %(levelname)s  module=%(name)s funcName=%(funcName)s lineno=%(lineno)d %(message)s'
 
-class SimTimeFilter(logging.Filter):
-    """A custom logging filter to add `env.now` as a log attribute."""
-    def __init__(self, env):
-        super().__init__()
-        self.env = env
+_sim_env = None             # Environment whose simulated time is injected into the log records
+_listener = None            # Background writer of the current log
+_handlers = []              # Handlers of the current log
+_default_record_factory = logging.getLogRecordFactory()
 
-    def filter(self, record):
-        # Inject the simulated time (`env.now`) into the log record
-        record.sim_time = self.env.now
-        return True
 
+def _sim_time_record_factory(*args, **kwargs):
+    """
+    Creates the log records, adding `env.now` as a log attribute.
+    Records are only created for enabled levels, so the simulated time is injected once per emitted record.
+    """
+    record = _default_record_factory(*args, **kwargs)
+    record.sim_time = _sim_env.now if _sim_env is not None else None
+    return record
 
-def logger_config(log_path, seed):
-    global logger
 
-    os.makedirs(log_path, exist_ok=True)
+logging.setLogRecordFactory(_sim_time_record_factory)
 
-    logging.basicConfig(handlers=[logging.StreamHandler(), logging.FileHandler(f'{log_path}/eventLog_{seed}.log')],
-                        level=logging.DEBUG, format='%(sim_time)s %(levelname)s  module=%(name)s funcName=%(funcName)s lineno=%(lineno)d %(message)s', force=True)
 
+def set_sim_env(env):
+    """
+    Sets the simulation environment whose simulated time is added to the log records
+    """
+    global _sim_env
+    _sim_env = env
 
+
+class _RecordQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands the records over to the background writer as is, formatting is done by the writer thread.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def logger_config(log_path, seed, level=logging.DEBUG, event_log_format="text", background=True):
+    """
+    Directs the log of a simulation run to the console and to the event log in log_path:
+    eventLog_{seed}.log in "text" format, eventLog_{seed}.evl in "binary" format (see EventLog) or "both".
+    Without log_path, the log is only directed to the console.
+    Records are written by a background thread, so the simulation never waits on the file I/O, or by the
+    simulation thread itself without background.
+    """
+    global _listener, _handlers
+
+    logger_close()
+    if log_path is None:
+        event_log_format = None
+    else:
+        os.makedirs(log_path, exist_ok=True)
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if event_log_format in ("text", "both"):
+        handlers.append(logging.FileHandler(f'{log_path}/eventLog_{seed}.log'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    if event_log_format in ("binary", "both"):
+        handlers.append(EventLog.BinaryEventHandler(f'{log_path}/eventLog_{seed}.evl'))
+
+    _handlers = handlers
+    if not background:
+        logging.basicConfig(handlers=handlers, level=level, force=True)
+        return
+    _listener = logging.handlers.QueueListener(queue.SimpleQueue(), *handlers)
+    logging.basicConfig(handlers=[_RecordQueueHandler(_listener.queue)], level=level, force=True)
+    _listener.start()
+
+
+def logger_close():
+    """
+    Writes the pending records and closes the log of the current simulation run
+    """
+    global _listener, _handlers
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    for handler in _handlers:
+        logging.getLogger().removeHandler(handler)
+        handler.close()
+    _handlers = []
+    set_sim_env(None)
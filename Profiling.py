@@ -0,0 +1,169 @@
+"""
+Profiling of the simulation runs (cfg.PROFILE, --profile).
+A profiled run stores next to its log, in the scenario's folder:
+    profile.prof:               cProfile statistics (python -m pstats profile.prof, snakeviz...)
+    profile.txt:                the most expensive functions and the time spent in the instrumentation
+    memory_profile.txt:         peak traced memory and the largest allocation sites (tracemalloc)
+    activity_wall_time.csv:     wall clock time spent in the generator steps of every activity's model code
+"""
+
+import os
+import time
+import pstats
+import cProfile
+import tracemalloc
+import SimUtils
+
+# Instrumentation of the simulation, by source file. SimUtils also holds the random numbers functions.
+INSTRUMENTATION_FILES = {
+    "logging": ("logging", "Logger.py", "EventLog.py"),
+    "tracking and random numbers": ("SimUtils.py",),
+}
+
+
+class ActivityProfile:
+    """
+    Wall clock time spent in the generator steps of the activities (the model code between two yields),
+    as opposed to the simulated time measured by ActivityRunTimeLogger.
+    Inline sub-activities (cfg.INLINE_ACTIVITIES) run their steps inside the steps of their caller: only the
+    innermost running activity is credited with the time and the step, the caller's time excludes the sub-activity.
+    """
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self.calls = [0] * len(SimUtils.activity_names)
+        self.steps = [0] * len(SimUtils.activity_names)
+        self.wall_time = [0.0] * len(SimUtils.activity_names)
+        self.running = []               # [time of the nested steps, a nested activity yielded] of the running steps
+
+    def timed(self, activity_id:int, generator):
+        """
+        Runs an activity's generator, timing each of its steps. The steps of activity_id None are not credited to
+        any activity, only excluded from the time of the calling activity.
+        """
+        if activity_id is not None:
+            self.calls[activity_id] += 1
+        value, error = None, None
+
+        while True:
+            self.running.append([0.0, False])
+            start = time.perf_counter()
+            try:
+                target = generator.send(value) if error is None else generator.throw(error)
+            except StopIteration as stop:
+                self._step(activity_id, start, False)
+                return stop.value
+            except BaseException:
+                self._step(activity_id, start, False)
+                raise
+            self._step(activity_id, start, True)
+
+            try:
+                value, error = (yield target), None
+            except GeneratorExit:
+                generator.close()
+                raise
+            except BaseException as e:
+                value, error = None, e
+
+    def _step(self, activity_id:int, start:float, yielded:bool):
+        elapsed = time.perf_counter() - start
+        nested_time, nested_yielded = self.running.pop()
+        if activity_id is not None:
+            # A step ending on the yield of a nested activity is that activity's step, the final step is the caller's
+            if not nested_yielded or not yielded:
+                self.steps[activity_id] += 1
+            self.wall_time[activity_id] += elapsed - nested_time
+        if self.running:
+            self.running[-1][0] += elapsed
+            self.running[-1][1] = self.running[-1][1] or yielded
+
+    def save_to_folder(self, path:str):
+        with open(os.path.join(path, 'activity_wall_time.csv'), 'wt') as f:
+            s = f"{'Activity': <22}, {'calls': <8}, {'steps': <8}, {'wall_time_s': <22}, {'wall_us_per_call': <22}, {'wall_us_per_step': <22}"
+            f.write(f"{s}\n")
+            for activity_id in sorted(range(len(self.calls)), key=lambda i: -self.wall_time[i]):
+                if self.calls[activity_id]:
+                    wall_time = self.wall_time[activity_id]
+                    # Inline callers still running at the end may have no step of their own
+                    per_step = wall_time * 1e6 / self.steps[activity_id] if self.steps[activity_id] else ''
+                    s = f"{SimUtils.activity_names[activity_id]: <22}, {self.calls[activity_id]: <8}, {self.steps[activity_id]: <8}, " \
+                        f"{wall_time: <22}, {wall_time * 1e6 / self.calls[activity_id]: <22}, {per_step: <22}"
+                    f.write(f"{s}\n")
+
+
+class ScenarioProfiler:
+    """
+    Context profiling the code it runs with cProfile, tracemalloc and an ActivityProfile, and storing the
+    results in log_path.
+    Check (python -m doctest Profiling.py), a short profiled run of inline activities:
+    >>> import io, tempfile, contextlib, cfg, Runner
+    >>> cfg.override_parameters({"INLINE_ACTIVITIES": True, "PROFILE": True, "SIM_TIME": 40, "NUM_OF_CUSTOMERS": 5,
+    ...                          "LOG_LEVEL": "WARNING", "RESULT_CACHE": False})
+    >>> scenario = {"name": "inline_profile", "Description": "Profiled inline activities", "random_seed": 1}
+    >>> with tempfile.TemporaryDirectory() as path, contextlib.redirect_stdout(io.StringIO()):
+    ...     summary = Runner.run_scenario("doctest", path, scenario)
+    ...     rows = open(os.path.join(path, "activity_wall_time.csv")).readlines()
+    >>> len(rows) > 1
+    True
+    """
+
+    TOP_FUNCTIONS = 40
+    TOP_ALLOCATIONS = 25
+
+    def __init__(self, log_path:str):
+        """
+        Constructor
+        """
+        self.log_path = log_path
+        self.profiler = cProfile.Profile()
+        self.activity_profile = ActivityProfile()
+
+    def __enter__(self):
+        tracemalloc.start()
+        SimUtils.activity_profile = self.activity_profile
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *args):
+        self.profiler.disable()
+        SimUtils.activity_profile = None
+        snapshot = tracemalloc.take_snapshot()
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        os.makedirs(self.log_path, exist_ok=True)
+        self.profiler.dump_stats(os.path.join(self.log_path, 'profile.prof'))
+        self._save_profile(os.path.join(self.log_path, 'profile.txt'))
+        self.activity_profile.save_to_folder(self.log_path)
+
+        with open(os.path.join(self.log_path, 'memory_profile.txt'), 'wt') as f:
+            f.write(f"Peak traced memory: {peak_memory / 1024 ** 2:.1f} MB\n\n")
+            f.write("Largest allocation sites still allocated at the end of the run:\n")
+            for statistic in snapshot.statistics('lineno')[:self.TOP_ALLOCATIONS]:
+                f.write(f"{statistic}\n")
+
+    def _instrumentation_time(self, stats:pstats.Stats) -> dict:
+        """
+        Returns the own time of the instrumentation functions, by kind of instrumentation
+        """
+        totals = dict.fromkeys(INSTRUMENTATION_FILES, 0.0)
+        for (filename, _, _), (_, _, own_time, _, _) in stats.stats.items():
+            for kind, names in INSTRUMENTATION_FILES.items():
+                if os.path.basename(filename) in names or any(f"{os.sep}{name}{os.sep}" in filename for name in names):
+                    totals[kind] += own_time
+        return totals
+
+    def _save_profile(self, path:str):
+        with open(path, 'wt') as f:
+            stats = pstats.Stats(self.profiler, stream=f)
+
+            f.write(f"Total profiled time: {stats.total_tt:.3f} s\n")
+            for kind, own_time in self._instrumentation_time(stats).items():
+                f.write(f"Time in {kind}: {own_time:.3f} s ({own_time / (stats.total_tt or 1):.0%})\n")
+            f.write("\n")
+
+            stats.sort_stats(pstats.SortKey.TIME).print_stats(self.TOP_FUNCTIONS)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.TOP_FUNCTIONS)
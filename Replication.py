@@ -0,0 +1,156 @@
+import os
+import math
+import statistics
+from concurrent.futures import wait, FIRST_COMPLETED
+import numpy as np
+import cfg
+import Runner
+
+
+def replication_seed(base_seed:int, replication:int) -> int:
+    """
+    Returns the seed of a replication, derived from the scenario's seed.
+    The first replication uses the scenario's seed itself, so it reproduces the single run of the scenario.
+    """
+    if replication == 0:
+        return base_seed
+    return int(np.random.SeedSequence(base_seed, spawn_key=(replication,)).generate_state(1)[0])
+
+
+def t_quantile(probability:float, degrees_of_freedom:int) -> float:
+    """
+    Quantile of Student's t distribution, using the Cornish-Fisher expansion around the normal quantile
+    (error below 1% from 2 degrees of freedom)
+    """
+    z = statistics.NormalDist().inv_cdf(probability)
+    g1 = (z ** 3 + z) / 4
+    g2 = (5 * z ** 5 + 16 * z ** 3 + 3 * z) / 96
+    g3 = (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / 384
+    g4 = (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / 92160
+    df = degrees_of_freedom
+    return z + g1 / df + g2 / df ** 2 + g3 / df ** 3 + g4 / df ** 4
+
+
+def confidence_interval(values:list, confidence:float) -> tuple:
+    """
+    Returns the (mean, half width) of the confidence interval of the mean of values
+    """
+    mean = statistics.mean(values)
+    if len(values) < 2:
+        return mean, math.inf
+    half_width = t_quantile((1 + confidence) / 2, len(values) - 1) * statistics.stdev(values) / math.sqrt(len(values))
+    return mean, half_width
+
+
+class ReplicatedScenario:
+    """
+    Replications of a single scenario and their aggregated statistics
+    """
+
+    def __init__(self, tc_group:str, log_path:str, scenario:dict, baseline:dict =None):
+        """
+        Constructor
+        """
+        self.tc_group = tc_group
+        self.log_path = log_path
+        self.scenario = scenario
+        self.baseline = baseline
+        self.summaries = {}             # Summary of each completed replication, by replication index
+        self.submitted = 0
+
+    def replication(self, index:int) -> tuple:
+        """
+        Returns the run_scenario() arguments of a replication
+        """
+        seed = replication_seed(self.scenario["random_seed"], index)
+        scenario = dict(self.scenario, random_seed=seed)
+        return self.tc_group, os.path.join(self.log_path, f"replication_{index}"), scenario, self.baseline
+
+    def metric_values(self, metric:str) -> list:
+        return [self.summaries[index][metric] for index in sorted(self.summaries) if metric in self.summaries[index]]
+
+    def is_precise(self, metrics:list, target:float, confidence:float) -> bool:
+        """
+        Returns True if the relative half width of the confidence interval of all metrics is below target
+        """
+        for metric in metrics:
+            values = self.metric_values(metric)
+            if not values:
+                return False
+            mean, half_width = confidence_interval(values, confidence)
+            if half_width > target * abs(mean):
+                return False
+        return True
+
+    def save_to_folder(self, confidence:float, verbose=True):
+        """
+        Stores the per replication results and their confidence intervals
+        """
+        metrics = sorted({metric for summary in self.summaries.values() for metric in summary})
+
+        with open(os.path.join(self.log_path, 'replications.csv'), 'wt') as f:
+            f.write(f"replication, seed, {', '.join(metrics)}\n")
+            for index in sorted(self.summaries):
+                values = [f"{self.summaries[index].get(metric, '')}" for metric in metrics]
+                f.write(f"{index}, {replication_seed(self.scenario['random_seed'], index)}, {', '.join(values)}\n")
+
+        with open(os.path.join(self.log_path, 'replications_summary.csv'), 'wt') as f:
+            s = f"{'metric': <36}, {'replications': <12}, {'mean': <22}, {'half_width': <22}, {'ci_low': <22}, {'ci_high': <22}"
+            f.write(f"{s}\n")
+            for metric in metrics:
+                values = self.metric_values(metric)
+                mean, half_width = confidence_interval(values, confidence)
+                s = f"{metric: <36}, {len(values): <12}, {mean: <22}, {half_width: <22}, {mean - half_width: <22}, {mean + half_width: <22}"
+                f.write(f"{s}\n")
+
+        if verbose:
+            print(f"{self.tc_group}: \"{self.scenario['name']}\" {len(self.summaries)} replications, "
+                  f"saved statistics to {self.log_path}")
+
+
+def run_replicated_test_cases(test_cases:list, workers:int =1, cfg_parameters:dict =None,
+                              min_replications:int =None, max_replications:int =None, target:float =None,
+                              metrics:list =None, confidence:float =None) -> list:
+    """
+    Runs independent replications of every test case until the relative half width of the confidence interval
+    of the chosen metrics (see QueueSizeTracker.summary()) is below target, or max_replications is reached.
+    Replications of all test cases share the pool of workers. Replications are added in batches of
+    cfg.REPLICATION_BATCH_SIZE and the stopping rule is only evaluated once a batch completed, so the number of
+    replications does not depend on the number of workers.
+    The minimum number of replications is lowered to max_replications when it is above it.
+    """
+    max_replications = max_replications or cfg.REPLICATION_MAX
+    min_replications = min(min_replications or cfg.REPLICATION_MIN, max_replications)
+    target = target or cfg.REPLICATION_TARGET_REL_HALF_WIDTH
+    metrics = metrics or cfg.REPLICATION_METRICS
+    confidence = confidence or cfg.REPLICATION_CONFIDENCE
+
+    scenarios = [ReplicatedScenario(*test_case) for test_case in test_cases]
+
+    with Runner.create_executor(workers, cfg_parameters) as executor:
+        pending = {}
+
+        def submit(replicated:ReplicatedScenario, count:int):
+            for index in range(replicated.submitted, replicated.submitted + count):
+                future = executor.submit(Runner.run_scenario, *replicated.replication(index))
+                pending[future] = (replicated, index)
+            replicated.submitted += count
+
+        for replicated in scenarios:
+            submit(replicated, min_replications)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                replicated, index = pending.pop(future)
+                replicated.summaries[index] = future.result()
+
+                if len(replicated.summaries) < replicated.submitted:
+                    continue
+
+                if replicated.submitted < max_replications and not replicated.is_precise(metrics, target, confidence):
+                    submit(replicated, min(cfg.REPLICATION_BATCH_SIZE, max_replications - replicated.submitted))
+                else:
+                    replicated.save_to_folder(confidence)
+
+    return scenarios
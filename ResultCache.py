@@ -0,0 +1,157 @@
+"""
+Content addressed cache of the scenario runs (cfg.RESULT_CACHE, disabled by --no-cache).
+A run is identified by a hash of the scenario, its resolved parameters, the cfg constants and the simulator
+source. Its output files and summary are stored in cfg.RESULT_CACHE_DIR under that hash, a later run with
+the same hash materializes them (copies, so editing the outputs never alters the cache) instead of simulating
+again. The least recently used entries are evicted when the cache grows above cfg.RESULT_CACHE_MAX_SIZE bytes,
+never while another process is copying them out.
+"""
+
+import os
+import glob
+import json
+import shutil
+import hashlib
+import contextlib
+import cfg
+import Arrivals
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None                # Not on Windows, loads and evictions must not run concurrently
+
+SUMMARY_FILE = "summary.json"
+LOCK_FILE = "cache.lock"
+
+_source_hash = None         # Hash of the simulator source, computed once per process
+
+
+def source_hash() -> str:
+    """
+    Returns the hash of the python sources of the simulator
+    """
+    global _source_hash
+
+    if _source_hash is None:
+        digest = hashlib.sha256()
+        for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.py"))):
+            digest.update(os.path.basename(path).encode())
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        _source_hash = digest.hexdigest()
+    return _source_hash
+
+
+def cfg_constants() -> dict:
+    """
+    Returns the cfg constants (upper case parameters) that may affect the results of a run
+    """
+    return {name: value for name, value in sorted(vars(cfg).items())
+            if name.isupper() and not name.startswith("RESULT_CACHE") and isinstance(value, (int, float, str, list, type(None)))}
+
+
+def scenario_key(scenario:dict, baseline:dict =None) -> str:
+    """
+    Returns the cache key of a scenario run, the baseline scenario sets its parameters before its change_time
+    """
+    content = {
+        "scenario": scenario,
+        "parameters": cfg.resolve_scenario(scenario),
+        "baseline": cfg.resolve_scenario(baseline or {}) if scenario.get("change_time", 0) else None,
+        "seed": scenario["random_seed"],
+        "cfg": cfg_constants(),
+        "source": source_hash(),
+        "arrivals": Arrivals.source_identity(scenario.get("arrivals", None)),
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+
+def _copy_files(source_dir:str, target_dir:str):
+    """
+    Copies the files of source_dir into target_dir
+    """
+    for root, _, files in os.walk(source_dir):
+        target_root = os.path.join(target_dir, os.path.relpath(root, source_dir))
+        os.makedirs(target_root, exist_ok=True)
+        for file_name in files:
+            shutil.copy2(os.path.join(root, file_name), os.path.join(target_root, file_name))
+
+
+@contextlib.contextmanager
+def _locked(exclusive:bool):
+    """
+    Context holding the cache lock, shared by the loads and exclusive to the evictions
+    """
+    os.makedirs(cfg.RESULT_CACHE_DIR, exist_ok=True)
+    with open(os.path.join(cfg.RESULT_CACHE_DIR, LOCK_FILE), 'a') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+
+
+def load(key:str, log_path:str):
+    """
+    Materializes the output files of a cached run in log_path and returns its summary, or None on a cache miss
+    """
+    entry = os.path.join(cfg.RESULT_CACHE_DIR, key)
+    summary_path = os.path.join(entry, SUMMARY_FILE)
+    with _locked(exclusive=False):
+        try:
+            with open(summary_path) as f:
+                summary = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        _copy_files(entry, log_path)
+        os.utime(summary_path)          # Most recently used
+    os.remove(os.path.join(log_path, SUMMARY_FILE))
+    return summary
+
+
+def store(key:str, log_path:str, summary:dict):
+    """
+    Adds the output files and summary of a run to the cache, then evicts the least recently used entries
+    """
+    entry = os.path.join(cfg.RESULT_CACHE_DIR, key)
+    if os.path.exists(entry):
+        return
+
+    # Parallel workers may store the same entry, it is prepared aside and renamed in place
+    temporary_entry = f"{entry}.{os.getpid()}.tmp"
+    shutil.rmtree(temporary_entry, ignore_errors=True)
+    _copy_files(log_path, temporary_entry)
+    with open(os.path.join(temporary_entry, SUMMARY_FILE), 'wt') as f:
+        json.dump(summary, f)
+
+    try:
+        os.rename(temporary_entry, entry)
+    except OSError:
+        shutil.rmtree(temporary_entry, ignore_errors=True)
+
+    evict(cfg.RESULT_CACHE_MAX_SIZE)
+
+
+def _entry_size(entry:str) -> int:
+    return sum(os.path.getsize(os.path.join(root, file_name))
+               for root, _, files in os.walk(entry) for file_name in files)
+
+
+def evict(max_size:int):
+    """
+    Removes the least recently used entries until the cache size is below max_size bytes
+    """
+    with _locked(exclusive=True):
+        entries = []
+        for entry in glob.glob(os.path.join(cfg.RESULT_CACHE_DIR, "*")):
+            try:
+                entries.append((os.path.getmtime(os.path.join(entry, SUMMARY_FILE)), _entry_size(entry), entry))
+            except OSError:
+                continue            # Entry being stored by another worker, or the lock file
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total_size <= max_size:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total_size -= size
@@ -0,0 +1,248 @@
+"""
+Simulation runs: the customer flow of the model, the run of a single scenario and the execution of test cases
+in this process or across worker processes. main.py and the other tools (Replication, Sweep, Distributed,
+Service, Benchmark, FastPath) run their scenarios through this module.
+"""
+
+import os
+import contextlib
+import multiprocessing
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+import simpy
+import logging
+import cfg
+from CallCenter import DigitalCallCenter
+from DB import DataBase
+from Customer import Customer, CustomerPool
+import Logger
+import SimUtils
+import maintenance
+import ResultCache
+import Profiling
+import Arrivals
+import Detectors
+import ArtifactStore
+
+logger = logging.getLogger(__name__)
+customer_handled = 0
+
+
+def support_flow(env, customer_id, call_center, database, customer=None):
+    """
+    Process of a customer's call, returns its outcome ("handled" or "unregistered", see Arrivals.OUTCOMES)
+    """
+    global customer_handled
+    customer = customer or Customer(env, customer_id, database)
+
+    registered = yield from SimUtils.call_activity(env, customer.is_registered())
+    if not registered:
+        SimUtils.rng.release(customer_id)
+        return "unregistered"
+
+    logger.info("id=%s enters waiting queue", customer_id)
+    #makes sure that the there is a bot available
+    with call_center.bots.request() as request:
+        yield request
+        logger.info("id=%s enters call", customer_id)
+        yield from SimUtils.call_activity(env, call_center.support(customer_id))
+        # call_center.support(customer_id)
+        logger.info("id=%s left call", customer_id)
+        customer_handled += 1
+    with call_center.updaters.request() as request:
+        yield request
+        yield from SimUtils.call_activity(env, call_center.update_incident(customer_id))
+    SimUtils.rng.release(customer_id)
+    return "handled"
+
+
+def pooled_support_flow(env, customer, call_center, database, pool):
+    outcome = yield from support_flow(env, customer.id, call_center, database, customer)
+    pool.release(customer)
+    return outcome
+
+
+def setup(env, database, num_of_customers, arrivals, pool=None, outcome_check=None):
+    """
+    Starts the calls of the (time, customer id, known outcome) arrivals (see Arrivals)
+    """
+    call_center = DigitalCallCenter(env)
+
+    for i, (arrival_time, customer_id, outcome) in enumerate(arrivals, 1):
+        yield env.timeout(arrival_time - env.now)
+        if pool is None:
+            process = env.process(support_flow(env, customer_id, call_center, database))
+        else:
+            customer = pool.acquire(customer_id)
+            if customer is not None:
+                process = env.process(pooled_support_flow(env, customer, call_center, database, pool))
+            else:
+                logger.info("id=%s blocked, %s customers in the system", customer_id, pool.live)
+                process = None
+
+        if outcome and process is not None and outcome_check is not None:
+            process.callbacks.append(lambda event, expected=outcome: outcome_check.check(expected, event))
+
+        if num_of_customers and num_of_customers <= i:
+            break
+
+
+def apply_scenario_at(env, scenario, change_time):
+    """
+    Applies the scenario's parameters at change_time, the run starts with the baseline parameters
+    """
+    yield env.timeout(change_time)
+    cfg.apply_scenario(scenario)
+    logger.info("Scenario \"%s\" degradations start", scenario["name"])
+
+
+def collect_test_cases(configurations_dir:str, start_time:str) -> list:
+    """
+    Returns the (group, log path, scenario, baseline scenario) of every scenario in the configurations folder, in
+    execution order. The baseline scenario of a group is the first of its file.
+    """
+    tc_groups = [group for group in os.listdir(configurations_dir) if group.endswith(".json")]
+    test_cases = []
+
+    test_case_index = 1
+    for tc_group in tc_groups:
+        _scenarios = cfg.load_scenarios_from_file(os.path.join(configurations_dir, tc_group))
+
+        for idx, _scenario in enumerate(_scenarios):
+            if idx == 0:
+                case_index = 1
+            else:
+                test_case_index += 1
+                case_index = test_case_index
+            _log_path = f"../Test Cases/{start_time}/{tc_group.replace(".json", "")}/TC{case_index}_{_scenario['name']}"
+            test_cases.append((tc_group, _log_path, _scenario, _scenarios[0]))
+
+    return test_cases
+
+
+def run_scenario(tc_group:str, log_path:str, scenario:dict, baseline:dict =None, env_class=simpy.Environment) -> dict:
+    """
+    Runs a single scenario, stores its results in log_path and returns its summary statistics
+    (see QueueSizeTracker.summary()).
+    All the module level state (cfg overrides, queue tracker, seeds and logging) is reset for the run, so
+    consecutive runs in the same process do not affect each other.
+    Unchanged runs are materialized from the result cache (see ResultCache) when cfg.RESULT_CACHE is set.
+    Without log_path, the run only returns its summary and writes no files.
+    With cfg.HIGH_VOLUME, customer records are pooled and the live customers bounded (see CustomerPool).
+    With cfg.DETECTORS, early warning detectors monitor the run (see Detectors). The scenario's degradations
+    start at its "change_time" (default 0), the detection latency is measured from it. Until then the run uses
+    the parameters of the group's baseline scenario (the cfg defaults without baseline).
+    With cfg.PROFILE, the simulation is profiled and the profiles are stored in log_path (see Profiling).
+    With cfg.ARTIFACT_FORMAT "store" or "both", the history of the run is stored in the artifact store (see
+    ArtifactStore), such runs bypass the result cache.
+    The simulation runs in an env_class environment, a simpy.Environment subclass can instrument its events.
+    """
+    global customer_handled
+
+    cache_key = ResultCache.scenario_key(scenario, baseline) if cfg.RESULT_CACHE and not cfg.PROFILE and \
+        cfg.ARTIFACT_FORMAT == "csv" and log_path is not None else None
+    if cache_key is not None:
+        summary = ResultCache.load(cache_key, log_path)
+        if summary is not None:
+            print(f"{tc_group}: \"{scenario['name']}\" unchanged, reused cached results in {log_path}")
+            return summary
+
+    customer_handled = 0
+    change_time = scenario.get("change_time", 0)
+    cfg.apply_scenario(scenario if not change_time else baseline or {})
+    SimUtils.queue_tracker = SimUtils.create_queue_tracker(log_path)
+    detectors = Detectors.DetectorSet(cfg.DETECTORS, change_time) if cfg.DETECTORS else None
+    if detectors is not None:
+        SimUtils.queue_tracker.add_listener(detectors)
+    _seed = scenario["random_seed"]
+
+    print(f"{tc_group}: \"{scenario['name']}\",  \"{scenario['Description']}\"")
+    print(f"Random Seed: {_seed}")
+
+    SimUtils.rng = SimUtils.create_rng(_seed)
+    _env = env_class()
+    Logger.logger_config(log_path, _seed, cfg.LOG_LEVEL, cfg.EVENT_LOG_FORMAT, cfg.LOG_IN_BACKGROUND)
+    Logger.set_sim_env(_env)
+
+    database = DataBase(_env)
+    pool = CustomerPool(_env, database, cfg.MAX_LIVE_CUSTOMERS) if cfg.HIGH_VOLUME else None
+
+    arrivals = Arrivals.create_arrivals(scenario.get("arrivals", None), cfg.CUSTOMER_INTERVAL)
+    outcome_check = Arrivals.OutcomeCheck()
+
+    _env.process(setup(_env, database, cfg.NUM_OF_CUSTOMERS, arrivals, pool, outcome_check))
+    _env.process(maintenance.maintenance_process(_env, database))
+    if change_time:
+        _env.process(apply_scenario_at(_env, scenario, change_time))
+
+    profiler = Profiling.ScenarioProfiler(log_path) if cfg.PROFILE and log_path is not None else contextlib.nullcontext()
+    with profiler:
+        _env.run(until=cfg.SIM_TIME)
+    arrivals.close()
+    Logger.logger_close()
+
+    SimUtils.queue_tracker.simulation_ended()
+    store_history = cfg.ARTIFACT_FORMAT != "csv" and SimUtils.queue_tracker.KEEPS_HISTORY
+    if log_path is not None:
+        if cfg.ARTIFACT_FORMAT != "store" or not store_history:
+            SimUtils.queue_tracker.save_to_folder(log_path)
+        if detectors is not None:
+            detectors.save_to_folder(log_path)
+
+    summary = SimUtils.queue_tracker.summary()
+    summary["customers_handled"] = customer_handled
+    if pool is not None:
+        summary.update(pool.summary())
+    summary.update(outcome_check.summary())
+    if detectors is not None:
+        summary.update(detectors.summary())
+    if store_history and log_path is not None:
+        ArtifactStore.store_run(tc_group, log_path, scenario, SimUtils.queue_tracker, summary)
+
+    if cache_key is not None:
+        ResultCache.store(cache_key, log_path, summary)
+    return summary
+
+
+class SerialExecutor(Executor):
+    """
+    Executor running the submitted calls immediately in the current process
+    """
+
+    def submit(self, fn, /, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+
+def create_executor(workers:int =1, cfg_parameters:dict =None) -> Executor:
+    """
+    Returns an executor for simulation runs, running in this process (workers=1) or in a pool of worker processes.
+    Params:
+        cfg_parameters: cfg parameters overridden in every process running simulations
+    """
+    cfg_parameters = cfg_parameters or {}
+
+    if workers == 1:
+        cfg.override_parameters(cfg_parameters)
+        return SerialExecutor()
+
+    # Forked workers inherit the loaded modules instead of importing the entry point again
+    context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=cfg.override_parameters,
+                               initargs=(cfg_parameters,))
+
+
+def run_test_cases(test_cases:list, workers:int =1, cfg_parameters:dict =None):
+    """
+    Runs all test cases, one after another or across a pool of worker processes.
+    Every scenario is seeded and configured on its own, so the results do not depend on the number of workers.
+    Params:
+        cfg_parameters: cfg parameters overridden for all the test cases
+    """
+    with create_executor(workers, cfg_parameters) as executor:
+        futures = [executor.submit(run_scenario, *test_case) for test_case in test_cases]
+        for future in futures:
+            future.result()
@@ -0,0 +1,280 @@
+"""
+Long running simulation service: keeps the model loaded in pre-forked worker processes, so short scenarios do not
+pay for the interpreter startup and the imports of every run.
+The service listens on localhost HTTP (--port) or on a Unix socket (--unix):
+    GET  /health        -> {"status": "ok", "workers": n}
+    POST /run           <- {"sim_scenarios": [...], "cfg": {...}, "output": true}
+The request uses the schema of the tc_configurations files (its first scenario is the baseline), "cfg" overrides
+cfg constants (upper case parameters) for its runs and "output": false runs the scenarios without writing files (summary only). The reply streams one JSON line per
+scenario as its run completes:
+    {"type": "result", "name": ..., "summary": {...}, "log_path": ..., "artifacts": [paths]}
+    {"type": "failed", "name": ..., "error": "..."}
+followed by {"type": "done", "completed": n, "failed": n}.
+Every worker runs one scenario at a time and owns its module level state (cfg, queue tracker, random numbers,
+logging): before each run it restores the cfg parameters the service started with, then applies the request's.
+"""
+
+import os
+import json
+import socket
+import argparse
+import threading
+import traceback
+import http.client
+import http.server
+import socketserver
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import cfg
+import Runner
+
+WARM_UP_SCENARIO = {"name": "warm_up", "Description": "Service worker warm up", "random_seed": 1}
+WARM_UP_SIM_TIME = 60
+
+_defaults = None                # cfg parameters of the worker process, restored before every run
+
+
+def _init_worker():
+    global _defaults
+    _defaults = cfg.snapshot_parameters()
+
+
+def warm_up() -> int:
+    """
+    Runs a short scenario without output, so the first request does not pay for the lazy initializations
+    """
+    cfg.override_parameters({"SIM_TIME": WARM_UP_SIM_TIME, "LOG_LEVEL": "WARNING"})
+    try:
+        Runner.run_scenario("service", None, WARM_UP_SCENARIO)
+    finally:
+        cfg.override_parameters(_defaults)
+    return os.getpid()
+
+
+def run_request(tc_group:str, log_path:str, scenario:dict, baseline:dict, parameters:dict) -> tuple:
+    """
+    Runs a scenario in a worker and returns its (summary, artifact paths)
+    """
+    cfg.override_parameters(_defaults)
+    cfg.override_parameters(parameters)
+    summary = Runner.run_scenario(tc_group, log_path, scenario, baseline)
+
+    artifacts = []
+    if log_path is not None:
+        artifacts = sorted(os.path.abspath(os.path.join(root, file_name))
+                           for root, _, files in os.walk(log_path) for file_name in files)
+    return summary, artifacts
+
+
+class SimulationService:
+    """
+    Pool of pre-forked, warmed up simulation processes running the scenarios of the requests
+    """
+
+    def __init__(self, workers:int =None, output_dir:str =None):
+        """
+        Constructor
+        """
+        self.workers = workers or cfg.SERVICE_WORKERS or os.cpu_count()
+        self.output_dir = output_dir or cfg.SERVICE_OUTPUT_DIR
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.executor = None
+        self._start_pool()
+
+    def _start_pool(self):
+        # Forked workers inherit the loaded modules, numpy and simpy are not imported again
+        context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+        self.executor = ProcessPoolExecutor(self.workers, mp_context=context, initializer=_init_worker)
+        pids = {future.result() for future in [self.executor.submit(warm_up) for _ in range(self.workers)]}
+        print(f"Started {self.workers} simulation workers ({len(pids)} warmed up)")
+
+    def _submit(self, *args):
+        with self.lock:
+            try:
+                return self.executor.submit(*args)
+            except BrokenProcessPool:
+                print("A simulation worker died, restarting the pool")
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self._start_pool()
+                return self.executor.submit(*args)
+
+    def run(self, request:dict):
+        """
+        Runs the scenarios of a request and yields their result messages as they complete
+        """
+        scenarios = request["sim_scenarios"] if "sim_scenarios" in request else [request]
+        parameters = request.get("cfg", {})
+        # Only the cfg constants, which the workers restore before every run, can be overridden
+        constants = {name for name in cfg.snapshot_parameters() if name.isupper()}
+        unknown = [name for name in parameters if name not in constants]
+        if unknown:
+            raise KeyError(f"Unknown cfg parameters {unknown}")
+
+        with self.lock:
+            self.requests += 1
+            request_dir = f"{datetime.now():%Y-%m-%d_%H-%M-%S}_{os.getpid()}_{self.requests}"
+        futures = {}
+        for index, scenario in enumerate(scenarios, 1):
+            log_path = os.path.join(self.output_dir, request_dir, f"TC{index}_{scenario['name']}") \
+                if request.get("output", True) else None
+            futures[self._submit(run_request, "service", log_path, scenario, scenarios[0], parameters)] = (scenario["name"], log_path)
+
+        completed = 0
+        for future in as_completed(futures):
+            name, log_path = futures[future]
+            try:
+                summary, artifacts = future.result()
+            except Exception as e:
+                yield {"type": "failed", "name": name, "error": "".join(traceback.format_exception_only(e)).strip()}
+                continue
+            completed += 1
+            yield {"type": "result", "name": name, "summary": summary, "log_path": log_path, "artifacts": artifacts}
+        yield {"type": "done", "completed": completed, "failed": len(futures) - completed}
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    HTTP interface of the service, replies are JSON lines
+    """
+
+    service = None
+
+    def _reply(self, status:int, messages):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        for message in messages:
+            self.wfile.write(json.dumps(message).encode() + b"\n")
+            self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._reply(200, [{"status": "ok", "workers": self.service.workers}])
+        else:
+            self._reply(404, [{"type": "error", "error": f"Unknown path '{self.path}'"}])
+
+    def do_POST(self):
+        if self.path != "/run":
+            self._reply(404, [{"type": "error", "error": f"Unknown path '{self.path}'"}])
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            messages = self.service.run(request)
+            first = next(messages)
+        except (ValueError, KeyError, TypeError) as e:
+            self._reply(400, [{"type": "error", "error": f"Invalid request: {e}"}])
+            return
+        self._reply(200, _chain(first, messages))
+
+
+def _chain(first:dict, messages):
+    yield first
+    yield from messages
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        # Unix socket clients have no address, the request handler logs the first item of the address
+        request, _ = super().get_request()
+        return request, ("unix", 0)
+
+
+def serve(service:SimulationService, host:str ="127.0.0.1", port:int =None, unix_path:str =None):
+    """
+    Serves the requests until interrupted
+    """
+    handler = type("Handler", (RequestHandler,), {"service": service})
+    if unix_path:
+        if os.path.exists(unix_path):
+            os.unlink(unix_path)
+        server = ThreadingUnixHTTPServer(unix_path, handler)
+        address = unix_path
+    else:
+        server = http.server.ThreadingHTTPServer((host, port or cfg.SERVICE_PORT), handler)
+        address = f"http://{host}:{server.server_address[1]}"
+
+    print(f"Simulation service listening on {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if unix_path and os.path.exists(unix_path):
+            os.unlink(unix_path)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """
+    HTTP connection over a Unix socket
+    """
+
+    def __init__(self, path:str, timeout:float =None):
+        """
+        Constructor
+        """
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+def submit(request:dict, host:str ="127.0.0.1", port:int =None, unix_path:str =None):
+    """
+    Sends a request to the service and yields its reply messages as they arrive
+    """
+    connection = UnixHTTPConnection(unix_path) if unix_path else http.client.HTTPConnection(host, port or cfg.SERVICE_PORT)
+    try:
+        connection.request("POST", "/run", body=json.dumps(request), headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        for line in response:
+            yield json.loads(line)
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    """
+    Runs the service, or submits a configuration file to it
+    """
+    parser = argparse.ArgumentParser(description="Warm simulation service")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve", help="Run the service")
+    serve_parser.add_argument("-j", "--workers", type=int, default=cfg.SERVICE_WORKERS,
+                              help="Simulation processes (0: one per CPU core)")
+    serve_parser.add_argument("--output", default=cfg.SERVICE_OUTPUT_DIR, help="Folder of the runs' outputs")
+    serve_parser.add_argument("--rng", choices=["streams", "crn", "legacy"], default=cfg.RNG_MODE)
+    serve_parser.add_argument("--tracking", choices=["full", "streaming", "windowed"], default=cfg.TRACKING_MODE)
+    serve_parser.add_argument("--event-log", choices=["text", "binary", "both"], default=cfg.EVENT_LOG_FORMAT)
+    serve_parser.add_argument("--no-cache", action="store_true", help="Run every scenario, even if its results are cached")
+    submit_parser = subparsers.add_parser("submit", help="Run the scenarios of a configuration file on the service")
+    submit_parser.add_argument("configuration", help="tc_configurations file")
+    submit_parser.add_argument("--no-output", action="store_true", help="Only return the summaries")
+    for _parser in (serve_parser, submit_parser):
+        _parser.add_argument("--host", default="127.0.0.1")
+        _parser.add_argument("--port", type=int, default=cfg.SERVICE_PORT)
+        _parser.add_argument("--unix", help="Unix socket path, instead of HTTP on host:port")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        cfg.override_parameters({"RNG_MODE": args.rng, "TRACKING_MODE": args.tracking,
+                                 "EVENT_LOG_FORMAT": args.event_log, "RESULT_CACHE": not args.no_cache})
+        serve(SimulationService(args.workers, args.output), args.host, args.port, args.unix)
+    else:
+        with open(args.configuration) as f:
+            _request = json.load(f)
+        _request["output"] = not args.no_output
+        for _message in submit(_request, args.host, args.port, args.unix):
+            print(json.dumps(_message))
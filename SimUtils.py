@@ -1,21 +1,223 @@
 from datetime import datetime
 import random
 import os
-import copy
+import zlib
+import math
+import bisect
+import functools
+from array import array
 from threading import Thread, Lock
 import statistics
 import cfg
+import simpy
 import numpy as np
 from math import ceil
 
 
 
-def random_std_deviation(rand_center:int ) ->float:
+def random_std_deviation(rand_center:int, stream_name:str, customer:int =None) ->float:
     """
     Returns a random number centered around a requested number
     with normal deviation of 0.1
     """
-    return max(1, np.random.normal(rand_center, ceil(rand_center * 0.1)))
+    return max(1, rng.normal(stream_name, rand_center, ceil(rand_center * 0.1), customer))
+
+
+class VariateStream:
+    """
+    Random variates of a single stream, drawn in blocks from dedicated numpy Generators.
+    Normal and uniform variates come from separate generators, so consuming one kind does not shift the other.
+    """
+
+    def __init__(self, seed_sequence:np.random.SeedSequence, block_size:int):
+        """
+        Constructor
+        """
+        normal_seed, uniform_seed = seed_sequence.spawn(2)
+        self._normal_generator = np.random.default_rng(normal_seed)
+        self._uniform_generator = np.random.default_rng(uniform_seed)
+        self.block_size = block_size
+
+        self._normals = []
+        self._normals_index = 0
+        self._uniforms = []
+        self._uniforms_index = 0
+
+    def normal(self) -> float:
+        """
+        Returns a standard normal variate, drawing a new block when the current one is consumed
+        """
+        if self._normals_index == len(self._normals):
+            self._normals = self._normal_generator.standard_normal(self.block_size).tolist()
+            self._normals_index = 0
+
+        self._normals_index += 1
+        return self._normals[self._normals_index - 1]
+
+    def random(self) -> float:
+        """
+        Returns a uniform variate in [0, 1), drawing a new block when the current one is consumed
+        """
+        if self._uniforms_index == len(self._uniforms):
+            self._uniforms = self._uniform_generator.random(self.block_size).tolist()
+            self._uniforms_index = 0
+
+        self._uniforms_index += 1
+        return self._uniforms[self._uniforms_index - 1]
+
+
+class RandomStreams:
+    """
+    Random numbers of a simulation run, every activity draws from its own stream.
+    A stream depends only on the run's seed and the stream name, so draws in one activity never
+    shift the random sequence of another one.
+    """
+
+    def __init__(self, seed:int, block_size:int =None):
+        """
+        Constructor
+        """
+        self._root_seed = np.random.SeedSequence(seed)
+        self.block_size = block_size or cfg.RNG_BLOCK_SIZE
+        self._streams = {}
+
+    def stream(self, stream_name:str) -> VariateStream:
+        """
+        Returns the stream of the given name, created on first use
+        """
+        stream = self._streams.get(stream_name, None)
+        if stream is None:
+            seed_sequence = np.random.SeedSequence(self._root_seed.entropy, spawn_key=(zlib.crc32(stream_name.encode()),))
+            stream = VariateStream(seed_sequence, self.block_size)
+            self._streams[stream_name] = stream
+        return stream
+
+    def normal(self, stream_name:str, mean:float, std_deviation:float, customer:int =None) -> float:
+        return mean + std_deviation * self.stream(stream_name).normal()
+
+    def random(self, stream_name:str, customer:int =None) -> float:
+        return self.stream(stream_name).random()
+
+    def randint(self, stream_name:str, low:int, high:int, customer:int =None) -> int:
+        """
+        Returns a random integer in [low, high]
+        """
+        return low + int(self.stream(stream_name).random() * (high - low + 1))
+
+    def release(self, customer:int):
+        pass
+
+
+_MASK_64 = (1 << 64) - 1
+
+
+def _mix64(value:int) -> int:
+    """
+    splitmix64 finalizer, maps a 64 bits integer to a well distributed 64 bits hash
+    """
+    value = (value + 0x9E3779B97F4A7C15) & _MASK_64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK_64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK_64
+    return value ^ (value >> 31)
+
+
+class CommonRandomNumbers:
+    """
+    Random numbers for common random numbers comparisons: every (stream, customer) pair has its own counter based
+    substream, the n-th variate of a customer in an activity is a hash of (seed, stream, customer, n).
+    Scenarios run with the same seed give the same variates to the same customer's activities, whatever the
+    other customers did, so the differences between scenarios are not hidden by sampling noise.
+    """
+
+    _UNIT = 2.0 ** -53
+    _STANDARD_NORMAL = statistics.NormalDist()
+
+    def __init__(self, seed:int):
+        """
+        Constructor
+        """
+        self._seed_key = _mix64(int(np.random.SeedSequence(seed).generate_state(1, np.uint64)[0]))
+        self._stream_keys = {}          # Hash of the seed and stream name, by (stream name, variate kind)
+        self._counters = {}             # Number of variates drawn by stream key, by customer
+
+    def _uniform(self, stream_name:str, kind:str, customer:int) -> float:
+        """
+        Returns the next variate of the customer's substream as a uniform number in (0, 1)
+        """
+        stream_key = self._stream_keys.get((stream_name, kind), None)
+        if stream_key is None:
+            stream_key = _mix64(self._seed_key ^ zlib.crc32(f"{stream_name}.{kind}".encode()))
+            self._stream_keys[(stream_name, kind)] = stream_key
+
+        customer = -1 if customer is None else customer
+        counters = self._counters.get(customer, None)
+        if counters is None:
+            counters = self._counters[customer] = {}
+        counter = counters.get(stream_key, 0)
+        counters[stream_key] = counter + 1
+
+        value = _mix64(_mix64(stream_key ^ (customer & _MASK_64)) ^ counter)
+        return ((value >> 11) + 0.5) * self._UNIT
+
+    def normal(self, stream_name:str, mean:float, std_deviation:float, customer:int =None) -> float:
+        return mean + std_deviation * self._STANDARD_NORMAL.inv_cdf(self._uniform(stream_name, "normal", customer))
+
+    def random(self, stream_name:str, customer:int =None) -> float:
+        return self._uniform(stream_name, "uniform", customer)
+
+    def randint(self, stream_name:str, low:int, high:int, customer:int =None) -> int:
+        """
+        Returns a random integer in [low, high]
+        """
+        return low + int(self._uniform(stream_name, "uniform", customer) * (high - low + 1))
+
+    def release(self, customer:int):
+        """
+        Forgets the counters of a customer that left the system, customer ids are never reused
+        """
+        self._counters.pop(customer, None)
+
+
+class LegacyRandom:
+    """
+    Random numbers drawn from the global `random`/`np.random` state shared by all activities,
+    reproduces the results of the simulator before the per activity streams were introduced.
+    """
+
+    def __init__(self, seed:int):
+        """
+        Constructor
+        """
+        random.seed(seed)
+        np.random.seed(seed)
+
+    def normal(self, stream_name:str, mean:float, std_deviation:float, customer:int =None) -> float:
+        return np.random.normal(mean, std_deviation)
+
+    def random(self, stream_name:str, customer:int =None) -> float:
+        return random.random()
+
+    def randint(self, stream_name:str, low:int, high:int, customer:int =None) -> int:
+        return random.randint(low, high)
+
+    def release(self, customer:int):
+        pass
+
+
+def create_rng(seed:int):
+    """
+    Returns the random numbers source of a simulation run, according to cfg.RNG_MODE
+    """
+    if cfg.RNG_MODE == "legacy":
+        return LegacyRandom(seed)
+    if cfg.RNG_MODE == "streams":
+        return RandomStreams(seed)
+    if cfg.RNG_MODE == "crn":
+        return CommonRandomNumbers(seed)
+    raise ValueError(f"Unknown RNG mode '{cfg.RNG_MODE}'")
+
+
+rng = None
 
 
 class RetryWrapper:
@@ -23,12 +225,14 @@ class RetryWrapper:
     Contains the retry construct for operations
     """
 
-    def __init__(self, failure_probability):
+    def __init__(self, failure_probability, stream_name:str, customer:int =None):
         """
         Constructor
         """
         self.execution_count = 0
         self.failure_probability = failure_probability
+        self.stream_name = stream_name
+        self.customer = customer
         self.mutex = Lock()
 
 
@@ -40,7 +244,7 @@ class RetryWrapper:
 
         with self.mutex:
             self.execution_count += 1
-            return (random.random() < self.failure_probability) or (self.execution_count == 1)
+            return (rng.random(self.stream_name, self.customer) < self.failure_probability) or (self.execution_count == 1)
 
 
     def get_try_count(self) -> int:
@@ -55,19 +259,29 @@ class RetryWrapper:
 class QueueSizeTracker:
     """
     Tracks queue occupancy at any given time. Produces an histogram.
+    The queue changes are stored as typed columns (timestamp, activity index, +1/-1), the occupancy
+    of every activity at every change is only rebuilt when saving.
     """
 
+    HISTOGRAM_CHUNK_SIZE = 65536        # Number of queue changes converted to occupancy rows at once
+    KEEPS_HISTORY = True
+
     def __init__(self):
         """
         Class constructor
         """
         self.mutex = Lock()
 
-        self.queue_changes_log = []
-        self.activities_in_queue = {}
-        self.activity_queue_history = []
+        self.activities_in_queue = [0] * len(activity_names)    # Current occupancy by activity id
+
+        self.change_times = array('d')
+        self.change_is_int_time = array('b')        # Keeps integer timestamps (customer arrivals) printed as such
+        self.change_activities = array('H')         # Activity ids, see register_activity()
+        self.change_deltas = array('b')
 
-        self.activities_runtime_history = {}        # Contains the list of execution time for each activity
+        self.activities_runtime_history = {}        # Contains the list of execution time for each activity id
+        self.resources = []                         # MonitoredResource of the run
+        self.listeners = []                         # Notified of every runtime and queue change (see add_listener)
         self._simulation_ended = False
 
     def simulation_ended(self):
@@ -77,8 +291,22 @@ class QueueSizeTracker:
         """
         with self.mutex:
             self._simulation_ended = True
+            for resource in self.resources:
+                resource.monitoring_ended()
 
-    def _activity_change(self, activity_name:str, activity_time:float, entry_exit:bool, customer_id:int =-1):
+    def register_resource(self, resource):
+        with self.mutex:
+            self.resources.append(resource)
+
+    def add_listener(self, listener):
+        """
+        Adds a listener notified as the simulation runs, through its methods
+            activity_runtime(activity_id, execution_duration, time) and queue_change(activity_id, occupancy, time)
+        """
+        with self.mutex:
+            self.listeners.append(listener)
+
+    def _activity_change(self, activity_id:int, activity_time:float, entry_exit:bool, customer_id:int =-1):
         """
         Logs an entry or exit for an activity
         Params:
@@ -90,91 +318,152 @@ class QueueSizeTracker:
             if self._simulation_ended is True:
                 return
 
-            if entry_exit:
-                ee_str = "entry"
-            else:
-                ee_str = "exit"
+            # Activities registered after the tracker was created
+            if activity_id >= len(self.activities_in_queue):
+                self.activities_in_queue.extend([0] * (activity_id + 1 - len(self.activities_in_queue)))
 
-            #Log entry/exit in the log
-            self.queue_changes_log.append(f"{activity_time}, {activity_name}, {ee_str}")
+            delta = 1 if entry_exit else -1
+            self.activities_in_queue[activity_id] += delta
+            assert(self.activities_in_queue[activity_id] >= 0)
 
-            # Handle entry into a queue
-            if entry_exit is True:
-                if activity_name not in self.activities_in_queue:
-                    self.activities_in_queue[activity_name] = 0
+            self.change_times.append(activity_time)
+            self.change_is_int_time.append(isinstance(activity_time, int))
+            self.change_activities.append(activity_id)
+            self.change_deltas.append(delta)
 
-                self.activities_in_queue[activity_name] += 1
-            # Handle exit from the queue
-            else:
-                assert(activity_name in self.activities_in_queue)
-                self.activities_in_queue[activity_name] -= 1
+            for listener in self.listeners:
+                listener.queue_change(activity_id, self.activities_in_queue[activity_id], activity_time)
 
-                assert(self.activities_in_queue[activity_name] >= 0)
-
-            # Store a snapshot of the current status for the histogram
-            activity_copy = copy.copy(self.activities_in_queue)
-            activity_copy["timestamp"] = round(activity_time, 2)
-            self.activity_queue_history.append(activity_copy)
-
-    def activity_enter(self, activity_name:str, activity_time:float, customer_id:int =-1):
+    def activity_enter(self, activity_id:int, activity_time:float, customer_id:int =-1):
         """
         More readable/verifiable way to make sure we enter activity then activity_change()
         """
-        self._activity_change(activity_name, activity_time, True, customer_id)
+        self._activity_change(activity_id, activity_time, True, customer_id)
 
-    def activity_exit(self, activity_name:str, activity_time:float, customer_id:int =-1):
+    def activity_exit(self, activity_id:int, activity_time:float, customer_id:int =-1):
         """
         More readable/verifiable way to make sure we exit activity then activity_change()
         """
-        self._activity_change(activity_name, activity_time, False, customer_id)
+        self._activity_change(activity_id, activity_time, False, customer_id)
+
+    def _change_time(self, index:int):
+        """
+        Returns the timestamp of a queue change with its original type
+        """
+        if self.change_is_int_time[index]:
+            return int(self.change_times[index])
+        return self.change_times[index]
 
-    def log_activity_run_duration(self, activity_name: str, execution_duration: int):
+    def _tracked_activities(self) -> list:
         """
-        Logs the run duration of a specific activity
+        Returns the ids of the tracked activities, in order of first entry
+        """
+        activities = np.frombuffer(self.change_activities, dtype=np.uint16)
+        ids, first_entries = np.unique(activities, return_index=True)
+        return ids[np.argsort(first_entries)].tolist()
+
+    def _occupancy_chunks(self, tracked_activities:list):
+        """
+        Yields (first change index, occupancy matrix) chunks, the matrix holds the occupancy of the tracked
+        activities (columns) after each queue change in the chunk
+        """
+        columns = np.zeros(len(self.activities_in_queue), dtype=np.intp)
+        columns[tracked_activities] = np.arange(len(tracked_activities))
+        activities = columns[np.frombuffer(self.change_activities, dtype=np.uint16)]
+        deltas = np.frombuffer(self.change_deltas, dtype=np.int8)
+        occupancy = np.zeros(len(tracked_activities), dtype=np.int64)
+
+        for first in range(0, len(deltas), self.HISTOGRAM_CHUNK_SIZE):
+            last = min(first + self.HISTOGRAM_CHUNK_SIZE, len(deltas))
+            changes = np.zeros((last - first, len(tracked_activities)), dtype=np.int64)
+            changes[np.arange(last - first), activities[first:last]] = deltas[first:last]
+            chunk = np.cumsum(changes, axis=0) + occupancy
+            occupancy = chunk[-1]
+            yield first, chunk
+
+    def log_activity_run_duration(self, activity_id: int, execution_duration: int, end_time:float =None):
+        """
+        Logs the run duration of a specific activity, which ended at end_time
         """
         with self.mutex:
-            if self.activities_runtime_history.get(activity_name, None) is None:
-                self.activities_runtime_history[activity_name] = []
+            if self._simulation_ended is True:
+                return
+
+            if self.activities_runtime_history.get(activity_id, None) is None:
+                self.activities_runtime_history[activity_id] = []
 
-            self.activities_runtime_history[activity_name].append(execution_duration)
+            self.activities_runtime_history[activity_id].append(execution_duration)
 
+            for listener in self.listeners:
+                listener.activity_runtime(activity_id, execution_duration, end_time)
+
+
+    def summary(self) -> dict:
+        """
+        Returns the summary statistics of the run as a flat dict:
+            runtime.<activity>.max/min/mean/count:  runtime duration statistics of each activity
+            queue_max.<activity>:                   maximal queue occupancy of each activity
+        """
+        with self.mutex:
+            summary = {}
+            for activity_id, runtimes in self.activities_runtime_history.items():
+                name = activity_names[activity_id]
+                summary[f"runtime.{name}.max"] = max(runtimes)
+                summary[f"runtime.{name}.min"] = min(runtimes)
+                summary[f"runtime.{name}.mean"] = statistics.mean(runtimes)
+                summary[f"runtime.{name}.count"] = len(runtimes)
+
+            tracked_activities = self._tracked_activities()
+            max_per_activity = np.zeros(len(tracked_activities), dtype=np.int64)
+            for _, chunk in self._occupancy_chunks(tracked_activities):
+                max_per_activity = np.maximum(max_per_activity, chunk.max(axis=0))
+
+            for activity_id, max_value in zip(tracked_activities, max_per_activity.tolist()):
+                summary[f"queue_max.{activity_names[activity_id]}"] = max_value
+
+            for resource in self.resources:
+                summary.update(resource.summary())
+
+        return summary
 
     def save_to_folder(self, path:str, verbose=True):
 
         with self.mutex:
             # Store queue changes log
             with open(f"{os.path.join(path, 'queue_size_tracking.log')}", 'wt') as f:
-                for line in self.queue_changes_log:
-                    f.write(f"{line}\n")
-
-            max_per_activity = copy.copy(self.activity_queue_history[len(self.activity_queue_history) - 1])
-            max_of_maxes = -1
+                for i in range(len(self.change_times)):
+                    ee_str = "entry" if self.change_deltas[i] > 0 else "exit"
+                    f.write(f"{self._change_time(i)}, {activity_names[self.change_activities[i]]}, {ee_str}\n")
 
-            # Get the most up-to-date list of all the activities
+            tracked_activities = self._tracked_activities()
+            max_per_activity = np.zeros(len(tracked_activities), dtype=np.int64)
 
             # Store histogram
             with open(f"{os.path.join(path, 'queue_size_tracking.csv')}", 'wt') as f:
-                keys = list(self.activity_queue_history[len(self.activity_queue_history) - 1].keys())
+                keys = [activity_names[activity_id] for activity_id in tracked_activities] + ["timestamp"]
 
                 # Write column names in CSV
                 for key in keys:
                     f.write(f"{key}, ")
                 f.write("\n")
 
-                # Write histogram
-                for entry in self.activity_queue_history:
-                    for key in keys:
-                        f.write(f"{entry.get(key, '')}, ")
+                # Write histogram, activities are left empty until their first entry
+                first_entries = [self.change_activities.index(activity_id) for activity_id in tracked_activities]
+                for first, chunk in self._occupancy_chunks(tracked_activities):
+                    max_per_activity = np.maximum(max_per_activity, chunk.max(axis=0))
+                    cells = chunk.astype(str)
+                    for column, first_entry in enumerate(first_entries):
+                        cells[:max(0, first_entry - first), column] = ''
 
-                        if key != "timestamp":
-                            max_per_activity[key] = max(max_per_activity[key], entry.get(key, 0))
-                            max_of_maxes = max(max_of_maxes, max_per_activity[key])
-                    f.write("\n")
+                    for i, row in enumerate(cells.tolist(), first):
+                        f.write(f"{', '.join(row)}, {round(self._change_time(i), 2)}, \n")
 
+                max_of_maxes = max(max_per_activity, default=-1)
                 if verbose:
                     print("queue size statistics:\n")
-                    for key in keys:
-                        print(f"{key}: MAX={max_per_activity[key]}")
+                    for key, max_value in zip(keys, max_per_activity):
+                        print(f"{key}: MAX={max_value}")
+                    print(f"timestamp: MAX={round(self._change_time(len(self.change_times) - 1), 2)}")
                     print(f"Max of maxes : {max_of_maxes}")
 
             # Store runtime history
@@ -192,7 +481,7 @@ class QueueSizeTracker:
 
                 for key in keys:
                     l =   self.activities_runtime_history[key]
-                    s = f"{key: <22}, {max(l): <22}, {min(l): <22}, {statistics.mean(l): <22}"
+                    s = f"{activity_names[key]: <22}, {max(l): <22}, {min(l): <22}, {statistics.mean(l): <22}"
                     f.write(f"{s}\n")
                     if verbose:
                         print(s)
@@ -200,34 +489,682 @@ class QueueSizeTracker:
                 # Store in details
                 f.write(f"\n\nExhaustive list of execution time:")
                 for key in keys:
-                    f.write(f"\n{key}, ")
+                    f.write(f"\n{activity_names[key]}, ")
                     for item in self.activities_runtime_history[key]:
                         f.write(f"{item}, ")
 
+            save_resources(self.resources, path, verbose)
             print(f"Saved statistics to {path}")
 
 
+class P2Quantile:
+    """
+    Estimates a quantile of a stream of observations in constant memory (P-square algorithm, Jain & Chlamtac 1985).
+    Five markers track the minimum, the maximum, the quantile and two intermediate quantiles; their heights are
+    adjusted with a piecewise parabolic interpolation as observations arrive.
+    """
+
+    def __init__(self, probability:float):
+        """
+        Constructor
+        """
+        self.probability = probability
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired_positions = [1, 1 + 2 * probability, 1 + 4 * probability, 3 + 2 * probability, 5]
+        self.increments = [0, probability / 2, probability, (1 + probability) / 2, 1]
+
+    def add(self, value:float):
+        heights = self.heights
+        positions = self.positions
+
+        if len(heights) < 5:
+            bisect.insort(heights, value)
+            return
+
+        if value < heights[0]:
+            heights[0] = value
+            k = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            k = 3
+        else:
+            k = bisect.bisect_right(heights, value) - 1
+
+        for i in range(k + 1, 5):
+            positions[i] += 1
+        for i in range(5):
+            self.desired_positions[i] += self.increments[i]
+
+        # Adjust the heights of the middle markers that are off their desired position
+        for i in range(1, 4):
+            d = self.desired_positions[i] - positions[i]
+            if (d >= 1 and positions[i + 1] - positions[i] > 1) or (d <= -1 and positions[i - 1] - positions[i] < -1):
+                s = 1 if d > 0 else -1
+                height = heights[i] + s / (positions[i + 1] - positions[i - 1]) * (
+                    (positions[i] - positions[i - 1] + s) * (heights[i + 1] - heights[i]) / (positions[i + 1] - positions[i]) +
+                    (positions[i + 1] - positions[i] - s) * (heights[i] - heights[i - 1]) / (positions[i] - positions[i - 1]))
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = heights[i] + s * (heights[i + s] - heights[i]) / (positions[i + s] - positions[i])
+                heights[i] = height
+                positions[i] += s
+
+    @property
+    def value(self) -> float:
+        if len(self.heights) < 5:
+            return self.heights[round(self.probability * (len(self.heights) - 1))]
+        return self.heights[2]
+
+
+class RunningStatistics:
+    """
+    Runtime statistics of an activity maintained incrementally: count, min, max, mean and variance (Welford)
+    and estimated quantiles
+    """
+
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = None
+        self.max = None
+        self.quantiles = [P2Quantile(probability) for probability in self.QUANTILES]
+
+    def add(self, value:float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+        if self.count == 1:
+            self.min = self.max = value
+        else:
+            self.min = min(self.min, value)
+            self.max = max(self.max, value)
+
+        for quantile in self.quantiles:
+            quantile.add(value)
+
+    @property
+    def std_deviation(self) -> float:
+        return math.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+
+class StreamingQueueSizeTracker:
+    """
+    Queue occupancy and activity runtime statistics maintained as the simulation runs, in constant memory per
+    activity: current and max occupancy, time weighted average occupancy and RunningStatistics of the runtimes.
+    Nothing of the history is kept, use QueueSizeTracker for the full history (cfg.TRACKING_MODE).
+    """
+
+    KEEPS_HISTORY = False
+
+    def __init__(self):
+        """
+        Class constructor
+        """
+        self.mutex = Lock()
+
+        self.activities_in_queue = {}               # Current occupancy by activity id, in order of first entry
+        self.max_in_queue = {}
+        self.occupancy_area = {}                    # Integral of the occupancy over time
+        self.last_change_time = {}
+        self.end_time = 0
+
+        self.activities_runtime = {}                # RunningStatistics by activity id
+        self.resources = []                         # MonitoredResource of the run
+        self.listeners = []                         # Notified of every runtime and queue change (see add_listener)
+        self._simulation_ended = False
+
+    def simulation_ended(self):
+        """
+        During simulation cleanup, all suspended processes finalize and exit.
+        Therefore unexpected "activity_exit" will be called and should be ignored.
+        """
+        with self.mutex:
+            self._simulation_ended = True
+            for resource in self.resources:
+                resource.monitoring_ended()
+
+    def register_resource(self, resource):
+        with self.mutex:
+            self.resources.append(resource)
+
+    def add_listener(self, listener):
+        """
+        Adds a listener notified as the simulation runs, through its methods
+            activity_runtime(activity_id, execution_duration, time) and queue_change(activity_id, occupancy, time)
+        """
+        with self.mutex:
+            self.listeners.append(listener)
+
+    def _update_occupancy(self, activity_id:int, activity_time:float, delta:int) -> int:
+        """
+        Applies a queue change to the occupancy statistics and returns the new occupancy, the mutex must be held
+        """
+        occupancy = self.activities_in_queue.get(activity_id, None)
+        if occupancy is None:
+            occupancy = self.activities_in_queue[activity_id] = 0
+            self.max_in_queue[activity_id] = 0
+            self.occupancy_area[activity_id] = 0.0
+            self.last_change_time[activity_id] = activity_time
+
+        self.occupancy_area[activity_id] += occupancy * (activity_time - self.last_change_time[activity_id])
+        self.last_change_time[activity_id] = activity_time
+        self.end_time = max(self.end_time, activity_time)
+
+        occupancy += delta
+        assert(occupancy >= 0)
+        self.activities_in_queue[activity_id] = occupancy
+        self.max_in_queue[activity_id] = max(self.max_in_queue[activity_id], occupancy)
+        return occupancy
+
+    def _activity_change(self, activity_id:int, activity_time:float, entry_exit:bool, customer_id:int =-1):
+        with self.mutex:
+            if self._simulation_ended is True:
+                return
+
+            occupancy = self._update_occupancy(activity_id, activity_time, 1 if entry_exit else -1)
+            for listener in self.listeners:
+                listener.queue_change(activity_id, occupancy, activity_time)
+
+    def activity_enter(self, activity_id:int, activity_time:float, customer_id:int =-1):
+        self._activity_change(activity_id, activity_time, True, customer_id)
+
+    def activity_exit(self, activity_id:int, activity_time:float, customer_id:int =-1):
+        self._activity_change(activity_id, activity_time, False, customer_id)
+
+    def log_activity_run_duration(self, activity_id: int, execution_duration: int, end_time:float =None):
+        """
+        Adds the run duration of a specific activity, which ended at end_time, to its statistics
+        """
+        with self.mutex:
+            if self._simulation_ended is True:
+                return
+
+            if activity_id not in self.activities_runtime:
+                self.activities_runtime[activity_id] = RunningStatistics()
+            self.activities_runtime[activity_id].add(execution_duration)
+
+            for listener in self.listeners:
+                listener.activity_runtime(activity_id, execution_duration, end_time)
+
+    def _average_occupancy(self, activity_id:int) -> float:
+        """
+        Returns the time weighted average occupancy of an activity from the start of the simulation
+        """
+        if self.end_time == 0:
+            return 0.0
+        area = self.occupancy_area[activity_id] + \
+            self.activities_in_queue[activity_id] * (self.end_time - self.last_change_time[activity_id])
+        return area / self.end_time
+
+    def summary(self) -> dict:
+        """
+        Returns the summary statistics of the run as a flat dict, QueueSizeTracker.summary() keys and:
+            runtime.<activity>.std/p50/p95/p99:     runtime duration deviation and estimated quantiles
+            queue_mean.<activity>:                  time weighted average queue occupancy of each activity
+        """
+        with self.mutex:
+            summary = {}
+            for activity_id, runtimes in self.activities_runtime.items():
+                name = activity_names[activity_id]
+                summary[f"runtime.{name}.max"] = runtimes.max
+                summary[f"runtime.{name}.min"] = runtimes.min
+                summary[f"runtime.{name}.mean"] = runtimes.mean
+                summary[f"runtime.{name}.count"] = runtimes.count
+                summary[f"runtime.{name}.std"] = runtimes.std_deviation
+                for probability, quantile in zip(runtimes.QUANTILES, runtimes.quantiles):
+                    summary[f"runtime.{name}.p{round(probability * 100)}"] = quantile.value
+
+            for activity_id, max_value in self.max_in_queue.items():
+                summary[f"queue_max.{activity_names[activity_id]}"] = max_value
+                summary[f"queue_mean.{activity_names[activity_id]}"] = self._average_occupancy(activity_id)
+
+            for resource in self.resources:
+                summary.update(resource.summary())
+
+        return summary
+
+    def save_to_folder(self, path:str, verbose=True):
+
+        with self.mutex:
+            with open(f"{os.path.join(path, 'queue_size_statistics.csv')}", 'wt') as f:
+                s = f"{'Activity': <22}, {'max': <22}, {'time_weighted_average': <22}"
+                f.write(f"{s}\n")
+                if verbose:
+                    print("queue size statistics:\n")
+                    print(s)
+
+                for activity_id, max_value in self.max_in_queue.items():
+                    s = f"{activity_names[activity_id]: <22}, {max_value: <22}, {self._average_occupancy(activity_id): <22}"
+                    f.write(f"{s}\n")
+                    if verbose:
+                        print(s)
+
+            if verbose:
+                print("\n\nActivity runtime duration statistics:")
+
+            with open(f"{os.path.join(path, 'activity_time_statistics.csv')}", 'wt') as f:
+                s = f"{'Activity': <22}, {'count': <8}, {'max': <22}, {'min': <22}, {'average': <22}, {'std': <22}, " \
+                    f"{'p50': <22}, {'p95': <22}, {'p99': <22}"
+                f.write(f"{s}\n")
+                if verbose:
+                    print(s)
+
+                for activity_id, runtimes in self.activities_runtime.items():
+                    quantiles = ", ".join(f"{quantile.value: <22}" for quantile in runtimes.quantiles)
+                    s = f"{activity_names[activity_id]: <22}, {runtimes.count: <8}, {runtimes.max: <22}, {runtimes.min: <22}, " \
+                        f"{runtimes.mean: <22}, {runtimes.std_deviation: <22}, {quantiles}"
+                    f.write(f"{s}\n")
+                    if verbose:
+                        print(s)
+
+            save_resources(self.resources, path, verbose)
+            print(f"Saved statistics to {path}")
+
+
+class WindowedQueueSizeTracker(StreamingQueueSizeTracker):
+    """
+    StreamingQueueSizeTracker statistics, plus the occupancy of every activity aggregated into fixed simulated
+    time buckets (min, max, time weighted mean, runtime count and mean per bucket) and a ring buffer of the most
+    recent queue changes. Completed buckets are appended to queue_buckets.csv as the simulation runs, so the
+    memory stays constant whatever the simulated horizon. Without a path, only the statistics are kept.
+    With window_events 0, there is no ring buffer and no queue_window.log.
+    """
+
+    FLUSH_ROWS = 4096                   # Completed bucket rows kept in memory before they are written
+
+    def __init__(self, bucket_duration:float, window_events:int, path:str =None):
+        """
+        Class constructor
+        """
+        if bucket_duration <= 0 or window_events < 0:
+            raise ValueError(f"Invalid windowed tracking parameters: bucket duration {bucket_duration}, "
+                             f"window events {window_events}")
+        super().__init__()
+        self.bucket_duration = bucket_duration
+        self.bucket_start = 0
+        self.bucket_end = bucket_duration
+        self.bucket_min = {}                        # Occupancy extremes of the current bucket by activity id
+        self.bucket_max = {}
+        self.bucket_start_area = {}                 # Occupancy integral at the start of the current bucket
+        self.bucket_runtime_count = {}
+        self.bucket_runtime_sum = {}
+
+        self.path = path
+        self.buckets_file = os.path.join(path, 'queue_buckets.csv') if path is not None else None
+        self._pending_rows = []
+        self._header_written = False
+
+        # Ring buffer of the last window_events queue changes
+        self.window_times = array('d', [0.0]) * window_events
+        self.window_activities = array('H', [0]) * window_events
+        self.window_deltas = array('b', [0]) * window_events
+        self.window_count = 0                       # Queue changes recorded since the start
+
+    def _area_at(self, activity_id:int, time:float) -> float:
+        return self.occupancy_area[activity_id] + \
+            self.activities_in_queue[activity_id] * (time - self.last_change_time[activity_id])
+
+    def _close_bucket(self, end_time:float):
+        """
+        Adds the rows of the current bucket, ending at end_time, to the pending rows
+        """
+        duration = end_time - self.bucket_start
+        for activity_id in self.activities_in_queue:
+            mean = (self._area_at(activity_id, end_time) - self.bucket_start_area.get(activity_id, 0.0)) / duration \
+                if duration else self.activities_in_queue[activity_id]
+            count = self.bucket_runtime_count.get(activity_id, 0)
+            runtime_mean = self.bucket_runtime_sum[activity_id] / count if count else ''
+            self._pending_rows.append(f"{self.bucket_start}, {end_time}, {activity_names[activity_id]}, "
+                                      f"{self.bucket_min[activity_id]}, {self.bucket_max[activity_id]}, {mean}, "
+                                      f"{count}, {runtime_mean}\n")
+        if len(self._pending_rows) >= self.FLUSH_ROWS:
+            self._flush()
+
+    def _open_bucket(self):
+        for activity_id, occupancy in self.activities_in_queue.items():
+            self.bucket_min[activity_id] = self.bucket_max[activity_id] = occupancy
+            self.bucket_start_area[activity_id] = self._area_at(activity_id, self.bucket_start)
+        self.bucket_runtime_count.clear()
+        self.bucket_runtime_sum.clear()
+
+    def _advance(self, time:float):
+        """
+        Closes the buckets ending at or before time, the mutex must be held
+        """
+        while time >= self.bucket_end:
+            self._close_bucket(self.bucket_end)
+            self.bucket_start = self.bucket_end
+            self.bucket_end += self.bucket_duration
+            self._open_bucket()
+
+    def _flush(self):
+        if self.buckets_file is not None and self._pending_rows:
+            os.makedirs(self.path, exist_ok=True)
+            with open(self.buckets_file, 'at' if self._header_written else 'wt') as f:
+                if not self._header_written:
+                    f.write("bucket_start, bucket_end, activity, min, max, mean, runtime_count, runtime_mean\n")
+                    self._header_written = True
+                f.writelines(self._pending_rows)
+        self._pending_rows.clear()
+
+    def _activity_change(self, activity_id:int, activity_time:float, entry_exit:bool, customer_id:int =-1):
+        with self.mutex:
+            if self._simulation_ended is True:
+                return
+
+            self._advance(activity_time)
+            delta = 1 if entry_exit else -1
+            occupancy = self._update_occupancy(activity_id, activity_time, delta)
+            self.bucket_min[activity_id] = min(self.bucket_min.get(activity_id, 0), occupancy)
+            self.bucket_max[activity_id] = max(self.bucket_max.get(activity_id, 0), occupancy)
+
+            if self.window_times:
+                i = self.window_count % len(self.window_times)
+                self.window_times[i] = activity_time
+                self.window_activities[i] = activity_id
+                self.window_deltas[i] = delta
+                self.window_count += 1
+
+            for listener in self.listeners:
+                listener.queue_change(activity_id, occupancy, activity_time)
+
+    def log_activity_run_duration(self, activity_id: int, execution_duration: int, end_time:float =None):
+        with self.mutex:
+            if self._simulation_ended is not True:
+                if end_time is not None:
+                    self._advance(end_time)
+                self.bucket_runtime_count[activity_id] = self.bucket_runtime_count.get(activity_id, 0) + 1
+                self.bucket_runtime_sum[activity_id] = self.bucket_runtime_sum.get(activity_id, 0) + execution_duration
+        super().log_activity_run_duration(activity_id, execution_duration, end_time)
+
+    def simulation_ended(self):
+        """
+        Closes the last, partial, bucket and writes the pending rows
+        """
+        with self.mutex:
+            if not self._simulation_ended and self.end_time > self.bucket_start:
+                self._close_bucket(self.end_time)
+            self._flush()
+        super().simulation_ended()
+
+    def save_to_folder(self, path:str, verbose=True):
+        super().save_to_folder(path, verbose)
+
+        with self.mutex:
+            if not self.window_times:
+                return
+            # Store the queue changes of the window, oldest first
+            size = len(self.window_times)
+            first = max(0, self.window_count - size)
+            with open(f"{os.path.join(path, 'queue_window.log')}", 'wt') as f:
+                for n in range(first, self.window_count):
+                    i = n % size
+                    ee_str = "entry" if self.window_deltas[i] > 0 else "exit"
+                    f.write(f"{self.window_times[i]}, {activity_names[self.window_activities[i]]}, {ee_str}\n")
+
+
+class MonitoredRequest(simpy.resources.resource.Request):
+    """
+    Resource request remembering when it was issued
+    """
+
+    def __init__(self, resource):
+        self.request_time = resource._env.now
+        super().__init__(resource)
+
+
+class MonitoredResource(simpy.Resource):
+    """
+    simpy.Resource recording the wait time of every request, the time integrals of its queue length and busy
+    slots and, when the queue tracker keeps the history, the queue length and busy slots over time.
+    The resource registers with the queue tracker of the run, which stores its statistics.
+    """
+
+    request = simpy.core.BoundClass(MonitoredRequest)
+
+    def __init__(self, env, capacity:int, name:str):
+        """
+        Constructor
+        """
+        super().__init__(env, capacity)
+        self.name = name
+        self.waits = RunningStatistics()
+        self.keep_history = queue_tracker.KEEPS_HISTORY
+
+        self.change_times = array('d')
+        self.change_queue_lengths = array('I')
+        self.change_users = array('I')
+        self.wait_history = array('d')
+
+        self.queue_area = 0.0               # Integral of the queue length over time
+        self.busy_area = 0.0                # Integral of the number of busy slots over time
+        self.max_queue_length = 0
+        self._last_state = (0, 0)
+        self._last_change_time = env.now
+        self._monitoring_ended = False
+
+        queue_tracker.register_resource(self)
+
+    def _do_put(self, event):
+        if len(self.users) < self.capacity and not self._monitoring_ended:
+            wait = self._env.now - event.request_time
+            self.waits.add(wait)
+            if self.keep_history:
+                self.wait_history.append(wait)
+        return super()._do_put(event)
+
+    def _trigger_put(self, get_event):
+        super()._trigger_put(get_event)
+        self._state_change()
+
+    def _trigger_get(self, put_event):
+        super()._trigger_get(put_event)
+        self._state_change()
+
+    def _close_interval(self, now:float):
+        queue_length, users = self._last_state
+        self.queue_area += queue_length * (now - self._last_change_time)
+        self.busy_area += users * (now - self._last_change_time)
+        self._last_change_time = now
+
+    def _state_change(self):
+        state = (len(self.queue), len(self.users))
+        if state == self._last_state or self._monitoring_ended:
+            return
+
+        now = self._env.now
+        self._close_interval(now)
+        self._last_state = state
+        self.max_queue_length = max(self.max_queue_length, state[0])
+
+        if self.keep_history:
+            self.change_times.append(now)
+            self.change_queue_lengths.append(state[0])
+            self.change_users.append(state[1])
+
+    def monitoring_ended(self):
+        """
+        Closes the time integrals at the end of the simulation, later changes (process cleanups) are ignored
+        """
+        if not self._monitoring_ended:
+            self._close_interval(self._env.now)
+            self._monitoring_ended = True
+
+    def summary(self) -> dict:
+        duration = self._last_change_time or 1
+        return {
+            f"resource.{self.name}.requests": self.waits.count,
+            f"resource.{self.name}.wait_mean": self.waits.mean,
+            f"resource.{self.name}.wait_max": self.waits.max if self.waits.count else 0.0,
+            f"resource.{self.name}.wait_p95": self.waits.quantiles[1].value if self.waits.count else 0,
+            f"resource.{self.name}.queue_mean": self.queue_area / duration,
+            f"resource.{self.name}.queue_max": self.max_queue_length,
+            f"resource.{self.name}.utilization": self.busy_area / (duration * self.capacity),
+        }
+
+    def save_to_folder(self, path:str):
+        """
+        Stores the queue length and busy slots history, and the wait time of every request
+        """
+        with open(f"{os.path.join(path, f'resource_{self.name}.csv')}", 'wt') as f:
+            f.write("timestamp, queue_length, users, \n")
+            for i in range(len(self.change_times)):
+                f.write(f"{round(self.change_times[i], 2)}, {self.change_queue_lengths[i]}, {self.change_users[i]}, \n")
+
+            f.write("\n\nExhaustive list of wait time:\n")
+            for wait in self.wait_history:
+                f.write(f"{wait}, ")
+
+
+def save_resources(resources:list, path:str, verbose=True):
+    """
+    Stores the statistics of the monitored resources of a run in resource_statistics.csv, and the history of
+    those keeping it in resource_<name>.csv
+    """
+    with open(f"{os.path.join(path, 'resource_statistics.csv')}", 'wt') as f:
+        s = f"{'Resource': <28}, {'capacity': <8}, {'requests': <8}, {'utilization': <22}, {'wait_mean': <22}, " \
+            f"{'wait_p95': <22}, {'wait_max': <22}, {'queue_mean': <22}, {'queue_max': <9}"
+        f.write(f"{s}\n")
+        if verbose:
+            print("\n\nResource statistics:")
+            print(s)
+
+        for resource in resources:
+            statistics = resource.summary()
+            values = [statistics[f"resource.{resource.name}.{key}"] for key in
+                      ("utilization", "wait_mean", "wait_p95", "wait_max", "queue_mean", "queue_max")]
+            s = f"{resource.name: <28}, {resource.capacity: <8}, {resource.waits.count: <8}, " + \
+                ", ".join(f"{value: <22}" for value in values[:-1]) + f", {values[-1]: <9}"
+            f.write(f"{s}\n")
+            if verbose:
+                print(s)
+
+            if resource.keep_history:
+                resource.save_to_folder(path)
+
+
+def create_queue_tracker(path:str =None):
+    """
+    Returns the queue tracker of a simulation run, according to cfg.TRACKING_MODE. The windowed tracker writes
+    its buckets to path as the simulation runs.
+    The high volume mode (cfg.HIGH_VOLUME) uses the streaming tracker, whose memory is constant, unless the
+    windowed tracker (also constant) is selected.
+    """
+    if cfg.TRACKING_MODE == "windowed":
+        return WindowedQueueSizeTracker(cfg.TRACKING_BUCKET_DURATION, cfg.TRACKING_WINDOW_EVENTS, path)
+    if cfg.TRACKING_MODE == "full" and not cfg.HIGH_VOLUME:
+        return QueueSizeTracker()
+    if cfg.TRACKING_MODE == "streaming" or cfg.HIGH_VOLUME:
+        return StreamingQueueSizeTracker()
+    raise ValueError(f"Unknown tracking mode '{cfg.TRACKING_MODE}'")
+
+
 queue_tracker = None
 
+activity_names = []             # Registered activity names, indexed by activity id
+_activity_ids = {}
+
+
+def register_activity(activity_name:str) -> int:
+    """
+    Interns an activity name and returns its id. Registering the same name again returns the same id.
+    """
+    activity_id = _activity_ids.get(activity_name, None)
+    if activity_id is None:
+        activity_id = len(activity_names)
+        _activity_ids[activity_name] = activity_id
+        activity_names.append(activity_name)
+    return activity_id
+
+
 class ActivityRunTimeLogger:
     """
     Logs the runtime duration of a specific activity and adds it to the queue tracker
     for logging/recording. Utilizes the "with" python statement.
     """
 
-    def __init__(self, activity_name:str, env):
-        self.activity_name = activity_name
+    def __init__(self, activity_id:int, env):
+        self.activity_id = activity_id
         self.env = env
 
     def __enter__(self):
         global queue_tracker
 
         assert(queue_tracker is not None)
+        # Activities of a finished run may be closed later by the garbage collector, they must not
+        # report to the tracker of the run in progress
+        self.queue_tracker = queue_tracker
         self.activity_start_time = self.env.now
 
     def __exit__(self, *args):
-        global queue_tracker
-        queue_tracker.log_activity_run_duration(self.activity_name, self.env.now - self.activity_start_time)
+        self.queue_tracker.log_activity_run_duration(self.activity_id, self.env.now - self.activity_start_time, self.env.now)
+
+
+activity_profile = None         # Profiling.ActivityProfile of the run, when profiling (cfg.PROFILE)
+
+
+def _model_steps(activity_id:int, generator):
+    """
+    Returns the generator of an activity's model code, timed by the activity profile when profiling
+    (activity_id None: only excluded from the time of the calling activity)
+    """
+    if activity_profile is None:
+        return generator
+    return activity_profile.timed(activity_id, generator)
+
+
+def call_activity(env, generator):
+    """
+    Runs a sub-activity of a process and returns its result, used as `result = yield from call_activity(env, ...)`.
+    By default the sub-activity runs in its own simpy.Process. With cfg.INLINE_ACTIVITIES, its generator is run
+    directly by the calling process, which saves the creation, initialization and completion events of a process.
+    """
+    if cfg.INLINE_ACTIVITIES:
+        # When profiling, the time of the sub-activity (model code and instrumentation) is not the caller's
+        return (yield from _model_steps(None, generator))
+    return (yield env.process(generator))
+
+
+def activity(func=None, resource:str =None):
+    """
+    Decorator for the activities of the simulation (generator methods of objects holding an `env`).
+    Registers the activity under its function name, tracks its entry/exit in the queue tracker and logs its
+    runtime. The exit is tracked on every return path of the activity.
+    Params:
+        resource: Name of a simpy.Resource attribute of the object, acquired before the activity starts
+                  (waiting for the resource is not part of the activity)
+    """
+    if func is None:
+        return functools.partial(activity, resource=resource)
 
+    activity_id = register_activity(func.__name__)
 
+    if resource is None:
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with ActivityRunTimeLogger(activity_id, self.env):
+                queue_tracker.activity_enter(activity_id, self.env.now)
+                result = yield from _model_steps(activity_id, func(self, *args, **kwargs))
+                queue_tracker.activity_exit(activity_id, self.env.now)
+            return result
+    else:
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with getattr(self, resource).request() as request:
+                yield request
+                with ActivityRunTimeLogger(activity_id, self.env):
+                    queue_tracker.activity_enter(activity_id, self.env.now)
+                    result = yield from _model_steps(activity_id, func(self, *args, **kwargs))
+                    queue_tracker.activity_exit(activity_id, self.env.now)
+            return result
 
+    wrapper.activity_id = activity_id
+    return wrapper
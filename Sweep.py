@@ -0,0 +1,222 @@
+"""
+Parameter sweeps over the cfg constants and the scenario parameters.
+A sweep definition (JSON) declares the values of the swept parameters, upper case names are cfg constants
+(e.g. NUM_OF_BOTS), the others are scenario keys (e.g. high_level_op_failure_probability, random_seed):
+    {
+      "name": "capacity_planning",
+      "design": "grid",                 # "grid": Cartesian product, "latin_hypercube": "samples" points
+      "samples": 100,
+      "seed": 1,                        # Seed of the latin hypercube sampling
+      "scenario": {...},                # Base scenario of every point
+      "cfg": {"SIM_TIME": 7200},        # cfg constants of every point
+      "metrics": [...],                 # Columns of the results table (default: all the summary keys, the table
+                                        # is then written at the end of the sweep)
+      "parameters": {
+        "NUM_OF_BOTS": [50, 100, 150],                          # Values
+        "NUM_OF_DB_CONNECTIONS": {"range": [20, 60, 10]},       # start, stop (inclusive), step
+        "AVG_DB_QUERY_TIME": {"min": 3, "max": 8, "num": 6}     # Evenly spaced, continuous for latin hypercube
+      }
+    }
+The points are generated lazily, run on the pool of workers without output folders, and their summary rows are
+streamed into a single results table.
+"""
+
+import os
+import math
+import json
+import argparse
+import itertools
+import numpy as np
+import cfg
+import Runner
+from concurrent.futures import wait, FIRST_COMPLETED
+
+
+BASE_SCENARIO = {"name": "sweep", "Description": "Parameter sweep point", "random_seed": 10}
+BASE_CFG = {"LOG_LEVEL": "CRITICAL", "TRACKING_MODE": "streaming"}    # Sweeps only keep the summary of the runs
+
+# cfg constants derived from others at import, recomputed when only their source is swept
+DERIVED_PARAMETERS = {
+    "NUM_OF_REMOTE_LEGACY_ARCHIVES_CONNECTIONS": ("NUM_OF_BOTS", lambda bots: int(bots / 20)),
+}
+
+
+def parameter_values(specification) -> list:
+    """
+    Returns the values of a swept parameter for a grid design
+    """
+    if isinstance(specification, list):
+        return specification
+    if "range" in specification:
+        start, stop, step = specification["range"]
+        count = int(math.floor((stop - start) / step + 1e-9)) + 1
+        return [start + i * step for i in range(count)]
+    values = np.linspace(specification["min"], specification["max"], specification["num"]).tolist()
+    if isinstance(specification["min"], int) and isinstance(specification["max"], int):
+        values = [round(value) for value in values]
+    return values
+
+
+def _sample_value(specification, position:float):
+    """
+    Returns the value of a swept parameter at a position in [0, 1) of its domain (latin hypercube design)
+    """
+    if isinstance(specification, dict) and "range" not in specification:
+        value = specification["min"] + position * (specification["max"] - specification["min"])
+        if isinstance(specification["min"], int) and isinstance(specification["max"], int):
+            value = min(round(value), specification["max"])
+        return value
+    values = parameter_values(specification)
+    return values[int(position * len(values))]
+
+
+def design_points(definition:dict):
+    """
+    Yields the {parameter: value} points of a sweep definition
+    """
+    parameters = definition["parameters"]
+    names = list(parameters)
+    design = definition.get("design", "grid")
+
+    if design == "grid":
+        for values in itertools.product(*(parameter_values(parameters[name]) for name in names)):
+            yield dict(zip(names, values))
+
+    elif design == "latin_hypercube":
+        samples = definition["samples"]
+        rng = np.random.default_rng(definition.get("seed", 0))
+        # One random permutation of the strata per parameter, a random position inside each stratum
+        positions = [((rng.permutation(samples) + rng.random(samples)) / samples).tolist() for _ in names]
+        for i in range(samples):
+            yield {name: _sample_value(parameters[name], positions[p][i]) for p, name in enumerate(names)}
+
+    else:
+        raise ValueError(f"Unknown sweep design '{design}'")
+
+
+def point_count(definition:dict) -> int:
+    if definition.get("design", "grid") == "latin_hypercube":
+        return definition["samples"]
+    return math.prod(len(parameter_values(specification)) for specification in definition["parameters"].values())
+
+
+def run_point(cfg_parameters:dict, scenario:dict) -> dict:
+    """
+    Runs a sweep point with its cfg constants, the previous values are restored afterwards so the
+    points run by a worker do not affect each other
+    """
+    cfg_parameters = dict(cfg_parameters)
+    for derived, (source, function) in DERIVED_PARAMETERS.items():
+        if source in cfg_parameters and derived not in cfg_parameters:
+            cfg_parameters[derived] = function(cfg_parameters[source])
+
+    previous = {name: getattr(cfg, name) for name in cfg_parameters if hasattr(cfg, name)}
+    try:
+        cfg.override_parameters(cfg_parameters)
+        return Runner.run_scenario(scenario["name"], None, scenario)
+    finally:
+        cfg.override_parameters(previous)
+
+
+class ResultsTable:
+    """
+    CSV table of the sweep results, rows are written in point order as the runs complete.
+    Without a metrics list, the columns are the union of the summaries' metrics: the rows are held and written
+    on close, once every summary is known.
+    """
+
+    def __init__(self, path:str, parameter_names:list, metrics:list =None):
+        """
+        Constructor
+        """
+        self._file = open(path, 'wt')
+        self.parameter_names = parameter_names
+        self.metrics = metrics
+        self._pending = {}              # Completed rows waiting for the previous points
+        self._next_index = 0
+        self._rows = []                 # Rows held until close, without a metrics list
+
+    def add(self, index:int, point:dict, summary:dict):
+        self._pending[index] = (point, summary)
+        while self._next_index in self._pending:
+            self._write(self._next_index, *self._pending.pop(self._next_index))
+            self._next_index += 1
+
+    def _write(self, index:int, point:dict, summary:dict):
+        if self.metrics is None:
+            self._rows.append((index, point, summary))
+            return
+        if index == 0:
+            self._file.write(f"{', '.join(['point'] + self.parameter_names + self.metrics)}\n")
+
+        values = [point[name] for name in self.parameter_names] + [summary.get(metric, '') for metric in self.metrics]
+        self._file.write(f"{', '.join(str(value) for value in [index] + values)}\n")
+        self._file.flush()
+
+    def close(self):
+        if self._rows:
+            self.metrics = list(dict.fromkeys(metric for _, _, summary in self._rows for metric in summary))
+            for row in self._rows:
+                self._write(*row)
+        self._file.close()
+
+
+def run_sweep(definition:dict, results_path:str, workers:int =1, cfg_parameters:dict =None) -> int:
+    """
+    Runs the points of a sweep definition on a pool of workers and writes their results table.
+    Points are submitted as workers free up, so the design is never expanded in memory.
+    Returns the number of points run.
+    """
+    scenario = dict(BASE_SCENARIO, **definition.get("scenario", {}))
+    sweep_cfg = dict(BASE_CFG, **definition.get("cfg", {}))
+    parameter_names = list(definition["parameters"])
+    table = ResultsTable(results_path, parameter_names, definition.get("metrics", None))
+    total = point_count(definition)
+
+    points = enumerate(design_points(definition))
+    pending = {}
+    completed = 0
+
+    with Runner.create_executor(workers, cfg_parameters) as executor:
+
+        def submit_next() -> bool:
+            index, point = next(points, (None, None))
+            if point is None:
+                return False
+            point_cfg = dict(sweep_cfg, **{name: value for name, value in point.items() if name.isupper()})
+            point_scenario = dict(scenario, **{name: value for name, value in point.items() if not name.isupper()})
+            pending[executor.submit(run_point, point_cfg, point_scenario)] = (index, point)
+            return True
+
+        while len(pending) < 2 * workers and submit_next():
+            pass
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, point = pending.pop(future)
+                table.add(index, point, future.result())
+                completed += 1
+                print(f"{definition.get('name', 'sweep')}: point {index} {point} ({completed}/{total} completed)")
+                submit_next()
+
+    table.close()
+    return completed
+
+
+if __name__ == '__main__':
+    """
+    Runs a sweep definition
+    """
+    parser = argparse.ArgumentParser(description="Parameter sweep over the cfg constants and the scenario parameters")
+    parser.add_argument("definition_file")
+    parser.add_argument("-o", "--output", help="Results table (default: <sweep name>_results.csv)")
+    parser.add_argument("-j", "--workers", type=int, default=1, help="Number of points to run in parallel (0: one per CPU core)")
+    args = parser.parse_args()
+
+    with open(args.definition_file) as f:
+        _definition = json.load(f)
+
+    _output = args.output or f"{_definition.get('name', 'sweep')}_results.csv"
+    run_sweep(_definition, _output, args.workers or os.cpu_count())
+    print(f"Saved sweep results to {_output}")
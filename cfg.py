@@ -1,4 +1,6 @@
+import copy
 import json
+import types
 
 ### Scenario specific parameters ###
 probability_of_high_level_failure = 0
@@ -51,6 +53,67 @@ SIM_TIME = 3600
 NUM_OF_CUSTOMERS = 1000
 CUSTOMER_INTERVAL = 5
 SEED = None
+LOG_LEVEL = "DEBUG"                     # Level of the event log, records below it are neither formatted nor written
+LOG_IN_BACKGROUND = True                # Format and write the event log in a background thread, False: in the
+                                        # simulation thread (e.g. to profile the logging with the simulation)
+PROFILE = False                         # Store cProfile, tracemalloc and activity wall time profiles of the runs
+TRACKING_MODE = "full"                  # "full": history of the queue changes and runtimes, "streaming": statistics only,
+                                        # "windowed": statistics, time buckets and the most recent queue changes
+TRACKING_BUCKET_DURATION = 60           # Windowed tracking: simulated seconds aggregated in each bucket
+TRACKING_WINDOW_EVENTS = 100000         # Windowed tracking: most recent queue changes kept in queue_window.log (0: none)
+HIGH_VOLUME = False                     # Pooled customer records, bounded live customers and streaming tracking
+MAX_LIVE_CUSTOMERS = 10000              # High volume mode: arrivals are blocked while this many customers are served
+DETECTORS = []                          # Online early warning detectors (see Detectors.py), e.g. [{"type": "cusum"}]
+COMPARE_ALPHA = 0.01                    # Compare.py: p-value below which an activity changed from its baseline
+COMPARE_QUANTILES = [0.5, 0.9, 0.99]    # Compare.py: runtime quantiles whose shift is reported
+INLINE_ACTIVITIES = False               # Run the sub-activities of a customer in its process (yield from) instead of
+                                        # a process each, fewer events per customer
+EVENT_LOG_FORMAT = "text"               # "text": eventLog_{seed}.log, "binary": eventLog_{seed}.evl (see EventLog.py), "both"
+ARTIFACT_FORMAT = "csv"                 # History of the full tracking mode, "csv": text files in the run's folder,
+                                        # "store": compressed in the artifact store (see ArtifactStore.py), "both"
+ARTIFACT_STORE_DIR = "../Artifact Store"
+
+#### Result cache parameters (see ResultCache.py) ####
+RESULT_CACHE = True                     # Reuse the results of runs whose scenario, parameters and source are unchanged
+RESULT_CACHE_DIR = "../Result Cache"
+RESULT_CACHE_MAX_SIZE = 2 * 1024 ** 3   # Bytes, least recently used runs are evicted above it
+
+#### Replication parameters ####
+REPLICATION_MIN = 3                     # Replications of each scenario before checking the confidence intervals
+REPLICATION_MAX = 30
+REPLICATION_BATCH_SIZE = 2              # Replications added at once until the target precision is reached
+REPLICATION_CONFIDENCE = 0.95
+REPLICATION_TARGET_REL_HALF_WIDTH = 0.02    # Target half width of the confidence interval, relative to the mean
+REPLICATION_METRICS = ["runtime.support.mean", "runtime.is_registered.mean"]    # See QueueSizeTracker.summary()
+
+#### Distributed execution parameters (see Distributed.py) ####
+DISTRIBUTED_PORT = 5555
+DISTRIBUTED_LEASE_TIMEOUT = 600         # Seconds, a job is served again if its worker sends no heartbeat meanwhile
+DISTRIBUTED_MAX_ATTEMPTS = 3            # Times a job is served before it is reported as failed
+DISTRIBUTED_POLL_INTERVAL = 1.0         # Seconds between job requests of idle workers
+DISTRIBUTED_SOCKET_TIMEOUT = 60
+DISTRIBUTED_MAX_CONNECTION_FAILURES = 30    # Consecutive failed connections before a worker gives up
+
+#### Simulation service parameters (see Service.py) ####
+SERVICE_PORT = 5556
+SERVICE_WORKERS = 0                     # Pre-forked simulation processes (0: one per CPU core)
+SERVICE_OUTPUT_DIR = "../Service Runs"  # Folder of the runs' outputs, one sub folder per request
+
+#### Benchmark parameters (see Benchmark.py) ####
+BENCHMARK_SCALES = [1, 4]               # SIM_TIME and NUM_OF_CUSTOMERS multipliers of the benchmarked runs
+BENCHMARK_REPEAT = 3                    # Measurements of each run, the fastest is kept
+BENCHMARK_TOLERANCE = 0.1               # Relative throughput loss or memory growth reported as a regression
+
+#### Random numbers parameters ####
+RNG_MODE = "streams"                    # "streams": numpy stream per activity, "crn": substream per customer and activity
+                                        # (common random numbers), "legacy": global random/np.random state
+RNG_BLOCK_SIZE = 8192                   # Number of variates each stream draws at once
+
+#### Fast path parameters (see FastPath.py) ####
+FAST_PATH_CUSTOMERS = 1000000           # Customers sampled for each scenario
+FAST_PATH_BATCH_SIZE = 250000           # Customers sampled at once, bounds the memory use
+FAST_PATH_MAX_WAIT_PROBABILITY = 0.01   # Above this Erlang C wait probability of a resource the estimation is not valid
+FAST_PATH_TOLERANCE = 0.05              # Relative difference of the mean runtimes accepted by the SimPy cross check
 
 
 def load_scenarios_from_file(configuration_file:str, verbose:bool = True):
@@ -72,3 +135,44 @@ def load_scenarios_from_file(configuration_file:str, verbose:bool = True):
     return scenarios
 
 
+def override_parameters(parameters:dict):
+    """
+    Overrides parameters of this module (e.g. from the command line)
+    """
+    for name, value in parameters.items():
+        if name not in globals():
+            raise KeyError(f"Unknown cfg parameter '{name}'")
+        globals()[name] = value
+
+
+def snapshot_parameters() -> dict:
+    """
+    Returns a copy of the parameters of this module, which override_parameters restores
+    """
+    return {name: copy.deepcopy(value) for name, value in globals().items()
+            if not name.startswith("_") and not callable(value) and not isinstance(value, types.ModuleType)}
+
+
+def resolve_scenario(scenario:dict) -> dict:
+    """
+    Returns the scenario specific parameters of a scenario, with defaults for the missing keys
+    """
+    path_changes = scenario.get("enable_path_changes", 0)
+    if isinstance(path_changes, int):
+        path_changes = [path_changes]
+
+    return {
+        "probability_of_high_level_failure": scenario.get("high_level_op_failure_probability", 0),
+        "probability_of_low_level_failure": scenario.get("low_level_op_failure_probability", 0),
+        "under_performance_factor": scenario.get("under_performance_factor", 1),
+        "enable_path_changes": path_changes,
+        "path_changes_factor": scenario.get("delay_change_path_factor", 1),
+        "task_over_performance_factor": scenario.get("task_over_performance_factor", 1),
+    }
+
+
+def apply_scenario(scenario:dict):
+    """
+    Overrides the scenario specific parameters of this module with the scenario's values
+    """
+    globals().update(resolve_scenario(scenario))
@@ -1,112 +1,77 @@
 import os
-import random
+import argparse
 from datetime import datetime
-import numpy as np
-import simpy
-import logging
 import cfg
-from CallCenter import DigitalCallCenter
-from DB import DataBase
-from Customer import Customer
-import Logger
-import SimUtils
-import maintenance
-
-logger = logging.getLogger(__name__)
-customer_handled = 0
-
-
-def support_flow(env, customer_id, call_center, database):
-    global customer_handled
-    customer = Customer(env, customer_id, database)
-
-    registered = yield  env.process(customer.is_registered())
-    if not registered:
-        return
-
-    logger.info(f"id={customer_id} enters waiting queue")
-    #makes sure that the there is a bot available
-    with call_center.bots.request() as request:
-        yield request
-        logger.info(f"id={customer_id} enters call")
-        yield env.process(call_center.support(customer_id))
-        # call_center.support(customer_id)
-        logger.info(f"id={customer_id} left call")
-        customer_handled += 1
-    with call_center.updaters.request() as request:
-        yield request
-        yield env.process(call_center.update_incident(customer_id))
-
-
-def setup(env, database, num_of_customers, customer_interval):
-    call_center = DigitalCallCenter(env)
-    i = 0
-
-    while True:
-        yield env.timeout(random.randint(customer_interval-1, customer_interval+1))
-        i += 1
-        env.process(support_flow(env, i, call_center, database))
-
-        if num_of_customers and num_of_customers <= i:
-            break
+import Runner
+import Replication
+import Detectors
 
 
 if __name__ == '__main__':
     """
     Entry point to the application.
     """
-    global queue_tracker
-    configurations_dir = "tc_configurations"
+    parser = argparse.ArgumentParser(description="Digital call center response time simulator")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="Number of scenarios to run in parallel (0: one per CPU core)")
+    parser.add_argument("--rng", choices=["streams", "crn", "legacy"], default=cfg.RNG_MODE,
+                        help="Random numbers source, 'crn' gives the same variates to a customer's activities in "
+                             "every scenario, 'legacy' reproduces the results of previous versions")
+    parser.add_argument("--replications", type=int, default=0,
+                        help="Run up to this number of replications of each scenario, with seeds derived from the "
+                             "scenario's seed, until the confidence intervals reach the target precision")
+    parser.add_argument("--min-replications", type=int,
+                        help=f"Replications run before checking the precision (default: {cfg.REPLICATION_MIN}, lowered "
+                             f"to --replications when it is smaller)")
+    parser.add_argument("--ci-target", type=float, default=cfg.REPLICATION_TARGET_REL_HALF_WIDTH,
+                        help="Target half width of the confidence intervals, relative to the mean")
+    parser.add_argument("--ci-metric", action="append",
+                        help=f"Metric the stopping rule applies to (default: {', '.join(cfg.REPLICATION_METRICS)})")
+    parser.add_argument("--tracking", choices=["full", "streaming", "windowed"], default=cfg.TRACKING_MODE,
+                        help="Queue statistics, 'streaming' keeps summary statistics only, in constant memory, 'windowed' "
+                             "also writes time buckets (TRACKING_BUCKET_DURATION) and the last queue changes")
+    parser.add_argument("--high-volume", action="store_true",
+                        help="Pooled customer records, bounded live customers (--max-live) and streaming tracking")
+    parser.add_argument("--max-live", type=int, default=cfg.MAX_LIVE_CUSTOMERS,
+                        help="High volume mode: arrivals are blocked while this many customers are in the system")
+    parser.add_argument("--customers", type=int, default=cfg.NUM_OF_CUSTOMERS,
+                        help="Number of arriving customers (0: until SIM_TIME)")
+    parser.add_argument("--sim-time", type=int, default=cfg.SIM_TIME, help="Simulated duration, in seconds")
+    parser.add_argument("--detect", action="store_true",
+                        help="Run the default early warning detectors (see Detectors.py) during the simulations")
+    parser.add_argument("--inline", action="store_true",
+                        help="Run the activities of a customer in its own process instead of a process each (same "
+                             "results, fewer events)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Profile the simulations (cProfile, tracemalloc, wall time of the activities)")
+    parser.add_argument("--no-cache", action="store_true", help="Run every scenario, even if its results are cached")
+    parser.add_argument("--artifacts", choices=["csv", "store", "both"], default=cfg.ARTIFACT_FORMAT,
+                        help="Format of the run histories, 'store' appends them compressed to the artifact store "
+                             "(see ArtifactStore.py)")
+    parser.add_argument("--event-log", choices=["text", "binary", "both"], default=cfg.EVENT_LOG_FORMAT,
+                        help="Format of the event log, the binary format is read with EventLog.py")
+    args = parser.parse_args()
+    if args.replications and args.min_replications is not None and args.min_replications > args.replications:
+        parser.error(f"--min-replications {args.min_replications} is above --replications {args.replications}")
 
-    tc_groups = [group for group in os.listdir(configurations_dir) if group.endswith(".json")]
+    configurations_dir = "tc_configurations"
     start_time = f'{datetime.now():%Y-%m-%d %H:%M:%S%z}'.replace(":", "-").replace(" ", "_")
 
     # Run on all scenario configurations
-    test_case_index = 1
-    for tc_group in tc_groups:
-        _scenarios = cfg.load_scenarios_from_file(os.path.join(configurations_dir, tc_group))
-
-        # Loop through all scenarios, run each individually
-        for idx, _scenario in enumerate(_scenarios):
-            SimUtils.queue_tracker = SimUtils.QueueSizeTracker()
-            if idx == 0:
-                case_index = 1
-            else:
-                test_case_index += 1
-                case_index = test_case_index
-            test_case_name = _scenario['name']
-            test_case_desc = _scenario['Description']
-            _seed = _scenario["random_seed"]
-            cfg.probability_of_high_level_failure = _scenario.get("high_level_op_failure_probability", 0)
-            cfg.probability_of_low_level_failure = _scenario.get("low_level_op_failure_probability", 0)
-            cfg.under_performance_factor = _scenario.get("under_performance_factor", 1)
-            cfg.enable_path_changes = _scenario.get("enable_path_changes", 0)
-            if isinstance(cfg.enable_path_changes, int):
-                cfg.enable_path_changes = [cfg.enable_path_changes]
-            cfg.path_changes_factor = _scenario.get("delay_change_path_factor", 1)
-            cfg.task_over_performance_factor = _scenario.get("task_over_performance_factor", 1)
-
-            _log_path = f"../Test Cases/{start_time}/{tc_group.replace(".json", "")}/TC{case_index}_{test_case_name}"
-
-            print(f"{tc_group}: \"{test_case_name}\",  \"{test_case_desc}\"")
-            print(f"Random Seed: {_seed}")
-
-            random.seed(_seed)
-            np.random.seed(_seed)
-            _env = simpy.Environment()
-            Logger.logger_config(_log_path, _seed)
-            logger.addFilter(Logger.SimTimeFilter(_env))
-
-            database = DataBase(_env)
-
-
-            _env.process(setup(_env, database, cfg.NUM_OF_CUSTOMERS, cfg.CUSTOMER_INTERVAL))
-            _env.process(maintenance.maintenance_process(_env, database))
-
-            _env.run(until=cfg.SIM_TIME)
-
-            SimUtils.queue_tracker.save_to_folder(_log_path)
-            SimUtils.queue_tracker.simulation_ended()
+    test_cases = Runner.collect_test_cases(configurations_dir, start_time)
+    cfg_parameters = {"RNG_MODE": args.rng, "EVENT_LOG_FORMAT": args.event_log, "TRACKING_MODE": args.tracking,
+                      "ARTIFACT_FORMAT": args.artifacts, "INLINE_ACTIVITIES": args.inline,
+                      "RESULT_CACHE": not args.no_cache, "PROFILE": args.profile,
+                      "HIGH_VOLUME": args.high_volume, "MAX_LIVE_CUSTOMERS": args.max_live,
+                      "NUM_OF_CUSTOMERS": args.customers, "SIM_TIME": args.sim_time}
+    if args.detect:
+        cfg_parameters["DETECTORS"] = Detectors.DEFAULT_DETECTORS
+
+    if args.replications:
+        Replication.run_replicated_test_cases(test_cases, args.workers or os.cpu_count(), cfg_parameters,
+                                              args.min_replications, args.replications, args.ci_target, args.ci_metric)
+    else:
+        Runner.run_test_cases(test_cases, args.workers or os.cpu_count(), cfg_parameters)
 
     print("*** Simulation ended ***")
-    pass
\ No newline at end of file
+    pass
@@ -1,6 +1,6 @@
 import logging
 import cfg
-from Logger import SimTimeFilter
+import SimUtils
 from SimUtils import random_std_deviation
 
 logger = logging.getLogger(__name__)
@@ -13,24 +13,22 @@ def maintenance_process(env, database) -> None:
     At a specific point in the maintenance, the process requires DB resources for a short duration.
     """
 
-    global logger
     maintenance_id = 1000000000
 
-    logger.addFilter(SimTimeFilter(env))
-
     while True:
         # Perform maintenance step A
-        yield env.timeout(random_std_deviation(cfg.MAINTENANCE_STEP_1_DURATION / cfg.task_over_performance_factor))
-        logger.info(f"id={maintenance_id} Maintenance process step 1/3")
+        yield env.timeout(random_std_deviation(cfg.MAINTENANCE_STEP_1_DURATION / cfg.task_over_performance_factor, "maintenance_step_1", maintenance_id))
+        logger.info("id=%s Maintenance process step 1/3", maintenance_id)
 
         # Perform maintenance on DB
         with database.connections.request() as request:
             yield request
-            yield env.timeout(random_std_deviation(cfg.MAINTENANCE_STEP_2_DB_DURATION))
-            logger.info(f"id={maintenance_id} Maintenance process step 2/3")
+            yield env.timeout(random_std_deviation(cfg.MAINTENANCE_STEP_2_DB_DURATION, "maintenance_step_2", maintenance_id))
+            logger.info("id=%s Maintenance process step 2/3", maintenance_id)
 
         # Perform maintenance step B
-        yield env.timeout(random_std_deviation(cfg.MAINTENANCE_STEP_3_DURATION) / cfg.task_over_performance_factor)
-        logger.info(f"id={maintenance_id} Maintenance process step 3/3")
+        yield env.timeout(random_std_deviation(cfg.MAINTENANCE_STEP_3_DURATION, "maintenance_step_3", maintenance_id) / cfg.task_over_performance_factor)
+        logger.info("id=%s Maintenance process step 3/3", maintenance_id)
 
+        SimUtils.rng.release(maintenance_id)
         maintenance_id += 1
\ No newline at end of file